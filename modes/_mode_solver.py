@@ -1,6 +1,14 @@
 import abc
+import hashlib
+import json
 import os
+import pathlib
+import struct
 import sys
+import tempfile
+import warnings
+import zipfile
+from collections.abc import Mapping
 
 import matplotlib as mpl
 import matplotlib.pylab as plt
@@ -18,6 +26,215 @@ def get_modes_jsonpath(mode_solver):
     return CONFIG.cache / f"{mode_solver.name}.json"
 
 
+def legacy_json_cached(mode_solver):
+    """
+    Whether the JSON cache written before `.npz` cache files has the modes.
+
+    JSON caches are named after `mode_solver.name`, which doesn't include the
+    boundary or what was solved, so they only hold modes solved with '0000'
+    boundaries, with mode profiles and without group indices.
+    """
+    return (
+        mode_solver._boundary == "0000"
+        and mode_solver._mode_profiles
+        and not mode_solver._group_index
+        and get_modes_jsonpath(mode_solver).exists()
+    )
+
+
+def get_modes_cachepath(mode_solver):
+    return CONFIG.cache / f"{mode_solver.cache_key}.npz"
+
+
+def write_modes_cache(cachepath, n_effs, modes, **metadata):
+    """
+    Writes the modes to a binary `.npz` cache file.
+
+    The n_effs and each mode field are stored as separate complex arrays and
+    the metadata as JSON text, so they can be read independently.  Fields
+    are memory-mapped when read back, unless `CONFIG.cache_compress` is set.
+    The data is written to a temporary file which then replaces `cachepath`,
+    so processes solving the same structure concurrently never read a
+    partially written cache file.
+
+    Args:
+        cachepath: path of the cache file
+        n_effs: effective indices of the modes
+        modes: mode fields, one array or dict of arrays (by field name) per mode
+        metadata: JSON serialisable data stored along with the modes
+    """
+    arrays = {"n_effs": np.asarray(n_effs), "metadata": np.array(json.dumps(metadata))}
+    for i, mode in enumerate(modes):
+        if isinstance(mode, dict):
+            for field_name, field in mode.items():
+                arrays[f"mode{i}_{field_name}"] = field
+        else:
+            arrays[f"mode{i}"] = mode
+
+    cachepath = pathlib.Path(cachepath)
+    cachepath.parent.mkdir(exist_ok=True, parents=True)
+    fd, tmppath = tempfile.mkstemp(
+        dir=cachepath.parent, prefix=f".{cachepath.stem}", suffix=".tmp"
+    )
+    save = np.savez_compressed if CONFIG.cache_compress else np.savez
+    try:
+        with os.fdopen(fd, "wb") as f:
+            save(f, **arrays)
+        os.replace(tmppath, cachepath)
+    except BaseException:
+        os.remove(tmppath)
+        raise
+
+
+def _load_member(f, info):
+    """
+    Returns the array of the `.npz` member `info` of the open file `f`.
+
+    Arrays stored uncompressed are memory-mapped in place, so their data is
+    only read from disk when (and where) it's accessed.
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        with zipfile.ZipFile(f).open(info) as member:
+            return np.lib.format.read_array(member)
+
+    # skip the zip local file header, its file name and extra field
+    f.seek(info.header_offset + 26)
+    name_length, extra_length = struct.unpack("<HH", f.read(4))
+    f.seek(name_length + extra_length, os.SEEK_CUR)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    return np.memmap(
+        f,
+        dtype=dtype,
+        mode="r",
+        offset=f.tell(),
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+class CachedMode(Mapping):
+    """
+    Fields of a cached mode, by field name.
+
+    Each field is read (memory-mapped) from the cache file on first access,
+    so the modes of a cache hit cost nothing until their fields are used.
+    The file is held open, so the fields still come from the file that was
+    read after it's pruned from the cache or replaced by a new solve.
+    """
+
+    def __init__(self, f, infos):
+        self._file = f
+        self._infos = infos
+        self._fields = {}
+
+    def __getitem__(self, field_name):
+        if field_name not in self._fields:
+            self._fields[field_name] = _load_member(self._file, self._infos[field_name])
+        return self._fields[field_name]
+
+    def __iter__(self):
+        return iter(self._infos)
+
+    def __len__(self):
+        return len(self._infos)
+
+    @property
+    def fields(self):
+        return self
+
+
+def read_modes_cache(cachepath):
+    """
+    Reads the modes written by `write_modes_cache`.
+
+    Only the n_effs and metadata are read.  The modes are :class:`CachedMode`
+    objects (or memory-mapped arrays for single field modes), which don't
+    read any field data until it's accessed.  Caches of n_effs only have no
+    modes.
+
+    Returns:
+        n_effs (np.array), modes (list), metadata (dict)
+    """
+    f = open(cachepath, "rb")
+    try:
+        with np.load(f) as data:
+            n_effs = data["n_effs"]
+            metadata = json.loads(str(data["metadata"]))
+        infos = [{} for _ in n_effs]
+        for info in zipfile.ZipFile(f).infolist():
+            key = info.filename[: -len(".npy")]
+            if key.startswith("mode"):
+                i, _, field_name = key[len("mode") :].partition("_")
+                infos[int(i)][field_name] = info
+
+        modes = [
+            _load_member(f, i[""]) if "" in i else CachedMode(f, i) for i in infos if i
+        ]
+    except BaseException:
+        f.close()
+        raise
+    if not any(isinstance(mode, CachedMode) for mode in modes):
+        # memory-maps keep their own handle on the file
+        f.close()
+    return n_effs, modes, metadata
+
+
+def read_cached_modes(mode_solver):
+    """
+    Reads the cached modes of `mode_solver`, from its `.npz` cache file or
+    else its legacy JSON cache.
+
+    Returns:
+        path read, n_effs (np.array), modes (list), metadata (dict), or
+        `None` if the modes aren't cached or another process pruned them
+        before they could be read.
+    """
+    cachepath = get_modes_cachepath(mode_solver)
+    try:
+        if cachepath.exists():
+            return (cachepath,) + read_modes_cache(cachepath)
+        if legacy_json_cached(mode_solver):
+            jsonpath = get_modes_jsonpath(mode_solver)
+            return (jsonpath,) + read_modes_json(jsonpath)
+    except FileNotFoundError:  # pruned by another process
+        pass
+    return None
+
+
+def tol_reached(tol_cached, tol):
+    """
+    Whether modes solved to the tolerance `tol_cached` are accurate to `tol`.
+
+    A tolerance of 0 is machine precision.  Caches written before the
+    tolerance was stored (`tol_cached` None) were all solved to 0.001.
+    """
+    if tol_cached is None:
+        tol_cached = 0.001
+    return tol_cached == 0 or 0 < tol_cached <= tol
+
+
+def read_modes_json(jsonpath):
+    """
+    Reads a JSON modes cache file, the format used before `.npz` cache files.
+
+    Returns:
+        n_effs (np.array), modes (list), metadata (dict)
+    """
+    d = json.loads(open(jsonpath).read())
+    n_effs = np.array(d.pop("n_effs_real")) + 1j * np.array(d.pop("n_effs_imag"))
+    modes = []
+    for mr, mi in zip(d.pop("modes_real"), d.pop("modes_imag")):
+        if isinstance(mr, dict):
+            modes.append({k: np.array(mr[k]) + 1j * np.array(mi[k]) for k in mr})
+        else:
+            modes.append(np.array(mr) + 1j * np.array(mi))
+    return n_effs, modes, d
+
+
 class _ModeSolver(with_metaclass(abc.ABCMeta)):
     def __init__(
         self,
@@ -38,6 +255,7 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
         self._n_eff_guess = n_eff_guess
 
         self.n_effs = None
+        self.n_gs = None
         self.modes = None
         self.mode_types = None
         self.overlaps = None
@@ -48,9 +266,51 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
 
         self._path = os.path.dirname(sys.modules[__name__].__file__) + "/"
 
+    @property
+    def cache_key(self):
+        """
+        str: A hash of everything the modes depend on: the discretised
+        structure, the wavelength and the solver settings.  Structures
+        built in different ways but discretised identically share a key.
+        The tolerance is not part of the key, it is stored with the modes
+        so that they can be refined to a tighter tolerance in place.
+        """
+        h = hashlib.sha1()
+        settings = dict(self._cache_key_settings(), wavelength=self.wg._wl)
+        h.update(json.dumps(settings, sort_keys=True).encode())
+        arrays = [self.wg.x, self.wg.y, self.wg.n, self.wg.eps_c]
+        if self._group_index:
+            # the group indices also depend on the dispersion of the materials
+            arrays.append(self.wg.deps_c_dwl)
+        while arrays:
+            a = arrays.pop(0)
+            if isinstance(a, tuple):
+                # subpixel averaged and anisotropic permittivities
+                arrays[:0] = a
+                continue
+            a = np.ascontiguousarray(a)
+            h.update(f"{a.dtype}{a.shape}".encode())
+            h.update(a.tobytes())
+        return h.hexdigest()
+
+    def _cache_key_settings(self):
+        settings = dict(
+            solver=type(self).__name__, n_eigs=self._n_eigs, boundary=self._boundary,
+        )
+        if "P" in self._boundary:
+            settings.update(
+                pml_thickness=self._pml_thickness, pml_strength=self._pml_strength
+            )
+        if not self._mode_profiles:
+            # n_effs only, without any mode fields
+            settings.update(mode_profiles=False)
+        if self._group_index:
+            settings.update(group_index=True)
+        return settings
+
     @property
     def _modes_directory(self):
-        return CONFIG.cache
+        return CONFIG.cache_dir()
 
     def solve_sweep_waveguide(
         self,
@@ -203,43 +463,46 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
 
         return n_effs
 
-    def solve_ng(self, structure, wavelength_step=0.01, filename="ng.dat"):
+    def solve_ng(self, structure=None, wavelength_step=None, filename="ng.dat"):
         r"""
         Solve for the group index, :math:`n_g`, of a structure at a particular
         wavelength.
 
+        The group indices are the derivatives of the propagation constants
+        with respect to the wavenumber, found along with the modes of a
+        single solve (see `_mode_solver_lib.group_indices`), including the
+        dispersion of the materials.
+
         Args:
             structure (Structure): The target structure to solve
-                for modes.
-            wavelength_step (float): The step to take below and
-                above the nominal wavelength.  This is used for
-                approximating the gradient of :math:`n_\mathrm{eff}`
-                at the nominal wavelength.  Default is 0.01.
+                for modes.  Default is `wg`.
+            wavelength_step (float): Deprecated and ignored, the group
+                indices are no longer found by finite differences.
             filename (str): The nominal filename to use when saving the
-                effective indices.  Defaults to 'ng.dat'.
+                group indices, in the modes directory.  Defaults to
+                'ng.dat', `None` doesn't save them.
 
         Returns:
             list: A list of the group indices found for each mode.
         """
-        wl_nom = structure._wl
-
-        self.solve(structure)
-        n_ctrs = self.n_effs
-
-        structure.change_wavelength(wl_nom - wavelength_step)
-        self.solve(structure)
-        n_bcks = self.n_effs
-
-        structure.change_wavelength(wl_nom + wavelength_step)
-        self.solve(structure)
-        n_frws = self.n_effs
-
-        n_gs = []
-        for n_ctr, n_bck, n_frw in zip(n_ctrs, n_bcks, n_frws):
-            n_gs.append(n_ctr - wl_nom * (n_frw - n_bck) / (2 * wavelength_step))
+        if structure is not None:
+            self.wg = structure
+        if wavelength_step is not None:
+            warnings.warn(
+                "solve_ng: wavelength_step is deprecated and ignored",
+                DeprecationWarning,
+                stacklevel=2,
+            )
+        group_index = self._group_index
+        self._group_index = True
+        try:
+            self.solve()
+        finally:
+            self._group_index = group_index
+        n_gs = list(self.n_gs)
 
         if filename:
-            with open(self._modes_directory + filename, "w") as fs:
+            with open(self._modes_directory / filename, "w") as fs:
                 fs.write("# Mode idx, Group index\n")
                 for idx, n_g in enumerate(n_gs):
                     fs.write("%i,%.3f\n" % (idx, np.round(n_g.real, 3)))
@@ -275,6 +538,7 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
     def _plot_n_effs(
         self, filename_n_effs, filename_te_fractions, xlabel, ylabel, title
     ):
+        data = np.loadtxt(filename_n_effs, delimiter=",", ndmin=2).T
         args = {
             "titl": title,
             "xlab": xlabel,
@@ -282,14 +546,13 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
             "filename_data": filename_n_effs,
             "filename_frac_te": filename_te_fractions,
             "filename_image": None,
-            "num_modes": len(self.modes),
+            "num_modes": len(data) - 1,
         }
 
         filename_image_prefix, _ = os.path.splitext(filename_n_effs)
         filename_image = filename_image_prefix + ".png"
         args["filename_image"] = filename_image
 
-        data = np.loadtxt(args["filename_data"], delimiter=",").T
         plt.clf()
         plt.title(title)
         plt.xlabel(args["xlab"])
@@ -301,8 +564,9 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
         return args
 
     def _plot_fraction(self, filename_fraction, xlabel, ylabel, title, mode_list=[]):
+        data = np.loadtxt(filename_fraction, delimiter=",", ndmin=2).T
         if not mode_list:
-            mode_list = range(len(self.modes))
+            mode_list = range(len(data) - 1)
         gp_mode_list = " ".join(str(idx) for idx in mode_list)
 
         args = {
@@ -318,12 +582,11 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
         filename_image = filename_image_prefix + ".png"
         args["filename_image"] = filename_image
 
-        data = np.loadtxt(args["filename_data"], delimiter=",").T
         plt.clf()
         plt.title(title)
         plt.xlabel(args["xlab"])
         plt.ylabel(args["ylab"])
-        for i, _ in enumerate(self.modes):
+        for i in range(len(data) - 1):
             plt.plot(data[0], data[i + 1], "-o")
         plt.savefig(args["filename_image"])
 
@@ -393,12 +656,13 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
         vmax = 0 if logscale else None
         vmin = -20 if logscale else None
 
-        plt.imshow(
-            np.flipud(heatmap),
-            extent=(args["x_min"], args["x_max"], args["y_min"], args["y_max"],),
-            aspect="auto",
-            vmin=vmin,
-            vmax=vmax,
+        # fields in the cells or on the nodes of a possibly graded grid
+        if heatmap.shape == (self.wg.yc.size, self.wg.xc.size):
+            x, y = self.wg.xc, self.wg.yc
+        else:
+            x, y = self.wg.x, self.wg.y
+        plt.pcolormesh(
+            x, y, np.flipud(heatmap), shading="nearest", vmin=vmin, vmax=vmax
         )
         plt.colorbar()
         plt.savefig(filename_image)
@@ -407,3 +671,40 @@ class _ModeSolver(with_metaclass(abc.ABCMeta)):
 
     if __name__ == "__main__":
         pass
+
+
+def test_modes_cache(tmp_path):
+    rng = np.random.RandomState(0)
+    n_effs = np.array([2.4 + 1e-6j, 1.8])
+    modes = [{"Ex": rng.rand(3, 4) + 1j * rng.rand(3, 4)} for _ in n_effs]
+
+    write_modes_cache(tmp_path / "modes.npz", n_effs, modes, fraction_te=[99.0, 1.0])
+    n_effs_cache, modes_cache, d = read_modes_cache(tmp_path / "modes.npz")
+    assert np.array_equal(n_effs_cache, n_effs)
+    assert np.array_equal(modes_cache[1]["Ex"], modes[1]["Ex"])
+    assert isinstance(modes_cache[1]["Ex"], np.memmap)
+    assert d == {"fraction_te": [99.0, 1.0]}
+
+    # the modes read stay tied to that file when it's replaced or pruned
+    _, modes_cache, _ = read_modes_cache(tmp_path / "modes.npz")
+    write_modes_cache(tmp_path / "modes.npz", n_effs, [{"Ex": 0 * modes[0]["Ex"]}])
+    assert np.array_equal(modes_cache[1]["Ex"], modes[1]["Ex"])
+    (tmp_path / "modes.npz").unlink()
+    assert np.array_equal(modes_cache[0]["Ex"], modes[0]["Ex"])
+
+    write_modes_cache(tmp_path / "modes.npz", n_effs, [m["Ex"] for m in modes])
+    _, modes_cache, _ = read_modes_cache(tmp_path / "modes.npz")
+    assert np.array_equal(modes_cache[0], modes[0]["Ex"])
+
+    d = dict(
+        n_effs_real=n_effs.real.tolist(),
+        n_effs_imag=n_effs.imag.tolist(),
+        modes_real=[{k: v.real.tolist() for k, v in m.items()} for m in modes],
+        modes_imag=[{k: v.imag.tolist() for k, v in m.items()} for m in modes],
+        fraction_te=[99.0, 1.0],
+    )
+    (tmp_path / "modes.json").write_text(json.dumps(d))
+    n_effs_json, modes_json, d = read_modes_json(tmp_path / "modes.json")
+    assert np.array_equal(n_effs_json, n_effs)
+    assert np.array_equal(modes_json[1]["Ex"], modes[1]["Ex"])
+    assert d == {"fraction_te": [99.0, 1.0]}
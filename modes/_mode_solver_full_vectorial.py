@@ -6,6 +6,60 @@ import numpy as np
 from modes import _mode_solver_lib as ms
 from modes._mode_solver import _ModeSolver
 
+# sign of each field component, as labelled by `ms.FDMode`, when it is
+# mirrored across the symmetry plane of a half domain solved with a
+# symmetric ('S') boundary.  An antisymmetric ('A') boundary flips them all.
+_MIRROR_SIGNS = {"Ex": 1, "Ey": -1, "Ez": -1, "Hx": -1, "Hy": 1, "Hz": 1}
+
+
+class _MirrorHalf:
+    """
+    The left half of a structure that is mirror symmetric about its grid
+    line ``x[centre]``: the grid and permittivity read by the solver.
+    """
+
+    def __init__(self, structure, centre):
+        self._structure = structure
+        self._centre = centre
+        self.x = structure.x[: centre + 1]
+        self.y = structure.y
+        self.n = structure.n[:, : centre + 1]
+        self.eps_c = self._half(structure.eps_c)
+
+    @property
+    def deps_c_dwl(self):
+        return self._half(self._structure.deps_c_dwl)
+
+    def _half(self, eps_c):
+        if isinstance(eps_c, tuple):
+            return tuple(e[:, : self._centre] for e in eps_c)
+        return eps_c[:, : self._centre]
+
+
+def _mirror_centre(structure):
+    """
+    Returns the index of the grid line about which `structure` is mirror
+    symmetric (left/right), or `None` if it is not.  Only the grid and the
+    permittivity seen by the solver are compared.
+    """
+    x = structure.x
+    if x.size < 3 or x.size % 2 == 0:
+        return None
+    centre = x.size // 2
+    if not np.allclose(x + x[::-1], 2 * x[centre], rtol=0, atol=1e-9 * (x[1] - x[0])):
+        return None
+
+    eps_c = structure.eps_c
+    if isinstance(eps_c, tuple):
+        # the off-diagonal components change sign under the mirror
+        components = zip(eps_c, (1, -1, -1, 1, 1))
+    else:
+        components = [(eps_c, 1)]
+    for eps, sign in components:
+        if not np.allclose(eps, sign * eps[:, ::-1], rtol=1e-9, atol=0):
+            return None
+    return centre
+
 
 class ModeSolverFullyVectorial(_ModeSolver):
     """
@@ -19,12 +73,39 @@ class ModeSolverFullyVectorial(_ModeSolver):
         boundary (str): The boundary conditions to use.
             This is a string that identifies the type of boundary conditions applied.
             The following options are available: 'A' - Hx is antisymmetric, Hy is symmetric,
-            'S' - Hx is symmetric and, Hy is antisymmetric, and '0' - Hx and Hy are zero
-            immediately outside of the boundary.
+            'S' - Hx is symmetric and, Hy is antisymmetric, '0' - Hx and Hy are zero
+            immediately outside of the boundary, and 'P' - a perfectly matched layer
+            absorbs the field within `pml_thickness` of the boundary.
             The string identifies all four boundary conditions, in the order:
             North, south, east, west. For example, boundary='000A'. Default is '0000'.
+            North and south are the right and left of the structure, east
+            and west its top and bottom.
         initial_mode_guess (list): An initial mode guess for the modesolver.
         initial_n_eff_guess (list): An initial effective index guess for the modesolver.
+        mode_profiles (bool): `True` if the mode profiles should be found, `False`
+            if only the effective indices should be found.  Without mode profiles
+            the fields are not computed, and neither are the mode types and
+            TE/TM fractions.  Default is `True`.
+        shift_invert (bool): `True` to always solve in shift-invert mode around
+            `n_eff_guess` (or the maximum refractive index of the structure if
+            no guess is given), reusing the sparse LU factorization.  The time
+            spent factorizing and iterating is reported in `factorization_time`
+            and `iteration_time`.  Default is `False`.
+        mirror_symmetry (bool): `True` to look for a left/right mirror
+            symmetry of the structure (same grid and permittivity on both
+            sides of the centre grid line, and the same north and south
+            boundaries).  A symmetric structure is solved on its left half
+            only, once with a symmetric and once with an antisymmetric
+            boundary on the mirror plane, and the modes are unfolded onto
+            the full grid.  Default is `False`.
+        pml_thickness (float): thickness of the 'P' boundaries (um).
+            Default is 0.5.
+        pml_strength (float): imaginary part of the coordinate stretching
+            at the outer edge of the 'P' boundaries, which grows
+            quadratically through the layer.  Default is 5.
+        group_index (bool): `True` to also find the group indices of the
+            modes, `n_gs`, from the same (shift-invert) solve, see
+            `modes._mode_solver_lib.group_indices`.  Default is `False`.
     """
 
     def __init__(
@@ -36,13 +117,28 @@ class ModeSolverFullyVectorial(_ModeSolver):
         n_eff_guess=None,
         name=None,
         wg=None,
+        mode_profiles=True,
+        shift_invert=False,
+        mirror_symmetry=False,
+        pml_thickness=0.5,
+        pml_strength=5.0,
+        group_index=False,
     ):
         self.n_effs_te = None
         self.n_effs_tm = None
+        self.fraction_te = None
+        self.fraction_tm = None
         self.name = name
         self.wg = wg
+        self._shift_invert = shift_invert
+        self._mirror_symmetry = mirror_symmetry
+        self._pml_thickness = pml_thickness
+        self._pml_strength = pml_strength
+        self._group_index = group_index
+        self.factorization_time = None
+        self.iteration_time = None
         _ModeSolver.__init__(
-            self, n_eigs, tol, boundary, False, initial_mode_guess, n_eff_guess
+            self, n_eigs, tol, boundary, mode_profiles, initial_mode_guess, n_eff_guess
         )
 
     def solve(self):
@@ -55,30 +151,158 @@ class ModeSolverFullyVectorial(_ModeSolver):
             return arrays of the mode profiles.
         """
         structure = self._structure = self.wg
-        wavelength = self.wg._wl
-        self._ms = ms._ModeSolverVectorial(wavelength, structure, self._boundary)
-        self._ms.solve(
-            self._n_eigs,
-            self._tol,
-            self._n_eff_guess,
-            initial_mode_guess=self._initial_mode_guess,
-        )
-        self.n_effs = self._ms.neff
+        centre = None
+        if self._mirror_symmetry and self._boundary[0] == self._boundary[1]:
+            centre = _mirror_centre(structure)
+
+        if centre is None:
+            self._ms = self._solve_domain(
+                structure, self._boundary, self._initial_mode_guess
+            )
+            self.n_effs = self._ms.neff
+            self.n_gs = self._ms.ng
+            self.modes = self._ms.modes
+            self.factorization_time = self._ms.factorization_time
+            self.iteration_time = self._ms.iteration_time
+        else:
+            self.n_effs, self.n_gs, self.modes = self._solve_mirror_halves(centre)
+
+        self._initial_mode_guess = None
 
         r = {"n_effs": self.n_effs}
-        r["modes"] = self.modes = self._ms.modes
+        if self._group_index:
+            r["n_gs"] = self.n_gs
+        if not self._mode_profiles:
+            return r
+
+        r["modes"] = self.modes
 
         self.overlaps, self.fraction_te, self.fraction_tm = self._get_overlaps(
             self.modes
         )
         self.mode_types = self._get_mode_types()
 
-        self._initial_mode_guess = None
-
-        self.n_effs_te, self.n_effs_tm = self._sort_neffs(self._ms.neff)
+        self.n_effs_te, self.n_effs_tm = self._sort_neffs(self.n_effs)
 
         return r
 
+    def _solve_domain(self, structure, boundary, initial_mode_guess=None):
+        solver = ms._ModeSolverVectorial(
+            self.wg._wl,
+            structure,
+            boundary,
+            pml_thickness=self._pml_thickness,
+            pml_strength=self._pml_strength,
+        )
+        solver.solve(
+            self._n_eigs,
+            self._tol,
+            self._n_eff_guess,
+            mode_profiles=self._mode_profiles,
+            initial_mode_guess=initial_mode_guess,
+            # the left eigenvectors of the group indices reuse the factorization
+            shift_invert=self._shift_invert or self._group_index,
+            group_index=self._group_index,
+        )
+        return solver
+
+    def _solve_mirror_halves(self, centre):
+        """
+        Solves the left half of a structure mirror symmetric about its grid
+        line ``x[centre]``, with a symmetric and an antisymmetric boundary on
+        the mirror plane (the solver's north boundary), and unfolds the
+        modes of both onto the full grid.
+
+        Returns:
+            tuple: the `n_eigs` highest effective indices, sorted in
+            decreasing order, their group indices (`None` unless
+            `group_index`) and their modes (none without mode profiles).
+        """
+        wg = self.wg
+        half = _MirrorHalf(wg, centre)
+        guess = self._initial_mode_guess
+        if guess is not None:
+            # [Hx, Hy] start vectors on the transposed grid of the solver
+            guess = np.reshape(guess, (2, wg.y.size, wg.x.size, -1))
+            # the solver's Hx is the structure's Hy, even in the 'S' half
+            reflected = guess[:, :, ::-1] * np.reshape([1, -1], (2, 1, 1, 1))
+
+        self.factorization_time = self.iteration_time = 0.0
+        n_effs = []
+        n_gs = []
+        modes = []
+        for mirror in "SA":
+            boundary = mirror + self._boundary[1:]
+            half_guess = None
+            if guess is not None:
+                # only the start vectors with the parity of this half
+                sign = 1 if mirror == "S" else -1
+                projected = (guess + sign * reflected) / 2
+                power = np.sum(np.abs(projected) ** 2, axis=(0, 1, 2))
+                keep = power > np.sum(np.abs(guess) ** 2, axis=(0, 1, 2)) / 2
+                if keep.any():
+                    half_guess = projected[:, :, : centre + 1, keep]
+                    half_guess = half_guess.reshape(-1, keep.sum())
+            solver = self._solve_domain(half, boundary, half_guess)
+            self.factorization_time += solver.factorization_time
+            self.iteration_time += solver.iteration_time
+
+            signs = {
+                name: sign if mirror == "S" else -sign
+                for name, sign in _MIRROR_SIGNS.items()
+            }
+            for mode in solver.modes:
+                fields = {}
+                for name, field in mode.fields.items():
+                    # H on the grid nodes, the plane included, E in the cells
+                    mirrored = (
+                        field[:, -2::-1] if field.shape[1] > centre else field[:, ::-1]
+                    )
+                    fields[name] = np.concatenate(
+                        [field, signs[name] * mirrored], axis=1
+                    )
+                modes.append(
+                    ms.FDMode(wg._wl, wg.y, wg.x, mode.neff, **fields).normalize()
+                )
+            n_effs.extend(solver.neff)
+            if self._group_index:
+                n_gs.extend(solver.ng)
+
+        n_effs = np.array(n_effs)
+        order = np.flipud(np.argsort(n_effs))[: self._n_eigs]
+        n_gs = np.array(n_gs)[order] if self._group_index else None
+        return n_effs[order], n_gs, [modes[i] for i in order if modes]
+
+    def warm_start(self, mode_solver):
+        """ Seeds the next solve with the results of a neighbouring structure.
+
+        The modes of `mode_solver`, if it found mode profiles, (interpolated
+        onto the grid of this solver's waveguide if it differs) are used as
+        start vectors, and its highest effective index sets the shift of a
+        shift-invert solve.
+
+        Args:
+            mode_solver (ModeSolverFullyVectorial): a solved mode solver,
+                typically the previous point of a sweep.
+        """
+        wg = mode_solver.wg
+        fields = [getattr(mode, "fields", mode) for mode in mode_solver.modes]
+
+        if fields:
+            # the solver works on the transposed grid and swaps the field labels
+            self._initial_mode_guess = ms.interp_mode_guess(
+                [f["Hy"] for f in fields],
+                [f["Hx"] for f in fields],
+                wg.y,
+                wg.x,
+                self.wg.y,
+                self.wg.x,
+            )
+        # just above the previous fundamental mode: a shift sitting on an
+        # eigenvalue makes the shifted matrix singular
+        self._n_eff_guess = 1.01 * np.max(np.real(mode_solver.n_effs))
+        self._shift_invert = True
+
     def _get_mode_types(self):
         mode_types = []
         labels = {0: "qTE", 1: "qTM", 2: "qTE/qTM"}
@@ -105,15 +329,21 @@ class ModeSolverFullyVectorial(_ModeSolver):
         mode_areas = []
         fraction_te = []
         fraction_tm = []
+        # weight the fields by the area of their cells, graded meshes aren't
+        # uniform: E is in the cells, H on the nodes, which get half of the
+        # neighbouring cells in each direction
+        dx, dy = np.diff(self.wg.x), np.diff(self.wg.y)
+        cell_areas = np.outer(dy, dx)
+        node_areas = np.outer(np.r_[dy, 0] + np.r_[0, dy], np.r_[dx, 0] + np.r_[0, dx])
         for mode in self.modes:
             e_fields = (mode.fields["Ex"], mode.fields["Ey"], mode.fields["Ez"])
             h_fields = (mode.fields["Hx"], mode.fields["Hy"], mode.fields["Hz"])
 
-            areas_e = [np.sum(np.abs(e) ** 2) for e in e_fields]
+            areas_e = [np.sum(cell_areas * np.abs(e) ** 2) for e in e_fields]
             areas_e /= np.sum(areas_e)
             areas_e *= 100
 
-            areas_h = [np.sum(np.abs(h) ** 2) for h in h_fields]
+            areas_h = [np.sum(node_areas * np.abs(h) ** 2) for h in h_fields]
             areas_h /= np.sum(areas_h)
             areas_h *= 100
 
@@ -9,6 +9,7 @@
 
 """
 import collections as col
+import time
 from builtins import range
 from builtins import zip
 
@@ -27,7 +28,463 @@ def centered1d(x):
 
 
 def centered2d(x):
-    return (x[1:, 1:] + x[1:, :-1] + x[:-1, 1:] + x[:-1, :-1]) / 4.0
+    return (x[..., 1:, 1:] + x[..., 1:, :-1] + x[..., :-1, 1:] + x[..., :-1, :-1]) / 4.0
+
+
+# Stencil entries of the finite difference operators: for each direction, the
+# grid nodes (rows) whose coefficient couples them to the neighbouring grid
+# nodes (cols), as slices of the (nx, ny) node index grid.
+_STENCIL = col.OrderedDict(
+    [
+        ("p", ((slice(None), slice(None)), (slice(None), slice(None)))),
+        ("e", ((slice(None, -1), slice(None)), (slice(1, None), slice(None)))),
+        ("w", ((slice(1, None), slice(None)), (slice(None, -1), slice(None)))),
+        ("n", ((slice(None), slice(None, -1)), (slice(None), slice(1, None)))),
+        ("s", ((slice(None), slice(1, None)), (slice(None), slice(None, -1)))),
+        ("ne", ((slice(None, -1), slice(None, -1)), (slice(1, None), slice(1, None)))),
+        ("se", ((slice(None, -1), slice(1, None)), (slice(1, None), slice(None, -1)))),
+        ("nw", ((slice(1, None), slice(None, -1)), (slice(None, -1), slice(1, None)))),
+        ("sw", ((slice(1, None), slice(1, None)), (slice(None, -1), slice(None, -1)))),
+    ]
+)
+
+
+class StencilPattern:
+    """
+    CSR sparsity pattern of a finite difference operator on an `nx` by `ny` grid.
+
+    The pattern only depends on the grid shape, so it is computed once and
+    `assemble` only has to scatter the coefficients into a preallocated
+    CSR ``data`` buffer, without building COO index/value arrays and
+    converting them on every call.
+
+    Parameters
+    ----------
+    nx, ny : int
+        number of grid nodes.
+    directions : tuple of str
+        stencil directions, keys of `_STENCIL`.
+    blocks : tuple of (int, int)
+        the (row, column) blocks of size ``nx * ny`` the operator is made of.
+    """
+
+    def __init__(self, nx, ny, directions, blocks):
+        N = nx * ny
+        ii = numpy.arange(N).reshape(nx, ny)
+
+        self.nx = nx
+        self.ny = ny
+        self.rows = {d: ii[_STENCIL[d][0]].ravel() for d in directions}
+        cols = {d: ii[_STENCIL[d][1]].ravel() for d in directions}
+
+        keys = [(b, d) for b in blocks for d in directions]
+        I = numpy.concatenate([self.rows[d] + b[0] * N for b, d in keys])
+        J = numpy.concatenate([cols[d] + b[1] * N for b, d in keys])
+
+        self.shape = (
+            N * (max(b[0] for b in blocks) + 1),
+            N * (max(b[1] for b in blocks) + 1),
+        )
+        self.nnz = I.size
+
+        idx_dtype = (
+            numpy.int32
+            if max(self.shape) < numpy.iinfo(numpy.int32).max
+            else numpy.int64
+        )
+
+        # position of every stencil entry in the row-major, column-sorted CSR data
+        order = numpy.lexsort((J, I))
+        pos = numpy.empty(self.nnz, dtype=numpy.intp)
+        pos[order] = numpy.arange(self.nnz)
+
+        self.indices = J[order].astype(idx_dtype)
+        self.indptr = numpy.zeros(self.shape[0] + 1, dtype=idx_dtype)
+        numpy.cumsum(numpy.bincount(I, minlength=self.shape[0]), out=self.indptr[1:])
+
+        self.positions = col.OrderedDict()
+        start = 0
+        for b, d in keys:
+            stop = start + self.rows[d].size
+            self.positions[b, d] = pos[start:stop]
+            start = stop
+
+        # grid nodes along the north, south, east and west boundaries
+        self.boundary_nodes = col.OrderedDict(
+            [("n", ii[:, -1]), ("s", ii[:, 0]), ("e", ii[-1, :]), ("w", ii[0, :])]
+        )
+
+        self.indices.flags.writeable = False
+        self.indptr.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        """int: memory held by the index arrays of the pattern."""
+        arrays = [self.indices, self.indptr]
+        arrays.extend(self.rows.values())
+        arrays.extend(self.positions.values())
+        arrays.extend(self.boundary_nodes.values())
+        return sum(a.nbytes for a in arrays)
+
+    def assemble(self, coefficients, dtype=complex):
+        """
+        Builds the CSR matrix.
+
+        Parameters
+        ----------
+        coefficients : dict
+            maps every block to a dict of flattened ``nx * ny`` coefficient arrays
+            keyed by stencil direction.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            the operator, sharing `indices` and `indptr` with the pattern.
+        """
+        from scipy.sparse import csr_matrix
+
+        data = numpy.empty(self.nnz, dtype=dtype)
+        for (b, d), pos in self.positions.items():
+            data[pos] = coefficients[b][d][self.rows[d]]
+
+        A = csr_matrix((data, self.indices, self.indptr), shape=self.shape, copy=False)
+        A.has_sorted_indices = True
+        return A
+
+
+# stencil directions and (row, column) blocks of the operator built by each method
+_METHODS = {
+    "Ex": (("p", "e", "w", "n", "s"), ((0, 0),)),
+    "Ey": (("p", "e", "w", "n", "s"), ((0, 0),)),
+    "scalar": (("p", "e", "w", "n", "s"), ((0, 0),)),
+    "vectorial": (tuple(_STENCIL), ((0, 0), (0, 1), (1, 0), (1, 1))),
+    # Hz from (Hx, Hy), see `_ModeSolverVectorial.compute_other_fields`
+    "Hz": (tuple(_STENCIL), ((0, 0), (0, 1))),
+}
+
+
+class PatternCache:
+    """
+    Least recently used cache of `StencilPattern` objects.
+
+    In a width or wavelength sweep the grid shape and boundary conditions never
+    change, so the index arrays and the CSR `indptr`/`indices` are only computed
+    for the first point and the solvers just recompute the permittivity
+    dependent coefficients.
+
+    Parameters
+    ----------
+    max_bytes : int
+        memory cap for the index arrays held by the cache.  The least recently
+        used patterns are dropped once it is exceeded.  Default is 256 MB.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._patterns = col.OrderedDict()
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def get(self, nx, ny, boundary, method):
+        """
+        Returns the pattern for an `nx` by `ny` grid.
+
+        Parameters
+        ----------
+        nx, ny : int
+            number of grid nodes.
+        boundary : str
+            boundary conditions, as passed to the mode solvers.
+        method : str
+            'Ex', 'Ey' or 'scalar' for the semi-vectorial solver,
+            'vectorial' for the full-vectorial one.
+        """
+        key = (nx, ny, boundary, method)
+        try:
+            pattern = self._patterns.pop(key)
+            self.hits += 1
+        except KeyError:
+            pattern = StencilPattern(nx, ny, *_METHODS[method])
+            self.nbytes += pattern.nbytes
+            self.misses += 1
+        self._patterns[key] = pattern
+
+        while self.nbytes > self.max_bytes and len(self._patterns) > 1:
+            _, evicted = self._patterns.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+        return pattern
+
+    def clear(self):
+        self._patterns.clear()
+        self.nbytes = 0
+
+
+PATTERN_CACHE = PatternCache()
+
+
+def interp_mode_guess(Hxs, Hys, x, y, x_new=None, y_new=None):
+    """
+    Builds start vectors for the eigen-solver from previously found modes.
+
+    Parameters
+    ----------
+    Hxs, Hys : list of 2D arrays
+        the Hx and Hy fields of the modes, as found by `_ModeSolverVectorial`
+        on the grid `x`, `y`.
+    x, y : 1D arrays
+        grid the modes were found on.
+    x_new, y_new : 1D arrays
+        grid of the new solve.  The fields are linearly interpolated onto it
+        (and set to zero outside of `x`, `y`) when it differs from `x`, `y`.
+
+    Returns
+    -------
+    2D array
+        one ``[Hx, Hy]`` start vector per mode, as columns.
+    """
+    from scipy.interpolate import RegularGridInterpolator
+
+    x_new = x if x_new is None else x_new
+    y_new = y if y_new is None else y_new
+    regrid = not (numpy.array_equal(x, x_new) and numpy.array_equal(y, y_new))
+    if regrid:
+        xy_new = numpy.stack(numpy.meshgrid(x_new, y_new, indexing="ij"), axis=-1)
+
+    def _interp(f):
+        f = numpy.asarray(f)
+        if not regrid:
+            return f
+        interp_real = RegularGridInterpolator(
+            (x, y), f.real, bounds_error=False, fill_value=0.0
+        )
+        interp_imag = RegularGridInterpolator(
+            (x, y), f.imag, bounds_error=False, fill_value=0.0
+        )
+        return interp_real(xy_new) + 1.0j * interp_imag(xy_new)
+
+    guess = [
+        numpy.r_[_interp(Hx).ravel(), _interp(Hy).ravel()] for Hx, Hy in zip(Hxs, Hys)
+    ]
+    return numpy.array(guess).T
+
+
+class ShiftInvertLU:
+    """
+    Sparse LU factorization of ``A - sigma * I`` used to run the eigen-solver
+    in shift-invert mode.
+
+    The factorization is by far the most expensive part of a shift-invert
+    solve, so it is kept as an object that can be handed back to ``eigs``
+    as ``OPinv`` for as long as the matrix and the shift don't change.
+
+    Parameters
+    ----------
+    A : sparse matrix
+        The (square) eigen-problem matrix.
+    sigma : float or complex
+        The shift.
+
+    Attributes
+    ----------
+    factorization_time : float
+        Wall time in seconds spent in the LU factorization.
+    """
+
+    def __init__(self, A, sigma):
+        from scipy.sparse import identity
+        from scipy.sparse.linalg import splu
+
+        self.A = A
+        self.sigma = sigma
+
+        t0 = time.perf_counter()
+        self.lu = splu((A - sigma * identity(A.shape[0], format="csr")).tocsc())
+        self.factorization_time = time.perf_counter() - t0
+
+    def matches(self, A, sigma):
+        """Whether this factorization is valid for matrix `A` and shift `sigma`."""
+        return (
+            sigma == self.sigma and A.shape == self.A.shape and (A != self.A).nnz == 0
+        )
+
+    def solve(self, b):
+        return self.lu.solve(b)
+
+    def operator(self, transpose=False):
+        """
+        The inverse of ``A - sigma * I`` (or of its transpose) as a
+        `LinearOperator`, for ``OPinv``.
+        """
+        from scipy.sparse.linalg import LinearOperator
+
+        trans = "T" if transpose else "N"
+        return LinearOperator(
+            self.A.shape,
+            matvec=lambda b: self.lu.solve(b, trans=trans),
+            dtype=numpy.result_type(self.A.dtype, self.sigma),
+        )
+
+
+def group_indices(solver, A, eigvals, eigvecs, lu=None, tol=0):
+    """
+    Group indices of the modes found by `solver`, without solving again at
+    neighbouring wavelengths.
+
+    The eigenvalues of ``A`` are the squared propagation constants
+    ``beta**2`` and, by the Hellmann-Feynman theorem, their derivatives with
+    respect to ``k = 2 pi / wl`` are ``y^T (dA/dk) x / y^T x``, with ``x`` and
+    ``y`` the right and left eigenvectors (``A`` is not symmetric).  The
+    group index is ``n_g = d(beta)/dk``.  ``A`` is quadratic in ``k``, so the
+    central difference of the matrix giving ``dA/dk`` is exact in ``k``, and
+    the material dispersion enters through the derivative of the
+    permittivity with respect to the wavelength, ``structure.deps_c_dwl``.
+
+    Parameters
+    ----------
+    solver : _ModeSolverSemiVectorial or _ModeSolverVectorial
+        the solver that built ``A``.
+    A : sparse matrix
+        the eigen-problem matrix.
+    eigvals : 1D array
+        eigenvalues of the modes.
+    eigvecs : 2D array
+        right eigenvectors of the modes, as columns.
+    lu : ShiftInvertLU
+        factorization of ``A - sigma * I``, whose transpose gives the left
+        eigenvectors.  If None, ``A`` is factorized with a shift just above
+        the largest eigenvalue.
+    tol : float
+        relative accuracy of the left eigen-solve.
+
+    Returns
+    -------
+    1D array
+        the group index of each eigenvalue.
+    """
+    from scipy.sparse.linalg import eigen
+
+    structure = solver.structure
+    k = 2 * numpy.pi / solver.wl
+    eps_c = structure.eps_c
+    deps_c = getattr(structure, "deps_c_dwl", None)
+
+    def matrix(dk):
+        # d wl / d k = -wl / k
+        dwl = -dk * solver.wl / k
+        if deps_c is None:
+            eps = eps_c
+        elif isinstance(eps_c, tuple):
+            eps = tuple(e + dwl * de for e, de in zip(eps_c, deps_c))
+        else:
+            eps = eps_c + dwl * deps_c
+        return solver.build_matrix(wl=2 * numpy.pi / (k + dk), eps_c=eps)
+
+    h = 1e-3 * k
+    dA = (matrix(h) - matrix(-h)) / (2 * h)
+
+    if lu is None:
+        # a shift sitting on an eigenvalue makes the shifted matrix singular
+        lu = ShiftInvertLU(A, 1.02 * numpy.max(numpy.real(eigvals)))
+    left_eigvals, left_eigvecs = eigen.eigs(
+        A.T,
+        k=len(eigvals),
+        which="LM",
+        tol=tol,
+        v0=numpy.random.RandomState(0).rand(A.shape[0]),
+        sigma=lu.sigma,
+        OPinv=lu.operator(transpose=True),
+    )
+
+    n_gs = []
+    for eigval, x in zip(eigvals, eigvecs.T):
+        y = left_eigvecs[:, numpy.argmin(numpy.abs(left_eigvals - eigval))]
+        n_gs.append((y @ (dA @ x)) / (y @ x) / (2 * numpy.sqrt(eigval)))
+    return numpy.array(n_gs)
+
+
+def eigs_arpack(A, k, lu, v0=None, tol=0.001):
+    """
+    Shift-invert eigen-solve with ARPACK's implicitly restarted Arnoldi method.
+
+    Parameters
+    ----------
+    A : sparse matrix
+        the eigen-problem matrix.
+    k : int
+        number of eigenvalues to find, the ones closest to the shift.
+    lu : ShiftInvertLU
+        factorization of ``A - sigma * I``.
+    v0 : 1D or 2D array
+        start vector.  The columns of a 2D array are summed, since ARPACK
+        only takes a single start vector.
+    tol : float
+        relative accuracy of the eigenvalues.
+
+    Returns
+    -------
+    (1D array, 2D array)
+        the eigenvalues and the eigenvectors (as columns).
+    """
+    from scipy.sparse.linalg import eigen
+
+    if v0 is not None and numpy.ndim(v0) == 2:
+        v0 = numpy.sum(v0, axis=1)
+
+    return eigen.eigs(
+        A,
+        k=k,
+        which="LM",
+        tol=tol,
+        ncv=None,
+        v0=v0,
+        sigma=lu.sigma,
+        OPinv=lu.operator(),
+    )
+
+
+def pml_steps(x, lower, upper, thickness=0.5, strength=5.0):
+    """
+    Grid steps of `x` in complex stretched coordinates.
+
+    Within `thickness` of the `lower` and/or `upper` end of `x` every step
+    is multiplied by ``1 + 1j * strength * (depth / thickness) ** 2``,
+    evaluated at its midpoint, which turns the outer cells into a perfectly
+    matched layer (PML) that absorbs the outgoing field.  Radiation and
+    leakage losses then show up as a positive imaginary part of the
+    effective indices.
+
+    Parameters
+    ----------
+    x : 1D array
+        grid points.
+    lower, upper : bool
+        whether there is a PML at the low and high end of `x`.
+    thickness : float
+        thickness of the PML, in the units of `x`.
+    strength : float
+        imaginary part of the coordinate stretching at the outer edge of the PML.
+
+    Returns
+    -------
+    1D array
+        the ``len(x) - 1`` steps, complex if there is a PML.
+    """
+    dx = numpy.diff(x)
+    if not (lower or upper):
+        return dx
+
+    xc = centered1d(x)
+    depth = numpy.zeros_like(xc)
+    if lower:
+        depth = numpy.maximum(depth, x[0] + thickness - xc)
+    if upper:
+        depth = numpy.maximum(depth, xc - x[-1] + thickness)
+    return dx * (1 + 1j * strength * (depth / thickness) ** 2)
 
 
 class _ModeSolverSemiVectorial:
@@ -45,16 +502,10 @@ class _ModeSolverSemiVectorial:
     wl : float
         optical wavelength
         units are arbitrary, but must be self-consistent. It's recommended to just work in microns.
-    x : 1D array of floats
-        Array of x-values
-    y : 1D array of floats
-        Array of y-values
-    epsfunc : function
-        This is a function that provides the relative permittivity (square of the refractive index)
-        as a function of the x and y position. The function must be of the form:
-        ``myRelativePermittivity(x,y)``
-        The function can either return a single float, corresponding the an isotropic refractive index,
-        or, it may a length-5 tuple. In the tuple case, the relative permittivity is given in the form
+    structure : Structure
+        The structure to solve.  Its permittivity at the cell centres is taken from
+        ``structure.eps_c``, either an array, corresponding to an isotropic refractive index,
+        or a length-5 tuple, in which case the relative permittivity is given in the form
         (epsxx, epsxy, epsyx, epsyy, epszz).
 
     boundary : str
@@ -63,12 +514,18 @@ class _ModeSolverSemiVectorial:
            'A' - Hx is antisymmetric, Hy is symmetric.
            'S' - Hx is symmetric and, Hy is antisymmetric.
            '0' - Hx and Hy are zero immediately outside of the boundary.
+           'P' - a perfectly matched layer (PML) absorbs the field within `pml_thickness`
+                 of the boundary, see `pml_steps`.  Hx and Hy are zero outside of it.
         The string identifies all four boundary conditions, in the order: North, south, east, west.
         For example, boundary='000A'
 
     method : str
         must be 'Ex', 'Ey', or 'scalar'
         this identifies the field that will be calculated.
+    pml_thickness : float
+        thickness of the 'P' boundaries (same units as the structure).
+    pml_strength : float
+        strength of the 'P' boundaries, see `pml_steps`.
 
 
     Returns
@@ -78,7 +535,15 @@ class _ModeSolverSemiVectorial:
 
     """
 
-    def __init__(self, wl, structure, boundary="0000", method="Ex"):
+    def __init__(
+        self,
+        wl,
+        structure,
+        boundary="0000",
+        method="Ex",
+        pml_thickness=0.5,
+        pml_strength=5.0,
+    ):
         # Polarisation bug fix.
         assert method in ("Ex", "Ey"), "Invalid polarisation method."
         if method == "Ex":
@@ -92,20 +557,26 @@ class _ModeSolverSemiVectorial:
         self.boundary = boundary
         self.method = method
         self.structure = structure
+        self.pml_thickness = pml_thickness
+        self.pml_strength = pml_strength
 
-    def build_matrix(self):
+    def _steps(self):
+        """The grid steps along `x` and `y`, stretched by the 'P' boundaries."""
+        pml = dict(thickness=self.pml_thickness, strength=self.pml_strength)
+        dx = pml_steps(self.x, self.boundary[3] == "P", self.boundary[2] == "P", **pml)
+        dy = pml_steps(self.y, self.boundary[1] == "P", self.boundary[0] == "P", **pml)
+        return dx, dy
 
-        from scipy.sparse import coo_matrix
+    def build_matrix(self, wl=None, eps_c=None):
 
-        wl = self.wl
+        wl = self.wl if wl is None else wl
         x = self.x
         y = self.y
         structure = self.structure
         boundary = self.boundary
         method = self.method
 
-        dx = numpy.diff(x)
-        dy = numpy.diff(y)
+        dx, dy = self._steps()
 
         dx = numpy.r_[dx[0], dx, dx[-1]].reshape(-1, 1)
         dy = numpy.r_[dy[0], dy, dy[-1]].reshape(1, -1)
@@ -113,7 +584,10 @@ class _ModeSolverSemiVectorial:
         xc = (x[:-1] + x[1:]) / 2
         yc = (y[:-1] + y[1:]) / 2
 
-        eps = structure.eps_func(yc, xc)
+        eps = structure.eps_c if eps_c is None else eps_c
+        if isinstance(eps, tuple):
+            # the scalar stencil only sees the arithmetic average, epszz
+            eps = eps[-1]
         eps = numpy.c_[eps[:, 0:1], eps, eps[:, -1:]]
         eps = numpy.r_[eps[0:1, :], eps, eps[-1:, :]]
 
@@ -217,10 +691,10 @@ class _ModeSolverSemiVectorial:
 
             raise ValueError("unknown method")
 
-        ii = numpy.arange(nx * ny).reshape(nx, ny)
+        pattern = PATTERN_CACHE.get(nx, ny, boundary, method)
 
         # north boundary
-        ib = ii[:, -1]
+        ib = pattern.boundary_nodes["n"]
         if boundary[0] == "S":
             Ap[ib] += An[ib]
         elif boundary[0] == "A":
@@ -229,7 +703,7 @@ class _ModeSolverSemiVectorial:
         #     raise ValueError('unknown boundary')
 
         # south
-        ib = ii[:, 0]
+        ib = pattern.boundary_nodes["s"]
         if boundary[1] == "S":
             Ap[ib] += As[ib]
         elif boundary[1] == "A":
@@ -238,7 +712,7 @@ class _ModeSolverSemiVectorial:
         #     raise ValueError('unknown boundary')
 
         # east
-        ib = ii[-1, :]
+        ib = pattern.boundary_nodes["e"]
         if boundary[2] == "S":
             Ap[ib] += Ae[ib]
         elif boundary[2] == "A":
@@ -247,7 +721,7 @@ class _ModeSolverSemiVectorial:
         #     raise ValueError('unknown boundary')
 
         # west
-        ib = ii[0, :]
+        ib = pattern.boundary_nodes["w"]
         if boundary[3] == "S":
             Ap[ib] += Aw[ib]
         elif boundary[3] == "A":
@@ -255,21 +729,21 @@ class _ModeSolverSemiVectorial:
         # else:
         #     raise ValueError('unknown boundary')
 
-        iall = ii.flatten()
-        i_n = ii[:, 1:].flatten()
-        i_s = ii[:, :-1].flatten()
-        i_e = ii[1:, :].flatten()
-        i_w = ii[:-1, :].flatten()
-
-        I = numpy.r_[iall, i_w, i_e, i_s, i_n]
-        J = numpy.r_[iall, i_e, i_w, i_n, i_s]
-        V = numpy.r_[Ap[iall], Ae[i_w], Aw[i_e], An[i_s], As[i_n]]
-
-        A = coo_matrix((V, (I, J))).tocsr()
+        A = pattern.assemble(
+            {(0, 0): dict(p=Ap, e=Ae, w=Aw, n=An, s=As)},
+            dtype=numpy.result_type(Ap, Ae, Aw, An, As),
+        )
 
         return A
 
-    def solve(self, neigs, tol=0, mode_profiles=True, initial_mode_guess=None):
+    def solve(
+        self,
+        neigs,
+        tol=0,
+        mode_profiles=True,
+        initial_mode_guess=None,
+        group_index=False,
+    ):
 
         from scipy.sparse.linalg import eigen
 
@@ -278,22 +752,35 @@ class _ModeSolverSemiVectorial:
 
         A = self.build_matrix()
 
+        if "P" in self.boundary:
+            # the PML modes have the largest real parts, look around the
+            # maximum index of the structure instead
+            k = 2 * numpy.pi / self.wl
+            shift = (numpy.max(numpy.real(self.structure.n)) * k) ** 2
+            which = "LM"
+        else:
+            shift = None
+            which = "LR"
+
         eigs = eigen.eigs(
             A,
             k=neigs,
-            which="LR",
-            tol=0.001,
+            which=which,
+            tol=tol,
             ncv=None,
             v0=initial_mode_guess,
-            return_eigenvectors=mode_profiles,
+            return_eigenvectors=mode_profiles or group_index,
+            sigma=shift,
         )
-        if mode_profiles:
+        if mode_profiles or group_index:
             eigvals, eigvecs = eigs
         else:
             eigvals = eigs
             eigvecs = None
 
         neff = self.wl * scipy.sqrt(eigvals) / (2 * numpy.pi)
+        if group_index:
+            ng = group_indices(self, A, eigvals, eigvecs, tol=tol)
         if mode_profiles:
             phi = []
             for ieig in range(neigs):
@@ -303,6 +790,7 @@ class _ModeSolverSemiVectorial:
         # sort and save the modes
         idx = numpy.flipud(numpy.argsort(neff))
         self.neff = neff[idx]
+        self.ng = ng[idx] if group_index else None
         if mode_profiles:
             tmp = []
             for i in idx:
@@ -339,16 +827,10 @@ class _ModeSolverVectorial:
     wl : float
         The wavelength of the optical radiation (units are arbitrary, but must be self-consistent
         between all inputs. Recommandation is to just use micron for everthing)
-    x : 1D array of floats
-        Array of x-values
-    y : 1D array of floats
-        Array of y-values
-    epsfunc : function
-        This is a function that provides the relative permittivity (square of the refractive index)
-        as a function of the x and y position. The function must be of the form:
-        ``myRelativePermittivity(x,y)``
-        The function can either return a single float, corresponding the an isotropic refractive index,
-        or, ir may a length-5 tuple. In the tuple case, the relative permittivity is given in the form
+    structure : Structure
+        The structure to solve.  Its permittivity at the cell centres is taken from
+        ``structure.eps_c``, either an array, corresponding to an isotropic refractive index,
+        or a length-5 tuple, in which case the relative permittivity is given in the form
         (epsxx, epsxy, epsyx, epsyy, epszz).
         The light is `z` propagating.
     boundary : str
@@ -357,8 +839,14 @@ class _ModeSolverVectorial:
            'A' - Hx is antisymmetric, Hy is symmetric.
            'S' - Hx is symmetric and, Hy is antisymmetric.
            '0' - Hx and Hy are zero immediately outside of the boundary.
+           'P' - a perfectly matched layer (PML) absorbs the field within `pml_thickness`
+                 of the boundary, see `pml_steps`.  Hx and Hy are zero outside of it.
         The string identifies all four boundary conditions, in the order: North, south, east, west.
         For example, boundary='000A'
+    pml_thickness : float
+        thickness of the 'P' boundaries (same units as the structure).
+    pml_strength : float
+        strength of the 'P' boundaries, see `pml_steps`.
 
     Returns
     -------
@@ -367,33 +855,39 @@ class _ModeSolverVectorial:
 
     """
 
-    def __init__(self, wl, structure, boundary):
+    def __init__(self, wl, structure, boundary, pml_thickness=0.5, pml_strength=5.0):
         self.wl = wl
         self.x = structure.y
         self.y = structure.x
-        self.epsfunc = structure.eps_func
         self.boundary = boundary
+        self.structure = structure
+        self.pml_thickness = pml_thickness
+        self.pml_strength = pml_strength
 
-    def build_matrix(self):
+        self.lu = None
+        self.factorization_time = 0.0
+        self.iteration_time = 0.0
 
-        from scipy.sparse import coo_matrix
+    def _steps(self):
+        """The grid steps along `x` and `y`, stretched by the 'P' boundaries."""
+        pml = dict(thickness=self.pml_thickness, strength=self.pml_strength)
+        dx = pml_steps(self.x, self.boundary[3] == "P", self.boundary[2] == "P", **pml)
+        dy = pml_steps(self.y, self.boundary[1] == "P", self.boundary[0] == "P", **pml)
+        return dx, dy
 
-        wl = self.wl
+    def build_matrix(self, wl=None, eps_c=None):
+
+        wl = self.wl if wl is None else wl
         x = self.x
         y = self.y
-        epsfunc = self.epsfunc
         boundary = self.boundary
 
-        dx = numpy.diff(x)
-        dy = numpy.diff(y)
+        dx, dy = self._steps()
 
         dx = numpy.r_[dx[0], dx, dx[-1]].reshape(-1, 1)
         dy = numpy.r_[dy[0], dy, dy[-1]].reshape(1, -1)
 
-        xc = (x[:-1] + x[1:]) / 2
-        yc = (y[:-1] + y[1:]) / 2
-
-        tmp = epsfunc(yc, xc)
+        tmp = self.structure.eps_c if eps_c is None else eps_c
         if isinstance(tmp, tuple):
             tmp = [numpy.c_[t[:, 0:1], t, t[:, -1:]] for t in tmp]
             tmp = [numpy.r_[t[0:1, :], t, t[-1:, :]] for t in tmp]
@@ -611,17 +1105,17 @@ class _ModeSolverVectorial:
             + s * (w * exy2 * exx3 + e * exy3 * exx2) / ew23
         ) / (n + s)
 
-        ii = numpy.arange(nx * ny).reshape(nx, ny)
+        pattern = PATTERN_CACHE.get(nx, ny, boundary, "vectorial")
 
         # NORTH boundary
 
-        ib = ii[:, -1]
+        ib = pattern.boundary_nodes["n"]
 
         if boundary[0] == "S":
             sign = 1
         elif boundary[0] == "A":
             sign = -1
-        elif boundary[0] == "0":
+        elif boundary[0] in "0P":
             sign = 0
         else:
             raise ValueError("unknown boundary conditions")
@@ -641,13 +1135,13 @@ class _ModeSolverVectorial:
 
         # SOUTH boundary
 
-        ib = ii[:, 0]
+        ib = pattern.boundary_nodes["s"]
 
         if boundary[1] == "S":
             sign = 1
         elif boundary[1] == "A":
             sign = -1
-        elif boundary[1] == "0":
+        elif boundary[1] in "0P":
             sign = 0
         else:
             raise ValueError("unknown boundary conditions")
@@ -667,13 +1161,13 @@ class _ModeSolverVectorial:
 
         # EAST boundary
 
-        ib = ii[-1, :]
+        ib = pattern.boundary_nodes["e"]
 
         if boundary[2] == "S":
             sign = 1
         elif boundary[2] == "A":
             sign = -1
-        elif boundary[2] == "0":
+        elif boundary[2] in "0P":
             sign = 0
         else:
             raise ValueError("unknown boundary conditions")
@@ -693,13 +1187,13 @@ class _ModeSolverVectorial:
 
         # WEST boundary
 
-        ib = ii[0, :]
+        ib = pattern.boundary_nodes["w"]
 
         if boundary[3] == "S":
             sign = 1
         elif boundary[3] == "A":
             sign = -1
-        elif boundary[3] == "0":
+        elif boundary[3] in "0P":
             sign = 0
         else:
             raise ValueError("unknown boundary conditions")
@@ -719,1328 +1213,1266 @@ class _ModeSolverVectorial:
 
         # Assemble sparse matrix
 
-        iall = ii.flatten()
-        i_s = ii[:, :-1].flatten()
-        i_n = ii[:, 1:].flatten()
-        i_e = ii[1:, :].flatten()
-        i_w = ii[:-1, :].flatten()
-        i_ne = ii[1:, 1:].flatten()
-        i_se = ii[1:, :-1].flatten()
-        i_sw = ii[:-1, :-1].flatten()
-        i_nw = ii[:-1, 1:].flatten()
-
-        Ixx = numpy.r_[iall, i_w, i_e, i_s, i_n, i_ne, i_se, i_sw, i_nw]
-        Jxx = numpy.r_[iall, i_e, i_w, i_n, i_s, i_sw, i_nw, i_ne, i_se]
-        Vxx = numpy.r_[
-            axxp[iall],
-            axxe[i_w],
-            axxw[i_e],
-            axxn[i_s],
-            axxs[i_n],
-            axxsw[i_ne],
-            axxnw[i_se],
-            axxne[i_sw],
-            axxse[i_nw],
-        ]
-
-        Ixy = numpy.r_[iall, i_w, i_e, i_s, i_n, i_ne, i_se, i_sw, i_nw]
-        Jxy = numpy.r_[iall, i_e, i_w, i_n, i_s, i_sw, i_nw, i_ne, i_se] + nx * ny
-        Vxy = numpy.r_[
-            axyp[iall],
-            axye[i_w],
-            axyw[i_e],
-            axyn[i_s],
-            axys[i_n],
-            axysw[i_ne],
-            axynw[i_se],
-            axyne[i_sw],
-            axyse[i_nw],
-        ]
-
-        Iyx = numpy.r_[iall, i_w, i_e, i_s, i_n, i_ne, i_se, i_sw, i_nw] + nx * ny
-        Jyx = numpy.r_[iall, i_e, i_w, i_n, i_s, i_sw, i_nw, i_ne, i_se]
-        Vyx = numpy.r_[
-            ayxp[iall],
-            ayxe[i_w],
-            ayxw[i_e],
-            ayxn[i_s],
-            ayxs[i_n],
-            ayxsw[i_ne],
-            ayxnw[i_se],
-            ayxne[i_sw],
-            ayxse[i_nw],
-        ]
-
-        Iyy = numpy.r_[iall, i_w, i_e, i_s, i_n, i_ne, i_se, i_sw, i_nw] + nx * ny
-        Jyy = numpy.r_[iall, i_e, i_w, i_n, i_s, i_sw, i_nw, i_ne, i_se] + nx * ny
-        Vyy = numpy.r_[
-            ayyp[iall],
-            ayye[i_w],
-            ayyw[i_e],
-            ayyn[i_s],
-            ayys[i_n],
-            ayysw[i_ne],
-            ayynw[i_se],
-            ayyne[i_sw],
-            ayyse[i_nw],
-        ]
-
-        I = numpy.r_[Ixx, Ixy, Iyx, Iyy]
-        J = numpy.r_[Jxx, Jxy, Jyx, Jyy]
-        V = numpy.r_[Vxx, Vxy, Vyx, Vyy]
-        A = coo_matrix((V, (I, J))).tocsr()
+        A = pattern.assemble(
+            {
+                (0, 0): dict(
+                    p=axxp,
+                    e=axxe,
+                    w=axxw,
+                    n=axxn,
+                    s=axxs,
+                    ne=axxne,
+                    se=axxse,
+                    nw=axxnw,
+                    sw=axxsw,
+                ),
+                (0, 1): dict(
+                    p=axyp,
+                    e=axye,
+                    w=axyw,
+                    n=axyn,
+                    s=axys,
+                    ne=axyne,
+                    se=axyse,
+                    nw=axynw,
+                    sw=axysw,
+                ),
+                (1, 0): dict(
+                    p=ayxp,
+                    e=ayxe,
+                    w=ayxw,
+                    n=ayxn,
+                    s=ayxs,
+                    ne=ayxne,
+                    se=ayxse,
+                    nw=ayxnw,
+                    sw=ayxsw,
+                ),
+                (1, 1): dict(
+                    p=ayyp,
+                    e=ayye,
+                    w=ayyw,
+                    n=ayyn,
+                    s=ayys,
+                    ne=ayyne,
+                    se=ayyse,
+                    nw=ayynw,
+                    sw=ayysw,
+                ),
+            },
+            dtype=numpy.result_type(axxp, axyp, ayxp, ayyp),
+        )
 
         return A
 
     def compute_other_fields(self, neffs, Hxs, Hys):
 
-        from scipy.sparse import coo_matrix
-
         wl = self.wl
         x = self.x
         y = self.y
-        epsfunc = self.epsfunc
         boundary = self.boundary
 
-        Hzs = []
-        Exs = []
-        Eys = []
-        Ezs = []
-        for neff, Hx, Hy in zip(neffs, Hxs, Hys):
-
-            dx = numpy.diff(x)
-            dy = numpy.diff(y)
-
-            dx = numpy.r_[dx[0], dx, dx[-1]].reshape(-1, 1)
-            dy = numpy.r_[dy[0], dy, dy[-1]].reshape(1, -1)
+        dx, dy = self._steps()
 
-            xc = (x[:-1] + x[1:]) / 2
-            yc = (y[:-1] + y[1:]) / 2
+        dx = numpy.r_[dx[0], dx, dx[-1]].reshape(-1, 1)
+        dy = numpy.r_[dy[0], dy, dy[-1]].reshape(1, -1)
 
-            tmp = epsfunc(yc, xc)
-            if isinstance(tmp, tuple):
-                tmp = [numpy.c_[t[:, 0:1], t, t[:, -1:]] for t in tmp]
-                tmp = [numpy.r_[t[0:1, :], t, t[-1:, :]] for t in tmp]
-                epsxx, epsxy, epsyx, epsyy, epszz = tmp
-            else:
-                tmp = numpy.c_[tmp[:, 0:1], tmp, tmp[:, -1:]]
-                tmp = numpy.r_[tmp[0:1, :], tmp, tmp[-1:, :]]
-                epsxx = epsyy = epszz = tmp
-                epsxy = epsyx = numpy.zeros_like(epsxx)
+        tmp = self.structure.eps_c
+        if isinstance(tmp, tuple):
+            tmp = [numpy.c_[t[:, 0:1], t, t[:, -1:]] for t in tmp]
+            tmp = [numpy.r_[t[0:1, :], t, t[-1:, :]] for t in tmp]
+            epsyy, epsyx, epsxy, epsxx, epszz = tmp
+        else:
+            tmp = numpy.c_[tmp[:, 0:1], tmp, tmp[:, -1:]]
+            tmp = numpy.r_[tmp[0:1, :], tmp, tmp[-1:, :]]
+            epsxx = epsyy = epszz = tmp
+            epsxy = epsyx = numpy.zeros_like(epsxx)
 
-            nx = len(x)
-            ny = len(y)
+        nx = len(x)
+        ny = len(y)
 
-            k = 2 * numpy.pi / wl
+        k = 2 * numpy.pi / wl
 
-            ones_nx = numpy.ones((nx, 1))
-            ones_ny = numpy.ones((1, ny))
+        ones_nx = numpy.ones((nx, 1))
+        ones_ny = numpy.ones((1, ny))
 
-            n = numpy.dot(ones_nx, dy[:, 1:]).flatten()
-            s = numpy.dot(ones_nx, dy[:, :-1]).flatten()
-            e = numpy.dot(dx[1:, :], ones_ny).flatten()
-            w = numpy.dot(dx[:-1, :], ones_ny).flatten()
+        n = numpy.dot(ones_nx, dy[:, 1:]).flatten()
+        s = numpy.dot(ones_nx, dy[:, :-1]).flatten()
+        e = numpy.dot(dx[1:, :], ones_ny).flatten()
+        w = numpy.dot(dx[:-1, :], ones_ny).flatten()
 
-            exx1 = epsxx[:-1, 1:].flatten()
-            exx2 = epsxx[:-1, :-1].flatten()
-            exx3 = epsxx[1:, :-1].flatten()
-            exx4 = epsxx[1:, 1:].flatten()
+        exx1 = epsxx[:-1, 1:].flatten()
+        exx2 = epsxx[:-1, :-1].flatten()
+        exx3 = epsxx[1:, :-1].flatten()
+        exx4 = epsxx[1:, 1:].flatten()
 
-            eyy1 = epsyy[:-1, 1:].flatten()
-            eyy2 = epsyy[:-1, :-1].flatten()
-            eyy3 = epsyy[1:, :-1].flatten()
-            eyy4 = epsyy[1:, 1:].flatten()
+        eyy1 = epsyy[:-1, 1:].flatten()
+        eyy2 = epsyy[:-1, :-1].flatten()
+        eyy3 = epsyy[1:, :-1].flatten()
+        eyy4 = epsyy[1:, 1:].flatten()
 
-            exy1 = epsxy[:-1, 1:].flatten()
-            exy2 = epsxy[:-1, :-1].flatten()
-            exy3 = epsxy[1:, :-1].flatten()
-            exy4 = epsxy[1:, 1:].flatten()
+        exy1 = epsxy[:-1, 1:].flatten()
+        exy2 = epsxy[:-1, :-1].flatten()
+        exy3 = epsxy[1:, :-1].flatten()
+        exy4 = epsxy[1:, 1:].flatten()
 
-            eyx1 = epsyx[:-1, 1:].flatten()
-            eyx2 = epsyx[:-1, :-1].flatten()
-            eyx3 = epsyx[1:, :-1].flatten()
-            eyx4 = epsyx[1:, 1:].flatten()
+        eyx1 = epsyx[:-1, 1:].flatten()
+        eyx2 = epsyx[:-1, :-1].flatten()
+        eyx3 = epsyx[1:, :-1].flatten()
+        eyx4 = epsyx[1:, 1:].flatten()
 
-            ezz1 = epszz[:-1, 1:].flatten()
-            ezz2 = epszz[:-1, :-1].flatten()
-            ezz3 = epszz[1:, :-1].flatten()
-            ezz4 = epszz[1:, 1:].flatten()
+        ezz1 = epszz[:-1, 1:].flatten()
+        ezz2 = epszz[:-1, :-1].flatten()
+        ezz3 = epszz[1:, :-1].flatten()
+        ezz4 = epszz[1:, 1:].flatten()
 
-            b = neff * k
+        bzxne = (
+            0.5
+            * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+            * eyx4
+            / ezz4
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            + 0.5
+            * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+            * (1 - exx4 / ezz4)
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * exx1
+            * s
+        )
 
-            bzxne = (
-                0.5
-                * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                * eyx4
-                / ezz4
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                + 0.5
-                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                * (1 - exx4 / ezz4)
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * exx1
-                * s
-            ) / b
+        bzxse = (
+            -0.5
+            * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+            * eyx3
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy1
+            * w
+            * eyy2
+            + 0.5
+            * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+            * (1 - exx3 / ezz3)
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * n
+            * exx1
+            * exx4
+        )
 
-            bzxse = (
-                -0.5
-                * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                * eyx3
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy1
-                * w
-                * eyy2
-                + 0.5
-                * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
-                * (1 - exx3 / ezz3)
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * n
-                * exx1
-                * exx4
-            ) / b
+        bzxnw = (
+            -0.5
+            * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+            * eyx1
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy2
+            * e
+            - 0.5
+            * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+            * (1 - exx1 / ezz1)
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * exx4
+            * s
+        )
 
-            bzxnw = (
-                -0.5
-                * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                * eyx1
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy2
-                * e
-                - 0.5
-                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                * (1 - exx1 / ezz1)
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * exx4
-                * s
-            ) / b
+        bzxsw = (
+            0.5
+            * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+            * eyx2
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * e
+            - 0.5
+            * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+            * (1 - exx2 / ezz2)
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx3
+            * n
+            * exx1
+            * exx4
+        )
 
-            bzxsw = (
+        bzxn = (
+            (
                 0.5
                 * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                * eyx2
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * e
-                - 0.5
-                * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
-                * (1 - exx2 / ezz2)
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx3
                 * n
-                * exx1
-                * exx4
-            ) / b
-
-            bzxn = (
-                (
+                * ezz1
+                * ezz2
+                / eyy1
+                * (2 * eyy1 / ezz1 / n ** 2 + eyx1 / ezz1 / n / w)
+                + 0.5
+                * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * n
+                * ezz4
+                * ezz3
+                / eyy4
+                * (2 * eyy4 / ezz4 / n ** 2 - eyx4 / ezz4 / n / e)
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * (
                     0.5
-                    * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                    * n
-                    * ezz1
-                    * ezz2
-                    / eyy1
-                    * (2 * eyy1 / ezz1 / n ** 2 + eyx1 / ezz1 / n / w)
-                    + 0.5
-                    * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                    * n
                     * ezz4
-                    * ezz3
-                    / eyy4
-                    * (2 * eyy4 / ezz4 / n ** 2 - eyx4 / ezz4 / n / e)
-                )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
-                    (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
                     * (
-                        0.5
-                        * ezz4
-                        * (
-                            (1 - exx1 / ezz1) / n / w
-                            - exy1 / ezz1 * (2.0 / n ** 2 - 2 / n ** 2 * s / (n + s))
-                        )
-                        / exx1
-                        * ezz1
-                        * w
-                        + (ezz4 - ezz1) * s / n / (n + s)
-                        + 0.5
-                        * ezz1
-                        * (
-                            -(1 - exx4 / ezz4) / n / e
-                            - exy4 / ezz4 * (2.0 / n ** 2 - 2 / n ** 2 * s / (n + s))
-                        )
-                        / exx4
-                        * ezz4
-                        * e
+                        (1 - exx1 / ezz1) / n / w
+                        - exy1 / ezz1 * (2.0 / n ** 2 - 2 / n ** 2 * s / (n + s))
                     )
-                    - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                    / exx1
+                    * ezz1
+                    * w
+                    + (ezz4 - ezz1) * s / n / (n + s)
+                    + 0.5
+                    * ezz1
                     * (
-                        -ezz3 * exy2 / n / (n + s) / exx2 * w
-                        + (ezz3 - ezz2) * s / n / (n + s)
-                        - ezz2 * exy3 / n / (n + s) / exx3 * e
+                        -(1 - exx4 / ezz4) / n / e
+                        - exy4 / ezz4 * (2.0 / n ** 2 - 2 / n ** 2 * s / (n + s))
                     )
+                    / exx4
+                    * ezz4
+                    * e
                 )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
+                - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * (
+                    -ezz3 * exy2 / n / (n + s) / exx2 * w
+                    + (ezz3 - ezz2) * s / n / (n + s)
+                    - ezz2 * exy3 / n / (n + s) / exx3 * e
+                )
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzxs = (
-                (
+        bzxs = (
+            (
+                0.5
+                * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                * s
+                * ezz2
+                * ezz1
+                / eyy2
+                * (2 * eyy2 / ezz2 / s ** 2 - eyx2 / ezz2 / s / w)
+                + 0.5
+                * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * s
+                * ezz3
+                * ezz4
+                / eyy3
+                * (2 * eyy3 / ezz3 / s ** 2 + eyx3 / ezz3 / s / e)
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * (
+                    -ezz4 * exy1 / s / (n + s) / exx1 * w
+                    - (ezz4 - ezz1) * n / s / (n + s)
+                    - ezz1 * exy4 / s / (n + s) / exx4 * e
+                )
+                - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * (
                     0.5
-                    * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                    * s
-                    * ezz2
-                    * ezz1
-                    / eyy2
-                    * (2 * eyy2 / ezz2 / s ** 2 - eyx2 / ezz2 / s / w)
-                    + 0.5
-                    * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                    * s
                     * ezz3
-                    * ezz4
-                    / eyy3
-                    * (2 * eyy3 / ezz3 / s ** 2 + eyx3 / ezz3 / s / e)
-                )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
-                    (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                    * (
-                        -ezz4 * exy1 / s / (n + s) / exx1 * w
-                        - (ezz4 - ezz1) * n / s / (n + s)
-                        - ezz1 * exy4 / s / (n + s) / exx4 * e
-                    )
-                    - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
                     * (
-                        0.5
-                        * ezz3
-                        * (
-                            -(1 - exx2 / ezz2) / s / w
-                            - exy2 / ezz2 * (2.0 / s ** 2 - 2 / s ** 2 * n / (n + s))
-                        )
-                        / exx2
-                        * ezz2
-                        * w
-                        - (ezz3 - ezz2) * n / s / (n + s)
-                        + 0.5
-                        * ezz2
-                        * (
-                            (1 - exx3 / ezz3) / s / e
-                            - exy3 / ezz3 * (2.0 / s ** 2 - 2 / s ** 2 * n / (n + s))
-                        )
-                        / exx3
-                        * ezz3
-                        * e
+                        -(1 - exx2 / ezz2) / s / w
+                        - exy2 / ezz2 * (2.0 / s ** 2 - 2 / s ** 2 * n / (n + s))
                     )
-                )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
-
-            bzxe = (
-                (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                * (
-                    0.5 * n * ezz4 * ezz3 / eyy4 * (2.0 / e ** 2 - eyx4 / ezz4 / n / e)
+                    / exx2
+                    * ezz2
+                    * w
+                    - (ezz3 - ezz2) * n / s / (n + s)
                     + 0.5
-                    * s
-                    * ezz3
-                    * ezz4
-                    / eyy3
-                    * (2.0 / e ** 2 + eyx3 / ezz3 / s / e)
-                )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
-                    -0.5
-                    * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                    * ezz1
-                    * (1 - exx4 / ezz4)
-                    / n
-                    / exx4
-                    * ezz4
-                    - 0.5
-                    * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
                     * ezz2
-                    * (1 - exx3 / ezz3)
-                    / s
+                    * (
+                        (1 - exx3 / ezz3) / s / e
+                        - exy3 / ezz3 * (2.0 / s ** 2 - 2 / s ** 2 * n / (n + s))
+                    )
                     / exx3
                     * ezz3
+                    * e
                 )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
+
+        bzxe = (
+            (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+            * (
+                0.5 * n * ezz4 * ezz3 / eyy4 * (2.0 / e ** 2 - eyx4 / ezz4 / n / e)
+                + 0.5 * s * ezz3 * ezz4 / eyy3 * (2.0 / e ** 2 + eyx3 / ezz3 / s / e)
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                -0.5
+                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * ezz1
+                * (1 - exx4 / ezz4)
+                / n
+                / exx4
+                * ezz4
+                - 0.5
+                * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * ezz2
+                * (1 - exx3 / ezz3)
+                / s
+                / exx3
+                * ezz3
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
+
+        bzxw = (
+            (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+            * (
+                0.5 * n * ezz1 * ezz2 / eyy1 * (2.0 / w ** 2 + eyx1 / ezz1 / n / w)
+                + 0.5 * s * ezz2 * ezz1 / eyy2 * (2.0 / w ** 2 - eyx2 / ezz2 / s / w)
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                0.5
+                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * ezz4
+                * (1 - exx1 / ezz1)
+                / n
+                / exx1
+                * ezz1
+                + 0.5
+                * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * ezz3
+                * (1 - exx2 / ezz2)
+                / s
+                / exx2
+                * ezz2
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzxw = (
+        bzxp = (
+            (
                 (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
                 * (
-                    0.5 * n * ezz1 * ezz2 / eyy1 * (2.0 / w ** 2 + eyx1 / ezz1 / n / w)
+                    0.5
+                    * n
+                    * ezz1
+                    * ezz2
+                    / eyy1
+                    * (
+                        -2.0 / w ** 2
+                        - 2 * eyy1 / ezz1 / n ** 2
+                        + k ** 2 * eyy1
+                        - eyx1 / ezz1 / n / w
+                    )
                     + 0.5
                     * s
                     * ezz2
                     * ezz1
                     / eyy2
-                    * (2.0 / w ** 2 - eyx2 / ezz2 / s / w)
+                    * (
+                        -2.0 / w ** 2
+                        - 2 * eyy2 / ezz2 / s ** 2
+                        + k ** 2 * eyy2
+                        + eyx2 / ezz2 / s / w
+                    )
                 )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
+                + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * (
                     0.5
-                    * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                    * n
                     * ezz4
-                    * (1 - exx1 / ezz1)
-                    / n
-                    / exx1
-                    * ezz1
+                    * ezz3
+                    / eyy4
+                    * (
+                        -2.0 / e ** 2
+                        - 2 * eyy4 / ezz4 / n ** 2
+                        + k ** 2 * eyy4
+                        + eyx4 / ezz4 / n / e
+                    )
                     + 0.5
-                    * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                    * s
                     * ezz3
-                    * (1 - exx2 / ezz2)
-                    / s
-                    / exx2
-                    * ezz2
+                    * ezz4
+                    / eyy3
+                    * (
+                        -2.0 / e ** 2
+                        - 2 * eyy3 / ezz3 / s ** 2
+                        + k ** 2 * eyy3
+                        - eyx3 / ezz3 / s / e
+                    )
                 )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
-
-            bzxp = (
-                (
-                    (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * (
+                    0.5
+                    * ezz4
                     * (
-                        0.5
-                        * n
-                        * ezz1
-                        * ezz2
-                        / eyy1
-                        * (
-                            -2.0 / w ** 2
-                            - 2 * eyy1 / ezz1 / n ** 2
-                            + k ** 2 * eyy1
-                            - eyx1 / ezz1 / n / w
-                        )
-                        + 0.5
-                        * s
-                        * ezz2
-                        * ezz1
-                        / eyy2
-                        * (
-                            -2.0 / w ** 2
-                            - 2 * eyy2 / ezz2 / s ** 2
-                            + k ** 2 * eyy2
-                            + eyx2 / ezz2 / s / w
-                        )
+                        -(k ** 2) * exy1
+                        - (1 - exx1 / ezz1) / n / w
+                        - exy1 / ezz1 * (-2.0 / n ** 2 - 2 / n ** 2 * (n - s) / s)
                     )
-                    + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                    / exx1
+                    * ezz1
+                    * w
+                    + (ezz4 - ezz1) * (n - s) / n / s
+                    + 0.5
+                    * ezz1
                     * (
-                        0.5
-                        * n
-                        * ezz4
-                        * ezz3
-                        / eyy4
-                        * (
-                            -2.0 / e ** 2
-                            - 2 * eyy4 / ezz4 / n ** 2
-                            + k ** 2 * eyy4
-                            + eyx4 / ezz4 / n / e
-                        )
-                        + 0.5
-                        * s
-                        * ezz3
-                        * ezz4
-                        / eyy3
-                        * (
-                            -2.0 / e ** 2
-                            - 2 * eyy3 / ezz3 / s ** 2
-                            + k ** 2 * eyy3
-                            - eyx3 / ezz3 / s / e
-                        )
+                        -(k ** 2) * exy4
+                        + (1 - exx4 / ezz4) / n / e
+                        - exy4 / ezz4 * (-2.0 / n ** 2 - 2 / n ** 2 * (n - s) / s)
                     )
+                    / exx4
+                    * ezz4
+                    * e
                 )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
-                    (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * (
+                    0.5
+                    * ezz3
                     * (
-                        0.5
-                        * ezz4
-                        * (
-                            -(k ** 2) * exy1
-                            - (1 - exx1 / ezz1) / n / w
-                            - exy1 / ezz1 * (-2.0 / n ** 2 - 2 / n ** 2 * (n - s) / s)
-                        )
-                        / exx1
-                        * ezz1
-                        * w
-                        + (ezz4 - ezz1) * (n - s) / n / s
-                        + 0.5
-                        * ezz1
-                        * (
-                            -(k ** 2) * exy4
-                            + (1 - exx4 / ezz4) / n / e
-                            - exy4 / ezz4 * (-2.0 / n ** 2 - 2 / n ** 2 * (n - s) / s)
-                        )
-                        / exx4
-                        * ezz4
-                        * e
+                        -(k ** 2) * exy2
+                        + (1 - exx2 / ezz2) / s / w
+                        - exy2 / ezz2 * (-2.0 / s ** 2 + 2 / s ** 2 * (n - s) / n)
                     )
-                    - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                    / exx2
+                    * ezz2
+                    * w
+                    + (ezz3 - ezz2) * (n - s) / n / s
+                    + 0.5
+                    * ezz2
                     * (
-                        0.5
-                        * ezz3
-                        * (
-                            -(k ** 2) * exy2
-                            + (1 - exx2 / ezz2) / s / w
-                            - exy2 / ezz2 * (-2.0 / s ** 2 + 2 / s ** 2 * (n - s) / n)
-                        )
-                        / exx2
-                        * ezz2
-                        * w
-                        + (ezz3 - ezz2) * (n - s) / n / s
-                        + 0.5
-                        * ezz2
-                        * (
-                            -(k ** 2) * exy3
-                            - (1 - exx3 / ezz3) / s / e
-                            - exy3 / ezz3 * (-2.0 / s ** 2 + 2 / s ** 2 * (n - s) / n)
-                        )
-                        / exx3
-                        * ezz3
-                        * e
+                        -(k ** 2) * exy3
+                        - (1 - exx3 / ezz3) / s / e
+                        - exy3 / ezz3 * (-2.0 / s ** 2 + 2 / s ** 2 * (n - s) / n)
                     )
+                    / exx3
+                    * ezz3
+                    * e
                 )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzyne = (
+        bzyne = (
+            0.5
+            * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+            * (1 - eyy4 / ezz4)
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            + 0.5
+            * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+            * exy4
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * exx1
+            * s
+        )
+
+        bzyse = (
+            -0.5
+            * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+            * (1 - eyy3 / ezz3)
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy1
+            * w
+            * eyy2
+            + 0.5
+            * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+            * exy3
+            / ezz3
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * n
+            * exx1
+            * exx4
+        )
+
+        bzynw = (
+            -0.5
+            * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+            * (1 - eyy1 / ezz1)
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy2
+            * e
+            - 0.5
+            * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+            * exy1
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * exx4
+            * s
+        )
+
+        bzysw = (
+            0.5
+            * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+            * (1 - eyy2 / ezz2)
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * e
+            - 0.5
+            * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+            * exy2
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx3
+            * n
+            * exx1
+            * exx4
+        )
+
+        bzyn = (
+            (
                 0.5
+                * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                * ezz1
+                * ezz2
+                / eyy1
+                * (1 - eyy1 / ezz1)
+                / w
+                - 0.5
                 * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * ezz4
+                * ezz3
+                / eyy4
                 * (1 - eyy4 / ezz4)
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                + 0.5
-                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                * exy4
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * exx1
-                * s
-            ) / b
+                / e
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+            * (
+                0.5 * ezz4 * (2.0 / n ** 2 + exy1 / ezz1 / n / w) / exx1 * ezz1 * w
+                + 0.5 * ezz1 * (2.0 / n ** 2 - exy4 / ezz4 / n / e) / exx4 * ezz4 * e
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzyse = (
+        bzys = (
+            (
                 -0.5
+                * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                * ezz2
+                * ezz1
+                / eyy2
+                * (1 - eyy2 / ezz2)
+                / w
+                + 0.5
                 * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * ezz3
+                * ezz4
+                / eyy3
                 * (1 - eyy3 / ezz3)
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy1
-                * w
-                * eyy2
-                + 0.5
-                * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
-                * exy3
-                / ezz3
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * n
-                * exx1
-                * exx4
-            ) / b
-
-            bzynw = (
-                -0.5
-                * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                * (1 - eyy1 / ezz1)
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy2
-                * e
-                - 0.5
-                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                * exy1
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * exx4
-                * s
-            ) / b
+                / e
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+            * (
+                0.5 * ezz3 * (2.0 / s ** 2 - exy2 / ezz2 / s / w) / exx2 * ezz2 * w
+                + 0.5 * ezz2 * (2.0 / s ** 2 + exy3 / ezz3 / s / e) / exx3 * ezz3 * e
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzysw = (
+        bzye = (
+            (
+                (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                * (
+                    -n * ezz2 / eyy1 * eyx1 / e / (e + w)
+                    + (ezz1 - ezz2) * w / e / (e + w)
+                    - s * ezz1 / eyy2 * eyx2 / e / (e + w)
+                )
+                + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * (
+                    0.5
+                    * n
+                    * ezz4
+                    * ezz3
+                    / eyy4
+                    * (
+                        -(1 - eyy4 / ezz4) / n / e
+                        - eyx4 / ezz4 * (2.0 / e ** 2 - 2 / e ** 2 * w / (e + w))
+                    )
+                    + 0.5
+                    * s
+                    * ezz3
+                    * ezz4
+                    / eyy3
+                    * (
+                        (1 - eyy3 / ezz3) / s / e
+                        - eyx3 / ezz3 * (2.0 / e ** 2 - 2 / e ** 2 * w / (e + w))
+                    )
+                    + (ezz4 - ezz3) * w / e / (e + w)
+                )
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
                 0.5
-                * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                * (1 - eyy2 / ezz2)
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
+                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * ezz1
+                * (2 * exx4 / ezz4 / e ** 2 - exy4 / ezz4 / n / e)
+                / exx4
+                * ezz4
                 * e
                 - 0.5
                 * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
-                * exy2
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx3
-                * n
-                * exx1
-                * exx4
-            ) / b
+                * ezz2
+                * (2 * exx3 / ezz3 / e ** 2 + exy3 / ezz3 / s / e)
+                / exx3
+                * ezz3
+                * e
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzyn = (
-                (
+        bzyw = (
+            (
+                (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                * (
                     0.5
-                    * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                    * n
                     * ezz1
                     * ezz2
                     / eyy1
-                    * (1 - eyy1 / ezz1)
-                    / w
-                    - 0.5
-                    * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                    * ezz4
-                    * ezz3
-                    / eyy4
-                    * (1 - eyy4 / ezz4)
-                    / e
-                )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                * (
-                    0.5 * ezz4 * (2.0 / n ** 2 + exy1 / ezz1 / n / w) / exx1 * ezz1 * w
+                    * (
+                        (1 - eyy1 / ezz1) / n / w
+                        - eyx1 / ezz1 * (2.0 / w ** 2 - 2 / w ** 2 * e / (e + w))
+                    )
+                    - (ezz1 - ezz2) * e / w / (e + w)
                     + 0.5
-                    * ezz1
-                    * (2.0 / n ** 2 - exy4 / ezz4 / n / e)
-                    / exx4
-                    * ezz4
-                    * e
-                )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
-
-            bzys = (
-                (
-                    -0.5
-                    * (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                    * s
                     * ezz2
                     * ezz1
                     / eyy2
-                    * (1 - eyy2 / ezz2)
-                    / w
-                    + 0.5
-                    * (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
-                    * ezz3
-                    * ezz4
-                    / eyy3
-                    * (1 - eyy3 / ezz3)
-                    / e
+                    * (
+                        -(1 - eyy2 / ezz2) / s / w
+                        - eyx2 / ezz2 * (2.0 / w ** 2 - 2 / w ** 2 * e / (e + w))
+                    )
                 )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
                 * (
-                    0.5 * ezz3 * (2.0 / s ** 2 - exy2 / ezz2 / s / w) / exx2 * ezz2 * w
-                    + 0.5
-                    * ezz2
-                    * (2.0 / s ** 2 + exy3 / ezz3 / s / e)
-                    / exx3
-                    * ezz3
-                    * e
+                    -n * ezz3 / eyy4 * eyx4 / w / (e + w)
+                    - s * ezz4 / eyy3 * eyx3 / w / (e + w)
+                    - (ezz4 - ezz3) * e / w / (e + w)
                 )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                0.5
+                * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * ezz4
+                * (2 * exx1 / ezz1 / w ** 2 + exy1 / ezz1 / n / w)
+                / exx1
+                * ezz1
+                * w
+                - 0.5
+                * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * ezz3
+                * (2 * exx2 / ezz2 / w ** 2 - exy2 / ezz2 / s / w)
+                / exx2
+                * ezz2
+                * w
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            bzye = (
-                (
-                    (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+        bzyp = (
+            (
+                (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                * (
+                    0.5
+                    * n
+                    * ezz1
+                    * ezz2
+                    / eyy1
                     * (
-                        -n * ezz2 / eyy1 * eyx1 / e / (e + w)
-                        + (ezz1 - ezz2) * w / e / (e + w)
-                        - s * ezz1 / eyy2 * eyx2 / e / (e + w)
+                        -(k ** 2) * eyx1
+                        - (1 - eyy1 / ezz1) / n / w
+                        - eyx1 / ezz1 * (-2.0 / w ** 2 + 2 / w ** 2 * (e - w) / e)
                     )
-                    + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                    + (ezz1 - ezz2) * (e - w) / e / w
+                    + 0.5
+                    * s
+                    * ezz2
+                    * ezz1
+                    / eyy2
                     * (
-                        0.5
-                        * n
-                        * ezz4
-                        * ezz3
-                        / eyy4
-                        * (
-                            -(1 - eyy4 / ezz4) / n / e
-                            - eyx4 / ezz4 * (2.0 / e ** 2 - 2 / e ** 2 * w / (e + w))
-                        )
-                        + 0.5
-                        * s
-                        * ezz3
-                        * ezz4
-                        / eyy3
-                        * (
-                            (1 - eyy3 / ezz3) / s / e
-                            - eyx3 / ezz3 * (2.0 / e ** 2 - 2 / e ** 2 * w / (e + w))
-                        )
-                        + (ezz4 - ezz3) * w / e / (e + w)
+                        -(k ** 2) * eyx2
+                        + (1 - eyy2 / ezz2) / s / w
+                        - eyx2 / ezz2 * (-2.0 / w ** 2 + 2 / w ** 2 * (e - w) / e)
                     )
                 )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
+                + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                * (
                     0.5
-                    * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
-                    * ezz1
-                    * (2 * exx4 / ezz4 / e ** 2 - exy4 / ezz4 / n / e)
-                    / exx4
+                    * n
                     * ezz4
-                    * e
-                    - 0.5
-                    * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
-                    * ezz2
-                    * (2 * exx3 / ezz3 / e ** 2 + exy3 / ezz3 / s / e)
-                    / exx3
                     * ezz3
-                    * e
-                )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
-
-            bzyw = (
-                (
-                    (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
+                    / eyy4
                     * (
-                        0.5
-                        * n
-                        * ezz1
-                        * ezz2
-                        / eyy1
-                        * (
-                            (1 - eyy1 / ezz1) / n / w
-                            - eyx1 / ezz1 * (2.0 / w ** 2 - 2 / w ** 2 * e / (e + w))
-                        )
-                        - (ezz1 - ezz2) * e / w / (e + w)
-                        + 0.5
-                        * s
-                        * ezz2
-                        * ezz1
-                        / eyy2
-                        * (
-                            -(1 - eyy2 / ezz2) / s / w
-                            - eyx2 / ezz2 * (2.0 / w ** 2 - 2 / w ** 2 * e / (e + w))
-                        )
+                        -(k ** 2) * eyx4
+                        + (1 - eyy4 / ezz4) / n / e
+                        - eyx4 / ezz4 * (-2.0 / e ** 2 - 2 / e ** 2 * (e - w) / w)
                     )
-                    + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                    + 0.5
+                    * s
+                    * ezz3
+                    * ezz4
+                    / eyy3
                     * (
-                        -n * ezz3 / eyy4 * eyx4 / w / (e + w)
-                        - s * ezz4 / eyy3 * eyx3 / w / (e + w)
-                        - (ezz4 - ezz3) * e / w / (e + w)
+                        -(k ** 2) * eyx3
+                        - (1 - eyy3 / ezz3) / s / e
+                        - eyx3 / ezz3 * (-2.0 / e ** 2 - 2 / e ** 2 * (e - w) / w)
                     )
+                    + (ezz4 - ezz3) * (e - w) / e / w
                 )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
+            )
+            / ezz4
+            / ezz3
+            / (n * eyy3 + s * eyy4)
+            / ezz2
+            / ezz1
+            / (n * eyy2 + s * eyy1)
+            / (e + w)
+            * eyy4
+            * eyy3
+            * eyy1
+            * w
+            * eyy2
+            * e
+            + (
+                (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                * (
                     0.5
-                    * (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
                     * ezz4
-                    * (2 * exx1 / ezz1 / w ** 2 + exy1 / ezz1 / n / w)
+                    * (
+                        -2.0 / n ** 2
+                        - 2 * exx1 / ezz1 / w ** 2
+                        + k ** 2 * exx1
+                        - exy1 / ezz1 / n / w
+                    )
                     / exx1
                     * ezz1
                     * w
-                    - 0.5
-                    * (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
-                    * ezz3
-                    * (2 * exx2 / ezz2 / w ** 2 - exy2 / ezz2 / s / w)
-                    / exx2
-                    * ezz2
-                    * w
-                )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
-
-            bzyp = (
-                (
-                    (-n * ezz4 * ezz3 / eyy4 - s * ezz3 * ezz4 / eyy3)
-                    * (
-                        0.5
-                        * n
-                        * ezz1
-                        * ezz2
-                        / eyy1
-                        * (
-                            -(k ** 2) * eyx1
-                            - (1 - eyy1 / ezz1) / n / w
-                            - eyx1 / ezz1 * (-2.0 / w ** 2 + 2 / w ** 2 * (e - w) / e)
-                        )
-                        + (ezz1 - ezz2) * (e - w) / e / w
-                        + 0.5
-                        * s
-                        * ezz2
-                        * ezz1
-                        / eyy2
-                        * (
-                            -(k ** 2) * eyx2
-                            + (1 - eyy2 / ezz2) / s / w
-                            - eyx2 / ezz2 * (-2.0 / w ** 2 + 2 / w ** 2 * (e - w) / e)
-                        )
-                    )
-                    + (n * ezz1 * ezz2 / eyy1 + s * ezz2 * ezz1 / eyy2)
+                    + 0.5
+                    * ezz1
                     * (
-                        0.5
-                        * n
-                        * ezz4
-                        * ezz3
-                        / eyy4
-                        * (
-                            -(k ** 2) * eyx4
-                            + (1 - eyy4 / ezz4) / n / e
-                            - eyx4 / ezz4 * (-2.0 / e ** 2 - 2 / e ** 2 * (e - w) / w)
-                        )
-                        + 0.5
-                        * s
-                        * ezz3
-                        * ezz4
-                        / eyy3
-                        * (
-                            -(k ** 2) * eyx3
-                            - (1 - eyy3 / ezz3) / s / e
-                            - eyx3 / ezz3 * (-2.0 / e ** 2 - 2 / e ** 2 * (e - w) / w)
-                        )
-                        + (ezz4 - ezz3) * (e - w) / e / w
+                        -2.0 / n ** 2
+                        - 2 * exx4 / ezz4 / e ** 2
+                        + k ** 2 * exx4
+                        + exy4 / ezz4 / n / e
                     )
+                    / exx4
+                    * ezz4
+                    * e
                 )
-                / ezz4
-                / ezz3
-                / (n * eyy3 + s * eyy4)
-                / ezz2
-                / ezz1
-                / (n * eyy2 + s * eyy1)
-                / (e + w)
-                * eyy4
-                * eyy3
-                * eyy1
-                * w
-                * eyy2
-                * e
-                + (
-                    (ezz3 / exx2 * ezz2 * w + ezz2 / exx3 * ezz3 * e)
+                - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                * (
+                    0.5
+                    * ezz3
                     * (
-                        0.5
-                        * ezz4
-                        * (
-                            -2.0 / n ** 2
-                            - 2 * exx1 / ezz1 / w ** 2
-                            + k ** 2 * exx1
-                            - exy1 / ezz1 / n / w
-                        )
-                        / exx1
-                        * ezz1
-                        * w
-                        + 0.5
-                        * ezz1
-                        * (
-                            -2.0 / n ** 2
-                            - 2 * exx4 / ezz4 / e ** 2
-                            + k ** 2 * exx4
-                            + exy4 / ezz4 / n / e
-                        )
-                        / exx4
-                        * ezz4
-                        * e
+                        -2.0 / s ** 2
+                        - 2 * exx2 / ezz2 / w ** 2
+                        + k ** 2 * exx2
+                        + exy2 / ezz2 / s / w
                     )
-                    - (ezz4 / exx1 * ezz1 * w + ezz1 / exx4 * ezz4 * e)
+                    / exx2
+                    * ezz2
+                    * w
+                    + 0.5
+                    * ezz2
                     * (
-                        0.5
-                        * ezz3
-                        * (
-                            -2.0 / s ** 2
-                            - 2 * exx2 / ezz2 / w ** 2
-                            + k ** 2 * exx2
-                            + exy2 / ezz2 / s / w
-                        )
-                        / exx2
-                        * ezz2
-                        * w
-                        + 0.5
-                        * ezz2
-                        * (
-                            -2.0 / s ** 2
-                            - 2 * exx3 / ezz3 / e ** 2
-                            + k ** 2 * exx3
-                            - exy3 / ezz3 / s / e
-                        )
-                        / exx3
-                        * ezz3
-                        * e
+                        -2.0 / s ** 2
+                        - 2 * exx3 / ezz3 / e ** 2
+                        + k ** 2 * exx3
+                        - exy3 / ezz3 / s / e
                     )
+                    / exx3
+                    * ezz3
+                    * e
                 )
-                / ezz3
-                / ezz2
-                / (w * exx3 + e * exx2)
-                / ezz4
-                / ezz1
-                / (w * exx4 + e * exx1)
-                / (n + s)
-                * exx2
-                * exx3
-                * n
-                * exx1
-                * exx4
-                * s
-            ) / b
+            )
+            / ezz3
+            / ezz2
+            / (w * exx3 + e * exx2)
+            / ezz4
+            / ezz1
+            / (w * exx4 + e * exx1)
+            / (n + s)
+            * exx2
+            * exx3
+            * n
+            * exx1
+            * exx4
+            * s
+        )
 
-            ii = numpy.arange(nx * ny).reshape(nx, ny)
+        pattern = PATTERN_CACHE.get(nx, ny, boundary, "Hz")
 
-            # NORTH boundary
+        # NORTH boundary
 
-            ib = ii[:, -1]
+        ib = pattern.boundary_nodes["n"]
 
-            if boundary[0] == "S":
-                sign = 1
-            elif boundary[0] == "A":
-                sign = -1
-            elif boundary[0] == "0":
-                sign = 0
-            else:
-                raise ValueError("unknown boundary conditions")
+        if boundary[0] == "S":
+            sign = 1
+        elif boundary[0] == "A":
+            sign = -1
+        elif boundary[0] in "0P":
+            sign = 0
+        else:
+            raise ValueError("unknown boundary conditions")
 
-            bzxs[ib] += sign * bzxn[ib]
-            bzxse[ib] += sign * bzxne[ib]
-            bzxsw[ib] += sign * bzxnw[ib]
-            bzys[ib] -= sign * bzyn[ib]
-            bzyse[ib] -= sign * bzyne[ib]
-            bzysw[ib] -= sign * bzynw[ib]
+        bzxs[ib] += sign * bzxn[ib]
+        bzxse[ib] += sign * bzxne[ib]
+        bzxsw[ib] += sign * bzxnw[ib]
+        bzys[ib] -= sign * bzyn[ib]
+        bzyse[ib] -= sign * bzyne[ib]
+        bzysw[ib] -= sign * bzynw[ib]
 
-            # SOUTH boundary
+        # SOUTH boundary
 
-            ib = ii[:, 0]
+        ib = pattern.boundary_nodes["s"]
 
-            if boundary[1] == "S":
-                sign = 1
-            elif boundary[1] == "A":
-                sign = -1
-            elif boundary[1] == "0":
-                sign = 0
-            else:
-                raise ValueError("unknown boundary conditions")
+        if boundary[1] == "S":
+            sign = 1
+        elif boundary[1] == "A":
+            sign = -1
+        elif boundary[1] in "0P":
+            sign = 0
+        else:
+            raise ValueError("unknown boundary conditions")
 
-            bzxn[ib] += sign * bzxs[ib]
-            bzxne[ib] += sign * bzxse[ib]
-            bzxnw[ib] += sign * bzxsw[ib]
-            bzyn[ib] -= sign * bzys[ib]
-            bzyne[ib] -= sign * bzyse[ib]
-            bzynw[ib] -= sign * bzysw[ib]
+        bzxn[ib] += sign * bzxs[ib]
+        bzxne[ib] += sign * bzxse[ib]
+        bzxnw[ib] += sign * bzxsw[ib]
+        bzyn[ib] -= sign * bzys[ib]
+        bzyne[ib] -= sign * bzyse[ib]
+        bzynw[ib] -= sign * bzysw[ib]
 
-            # EAST boundary
+        # EAST boundary
 
-            ib = ii[-1, :]
+        ib = pattern.boundary_nodes["e"]
 
-            if boundary[2] == "S":
-                sign = 1
-            elif boundary[2] == "A":
-                sign = -1
-            elif boundary[2] == "0":
-                sign = 0
-            else:
-                raise ValueError("unknown boundary conditions")
+        if boundary[2] == "S":
+            sign = 1
+        elif boundary[2] == "A":
+            sign = -1
+        elif boundary[2] in "0P":
+            sign = 0
+        else:
+            raise ValueError("unknown boundary conditions")
 
-            bzxw[ib] += sign * bzxe[ib]
-            bzxnw[ib] += sign * bzxne[ib]
-            bzxsw[ib] += sign * bzxse[ib]
-            bzyw[ib] -= sign * bzye[ib]
-            bzynw[ib] -= sign * bzyne[ib]
-            bzysw[ib] -= sign * bzyse[ib]
+        bzxw[ib] += sign * bzxe[ib]
+        bzxnw[ib] += sign * bzxne[ib]
+        bzxsw[ib] += sign * bzxse[ib]
+        bzyw[ib] -= sign * bzye[ib]
+        bzynw[ib] -= sign * bzyne[ib]
+        bzysw[ib] -= sign * bzyse[ib]
 
-            # WEST boundary
+        # WEST boundary
 
-            ib = ii[0, :]
+        ib = pattern.boundary_nodes["w"]
 
-            if boundary[3] == "S":
-                sign = 1
-            elif boundary[3] == "A":
-                sign = -1
-            elif boundary[3] == "0":
-                sign = 0
-            else:
-                raise ValueError("unknown boundary conditions")
-
-            bzxe[ib] += sign * bzxw[ib]
-            bzxne[ib] += sign * bzxnw[ib]
-            bzxse[ib] += sign * bzxsw[ib]
-            bzye[ib] -= sign * bzyw[ib]
-            bzyne[ib] -= sign * bzynw[ib]
-            bzyse[ib] -= sign * bzysw[ib]
-
-            # Assemble sparse matrix
-
-            iall = ii.flatten()
-            i_s = ii[:, :-1].flatten()
-            i_n = ii[:, 1:].flatten()
-            i_e = ii[1:, :].flatten()
-            i_w = ii[:-1, :].flatten()
-            i_ne = ii[1:, 1:].flatten()
-            i_se = ii[1:, :-1].flatten()
-            i_sw = ii[:-1, :-1].flatten()
-            i_nw = ii[:-1, 1:].flatten()
-
-            Izx = numpy.r_[iall, i_w, i_e, i_s, i_n, i_ne, i_se, i_sw, i_nw]
-            Jzx = numpy.r_[iall, i_e, i_w, i_n, i_s, i_sw, i_nw, i_ne, i_se]
-            Vzx = numpy.r_[
-                bzxp[iall],
-                bzxe[i_w],
-                bzxw[i_e],
-                bzxn[i_s],
-                bzxs[i_n],
-                bzxsw[i_ne],
-                bzxnw[i_se],
-                bzxne[i_sw],
-                bzxse[i_nw],
-            ]
-
-            Izy = numpy.r_[iall, i_w, i_e, i_s, i_n, i_ne, i_se, i_sw, i_nw]
-            Jzy = numpy.r_[iall, i_e, i_w, i_n, i_s, i_sw, i_nw, i_ne, i_se] + nx * ny
-            Vzy = numpy.r_[
-                bzyp[iall],
-                bzye[i_w],
-                bzyw[i_e],
-                bzyn[i_s],
-                bzys[i_n],
-                bzysw[i_ne],
-                bzynw[i_se],
-                bzyne[i_sw],
-                bzyse[i_nw],
-            ]
-
-            I = numpy.r_[Izx, Izy]
-            J = numpy.r_[Jzx, Jzy]
-            V = numpy.r_[Vzx, Vzy]
-            B = coo_matrix((V, (I, J))).tocsr()
-
-            HxHy = numpy.r_[Hx, Hy]
-            Hz = B * HxHy.ravel() / 1j
-            Hz = Hz.reshape(Hx.shape)
-
-            # in xc e yc
-            exx = epsxx[1:-1, 1:-1]
-            exy = epsxy[1:-1, 1:-1]
-            eyx = epsyx[1:-1, 1:-1]
-            eyy = epsyy[1:-1, 1:-1]
-            ezz = epszz[1:-1, 1:-1]
-            edet = exx * eyy - exy * eyx
-
-            h = e.reshape(nx, ny)[:-1, :-1]
-            v = n.reshape(nx, ny)[:-1, :-1]
-
-            # in xc e yc
-            Dx = neff * centered2d(Hy) + (
-                Hz[:-1, 1:] + Hz[1:, 1:] - Hz[:-1, :-1] - Hz[1:, :-1]
-            ) / (2j * k * v)
-            Dy = -neff * centered2d(Hx) - (
-                Hz[1:, :-1] + Hz[1:, 1:] - Hz[:-1, 1:] - Hz[:-1, :-1]
-            ) / (2j * k * h)
-            Dz = (
-                (Hy[1:, :-1] + Hy[1:, 1:] - Hy[:-1, 1:] - Hy[:-1, :-1]) / (2 * h)
-                - (Hx[:-1, 1:] + Hx[1:, 1:] - Hx[:-1, :-1] - Hx[1:, :-1]) / (2 * v)
-            ) / (1j * k)
-
-            Ex = (eyy * Dx - exy * Dy) / edet
-            Ey = (exx * Dy - eyx * Dx) / edet
-            Ez = Dz / ezz
-
-            Hzs.append(Hz)
-            Exs.append(Ex)
-            Eys.append(Ey)
-            Ezs.append(Ez)
-
-        return (Hzs, Exs, Eys, Ezs)
+        if boundary[3] == "S":
+            sign = 1
+        elif boundary[3] == "A":
+            sign = -1
+        elif boundary[3] in "0P":
+            sign = 0
+        else:
+            raise ValueError("unknown boundary conditions")
+
+        bzxe[ib] += sign * bzxw[ib]
+        bzxne[ib] += sign * bzxnw[ib]
+        bzxse[ib] += sign * bzxsw[ib]
+        bzye[ib] -= sign * bzyw[ib]
+        bzyne[ib] -= sign * bzynw[ib]
+        bzyse[ib] -= sign * bzysw[ib]
+
+        # Assemble sparse matrix
+
+        # all the coefficients scale with 1 / (neff * k), so a single operator
+        # serves all the modes: Hz = B * [Hx; Hy] / (1j * neff * k)
+        B = pattern.assemble(
+            {
+                (0, 0): dict(
+                    p=bzxp,
+                    e=bzxe,
+                    w=bzxw,
+                    n=bzxn,
+                    s=bzxs,
+                    ne=bzxne,
+                    se=bzxse,
+                    nw=bzxnw,
+                    sw=bzxsw,
+                ),
+                (0, 1): dict(
+                    p=bzyp,
+                    e=bzye,
+                    w=bzyw,
+                    n=bzyn,
+                    s=bzys,
+                    ne=bzyne,
+                    se=bzyse,
+                    nw=bzynw,
+                    sw=bzysw,
+                ),
+            },
+            dtype=numpy.result_type(bzxp, bzyp),
+        )
+
+        # all the modes at once, stacked along the first axis
+        neff = numpy.reshape(neffs, (-1, 1, 1))
+        Hx = numpy.asarray(Hxs)
+        Hy = numpy.asarray(Hys)
+        HxHy = numpy.concatenate([Hx, Hy], axis=1).reshape(len(Hx), -1)
+        Hz = (B @ HxHy.T).T.reshape(Hx.shape) / (1j * neff * k)
+
+        # in xc e yc
+        exx = epsxx[1:-1, 1:-1]
+        exy = epsxy[1:-1, 1:-1]
+        eyx = epsyx[1:-1, 1:-1]
+        eyy = epsyy[1:-1, 1:-1]
+        ezz = epszz[1:-1, 1:-1]
+        edet = exx * eyy - exy * eyx
+
+        h = e.reshape(nx, ny)[:-1, :-1]
+        v = n.reshape(nx, ny)[:-1, :-1]
+
+        # in xc e yc
+        Dx = neff * centered2d(Hy) + (
+            Hz[:, :-1, 1:] + Hz[:, 1:, 1:] - Hz[:, :-1, :-1] - Hz[:, 1:, :-1]
+        ) / (2j * k * v)
+        Dy = -neff * centered2d(Hx) - (
+            Hz[:, 1:, :-1] + Hz[:, 1:, 1:] - Hz[:, :-1, 1:] - Hz[:, :-1, :-1]
+        ) / (2j * k * h)
+        Dz = (
+            (Hy[:, 1:, :-1] + Hy[:, 1:, 1:] - Hy[:, :-1, 1:] - Hy[:, :-1, :-1])
+            / (2 * h)
+            - (Hx[:, :-1, 1:] + Hx[:, 1:, 1:] - Hx[:, :-1, :-1] - Hx[:, 1:, :-1])
+            / (2 * v)
+        ) / (1j * k)
+
+        Ex = (eyy * Dx - exy * Dy) / edet
+        Ey = (exx * Dy - eyx * Dx) / edet
+        Ez = Dz / ezz
+
+        return (list(Hz), list(Ex), list(Ey), list(Ez))
 
     def solve(
-        self, neigs=4, tol=0, guess=None, mode_profiles=True, initial_mode_guess=None
+        self,
+        neigs=4,
+        tol=0,
+        guess=None,
+        mode_profiles=True,
+        initial_mode_guess=None,
+        shift_invert=False,
+        group_index=False,
     ):
         """
         This function finds the eigenmodes.
@@ -2054,6 +2486,21 @@ class _ModeSolverVectorial:
         guess : float
             a guess for the refractive index. Only finds eigenvectors with an effective refractive index
             higher than this value.
+        mode_profiles : bool
+            if False, only the effective indices are found: `self.modes` is left empty
+            and the fields are neither computed nor normalized.
+        initial_mode_guess : 1D or 2D array
+            start vector for the eigen-solver.  A 2D array holds several previous modes
+            as columns (see `interp_mode_guess`), ARPACK combines them into a single start vector.
+        shift_invert : bool
+            always solve in shift-invert mode, finding the modes with the effective index
+            closest to `guess`.  If `guess` is None, the maximum refractive index of the
+            structure is used.  The sparse LU factorization of the shifted matrix is kept
+            in `self.lu` and reused by later solves with the same matrix and shift.
+            `self.factorization_time` and `self.iteration_time` report where the time went.
+        group_index : bool
+            also find the group indices of the modes, in `self.ng`, from the derivative of the
+            eigenvalues (see `group_indices`) rather than by solving at other wavelengths.
 
         Returns
         -------
@@ -2072,25 +2519,68 @@ class _ModeSolverVectorial:
 
         A = self.build_matrix()
 
-        if guess is not None:
-            # calculate shift for eigs function
-            k = 2 * numpy.pi / self.wl
+        k = 2 * numpy.pi / self.wl
+
+        if "P" in self.boundary:
+            # the PML modes have the largest real parts
+            shift_invert = True
+
+        if shift_invert:
+            if guess is None:
+                guess = numpy.max(numpy.real(self.structure.n))
             shift = (guess * k) ** 2
-        else:
-            shift = None
 
-        [eigvals, eigvecs] = eigen.eigs(
-            A,
-            k=neigs,
-            which="LR",
-            tol=0.001,
-            ncv=None,
-            v0=initial_mode_guess,
-            return_eigenvectors=mode_profiles,
-            sigma=shift,
-        )
+            self.factorization_time = 0.0
+            if self.lu is None or not self.lu.matches(A, shift):
+                self.lu = ShiftInvertLU(A, shift)
+                self.factorization_time = self.lu.factorization_time
+
+            if initial_mode_guess is None:
+                # fixed seed, so shift-invert solves are reproducible
+                initial_mode_guess = numpy.random.RandomState(0).rand(A.shape[0])
+
+            t0 = time.perf_counter()
+            [eigvals, eigvecs] = eigs_arpack(
+                A, neigs, self.lu, v0=initial_mode_guess, tol=tol
+            )
+            self.iteration_time = time.perf_counter() - t0
+
+        else:
+            if guess is not None:
+                # calculate shift for eigs function
+                shift = (guess * k) ** 2
+            else:
+                shift = None
+
+            if initial_mode_guess is None:
+                # fixed seed, so the results don't depend on earlier solves
+                initial_mode_guess = numpy.random.RandomState(0).rand(A.shape[0])
+            elif numpy.ndim(initial_mode_guess) == 2:
+                # ARPACK only takes a single start vector
+                initial_mode_guess = numpy.sum(initial_mode_guess, axis=1)
+
+            t0 = time.perf_counter()
+            eigs = eigen.eigs(
+                A,
+                k=neigs,
+                which="LR",
+                tol=tol,
+                ncv=None,
+                v0=initial_mode_guess,
+                return_eigenvectors=mode_profiles or group_index,
+                sigma=shift,
+            )
+            eigvals, eigvecs = eigs if mode_profiles or group_index else (eigs, None)
+            self.factorization_time = 0.0
+            self.iteration_time = time.perf_counter() - t0
 
         neffs = self.wl * scipy.sqrt(eigvals) / (2 * numpy.pi)
+        if group_index:
+            t0 = time.perf_counter()
+            ngs = group_indices(
+                self, A, eigvals, eigvecs, self.lu if shift_invert else None, tol
+            )
+            self.iteration_time += time.perf_counter() - t0
         if mode_profiles:
             Hxs = []
             Hys = []
@@ -2104,6 +2594,8 @@ class _ModeSolverVectorial:
         idx = numpy.flipud(numpy.argsort(neffs))
         neffs = neffs[idx]
         self.neff = neffs
+        self.ng = ngs[idx] if group_index else None
+        self.modes = []
         if mode_profiles:
             tmpx = []
             tmpy = []
@@ -2115,7 +2607,6 @@ class _ModeSolverVectorial:
 
             [Hzs, Exs, Eys, Ezs] = self.compute_other_fields(neffs, Hxs, Hys)
 
-            self.modes = []
             for (neff, Hx, Hy, Hz, Ex, Ey, Ez) in zip(
                 neffs, Hxs, Hys, Hzs, Exs, Eys, Ezs
             ):
@@ -2180,3 +2671,46 @@ class FDMode:
     def intensity(self, x=None, y=None):
         I_TE, I_TM = self.intensityTETM(x, y)
         return I_TE + I_TM
+
+
+def test_stencil_pattern():
+    from scipy.sparse import coo_matrix
+
+    nx, ny = 4, 3
+    blocks = ((0, 0), (0, 1))
+    rng = numpy.random.RandomState(0)
+    coefficients = {b: {d: rng.rand(nx * ny) for d in _STENCIL} for b in blocks}
+
+    A = StencilPattern(nx, ny, tuple(_STENCIL), blocks).assemble(
+        coefficients, dtype=float
+    )
+
+    ii = numpy.arange(nx * ny).reshape(nx, ny)
+    I, J, V = [], [], []
+    for b in blocks:
+        for d, (rows, cols) in _STENCIL.items():
+            I.append(ii[rows].ravel() + b[0] * nx * ny)
+            J.append(ii[cols].ravel() + b[1] * nx * ny)
+            V.append(coefficients[b][d][ii[rows].ravel()])
+    B = coo_matrix(
+        (numpy.concatenate(V), (numpy.concatenate(I), numpy.concatenate(J))),
+        shape=A.shape,
+    ).tocsr()
+
+    assert numpy.allclose(A.toarray(), B.toarray())
+
+
+def test_pattern_cache():
+    cache = PatternCache()
+    a = cache.get(10, 20, "0000", "vectorial")
+    assert cache.get(10, 20, "0000", "vectorial") is a
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.max_bytes = 1.5 * a.nbytes
+    b = cache.get(10, 20, "0000", "Ex")
+    # the semi-vectorial operator has a single block
+    assert b is not a and b.nbytes < a.nbytes
+    assert len(cache) == 2
+    cache.get(30, 20, "0000", "vectorial")
+    assert len(cache) == 1
+    assert cache.get(10, 20, "0000", "vectorial") is not a
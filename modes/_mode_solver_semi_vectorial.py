@@ -18,10 +18,13 @@ class ModeSolverSemiVectorial(_ModeSolver):
         boundary (str): The boundary conditions to use.
             This is a string that identifies the type of boundary conditions applied.
             The following options are available: 'A' - Hx is antisymmetric, Hy is symmetric,
-            'S' - Hx is symmetric and, Hy is antisymmetric, and '0' - Hx and Hy are zero
-            immediately outside of the boundary.
+            'S' - Hx is symmetric and, Hy is antisymmetric, '0' - Hx and Hy are zero
+            immediately outside of the boundary, and 'P' - a perfectly matched layer
+            absorbs the field within `pml_thickness` of the boundary.
             The string identifies all four boundary conditions, in the order:
             North, south, east, west. For example, boundary='000A'. Default is '0000'.
+            North and south are the right and left of the structure, east
+            and west its top and bottom.
         mode_profiles (bool): `True if the the mode-profiles should be found, `False`
             if only the effective indices should be found.
         initial_mode_guess (list): An initial mode guess for the modesolver.
@@ -29,6 +32,13 @@ class ModeSolverSemiVectorial(_ModeSolver):
             will only find TE modes (horizontally polarised to the simulation window),
             if 'Ey', the mode solver will find TM modes (vertically polarised to the
             simulation window).
+        pml_thickness (float): thickness of the 'P' boundaries (um).
+            Default is 0.5.
+        pml_strength (float): imaginary part of the coordinate stretching
+            at the outer edge of the 'P' boundaries, which grows
+            quadratically through the layer.  Default is 5.
+        group_index (bool): `True` to also find the group indices of the
+            modes, `n_gs`, from the same solve.  Default is `False`.
     """
 
     def __init__(
@@ -41,8 +51,14 @@ class ModeSolverSemiVectorial(_ModeSolver):
         semi_vectorial_method="Ex",
         name="mode_solver_semi_vectorial",
         wg=None,
+        pml_thickness=0.5,
+        pml_strength=5.0,
+        group_index=False,
     ):
         self._semi_vectorial_method = semi_vectorial_method
+        self._pml_thickness = pml_thickness
+        self._pml_strength = pml_strength
+        self._group_index = group_index
         _ModeSolver.__init__(
             self, n_eigs, tol, boundary, mode_profiles, initial_mode_guess
         )
@@ -50,6 +66,12 @@ class ModeSolverSemiVectorial(_ModeSolver):
         self.wg = wg
         self.results = None
 
+    def _cache_key_settings(self):
+        return dict(
+            _ModeSolver._cache_key_settings(self),
+            semi_vectorial_method=self._semi_vectorial_method,
+        )
+
     def solve(self):
         """ Find the modes of a given structure.
 
@@ -62,17 +84,26 @@ class ModeSolverSemiVectorial(_ModeSolver):
         structure = self._structure = self.wg
         wavelength = self.wg._wl
         self._ms = ms._ModeSolverSemiVectorial(
-            wavelength, structure, self._boundary, self._semi_vectorial_method
+            wavelength,
+            structure,
+            self._boundary,
+            self._semi_vectorial_method,
+            pml_thickness=self._pml_thickness,
+            pml_strength=self._pml_strength,
         )
         self._ms.solve(
             self._n_eigs,
             self._tol,
             self._mode_profiles,
             initial_mode_guess=self._initial_mode_guess,
+            group_index=self._group_index,
         )
         self.n_effs = self._ms.neff
+        self.n_gs = self._ms.ng
 
         r = {"n_effs": self.n_effs}
+        if self._group_index:
+            r["n_gs"] = self.n_gs
 
         if self._mode_profiles:
             r["modes"] = self._ms.modes
@@ -1,7 +1,6 @@
 import copy
 
 import numpy as np
-import opticalmaterialspy as mat
 
 from modes import _structure_base as sb
 
@@ -69,7 +68,7 @@ class RidgeWaveguide(sb.Slabs):
         n_sub,
         n_wg,
         angle=0,
-        n_clad=[mat.Air().n()],
+        n_clad=[1.0],
         film_thickness="wg_height",
     ):
         sb.Slabs.__init__(self, wavelength, y_step, x_step, sub_width)
@@ -115,7 +114,7 @@ class WgArray(sb.Slabs):
         n_sub,
         n_wg,
         angle=0,
-        n_clad=[mat.Air().n()],
+        n_clad=[1.0],
         film_thickness=None,
     ):
 
@@ -1,13 +1,72 @@
 import abc
+import functools
 import os
 
 import matplotlib.pylab as plt
 import numpy as np
+import pytest
 from scipy import interpolate
 from six import with_metaclass
 
+from modes.materials import dn_dwl
+
+
+def _cached(method):
+    """
+    Caches the value of a structure property until the structure changes,
+    as told by its `_cache_version`.  The cached arrays are read-only.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self):
+        version = self._cache_version()
+        cache = self.__dict__.setdefault("_property_cache", {})
+        if method.__name__ not in cache or cache[method.__name__][0] != version:
+            value = method(self)
+            for a in value if isinstance(value, tuple) else (value,):
+                if isinstance(a, np.ndarray):
+                    a.setflags(write=False)
+            cache[method.__name__] = (version, value)
+        return cache[method.__name__][1]
+
+    return wrapper
+
+
+def _graded_indices(x, changes, step_max, grading):
+    """
+    Returns the indices of a graded subset of the uniform grid points `x`.
+
+    All the points between the first and last index change (`changes[i]`
+    is `True` if the index changes between `x[i]` and `x[i+1]`) are kept.
+    Away from them the step grows by a factor of about `grading` per
+    cell, up to `step_max`.
+    """
+    changes = np.flatnonzero(changes)
+    step = x[1] - x[0]
+    if not changes.size or step_max <= step:
+        return np.arange(x.size)
+
+    x_fine_min = x[changes[0]]
+    x_fine_max = x[changes[-1] + 1]
+    distance = np.maximum(x_fine_min - x, x - x_fine_max).clip(0)
+    steps = np.minimum(step_max, step + (grading - 1) * distance) + 0.01 * step
+
+    indices = [0]
+    while indices[-1] < x.size - 1:
+        i = indices[-1]
+        j = np.searchsorted(x, x[i] + steps[i], "right") - 1
+        while j > i + 1 and x[j] - x[i] > steps[j]:
+            j -= 1
+        indices.append(max(j, i + 1))
+    return np.array(indices)
+
 
 class _AbstractStructure(with_metaclass(abc.ABCMeta)):
+    _x_mesh = None
+    _y_mesh = None
+    _version = 0
+    subpixel = False
+
     @abc.abstractproperty
     def n(self):
         """
@@ -16,6 +75,26 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
         """
         pass
 
+    def _cache_version(self):
+        """
+        Returns the state the cached properties depend on: the grid, the
+        subpixel option and `_version`, which is bumped whenever materials
+        are written or their indices change.
+        """
+        return (
+            self._version,
+            self.x_min,
+            self.x_max,
+            self.x_step,
+            self.y_min,
+            self.y_max,
+            self.y_step,
+            self.subpixel,
+            id(self._x_mesh),
+            id(self._y_mesh),
+            id(getattr(self, "_n", None)),
+        )
+
     @property
     def x_pts(self):
         """
@@ -45,6 +124,7 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
         return 0.5 * (self.y_max + self.y_min)
 
     @property
+    @_cached
     def xc(self):
         """
         np.array: The centre points of the x points.
@@ -52,6 +132,7 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
         return 0.5 * (self.x[1:] + self.x[:-1])
 
     @property
+    @_cached
     def yc(self):
         """
         np.array: The centre points of the y points.
@@ -101,6 +182,7 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
         return self.yc[-1]
 
     @property
+    @_cached
     def x(self):
         """
         np.array: The grid points in x.
@@ -112,11 +194,14 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
             x = np.arange(
                 self.x_min, self.x_max + self.x_step - self.y_step * 0.1, self.x_step
             )
+            if self._x_mesh is not None:
+                x = x[self._x_mesh]
         else:
             x = np.array([])
         return x
 
     @property
+    @_cached
     def y(self):
         """
         np.array: The grid points in y.
@@ -126,11 +211,14 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
             and self.y_min != self.y_max
         ):
             y = np.arange(self.y_min, self.y_max - self.y_step * 0.1, self.y_step)
+            if self._y_mesh is not None:
+                y = y[self._y_mesh]
         else:
             y = np.array([])
         return y
 
     @property
+    @_cached
     def eps(self):
         """
         np.array: A grid of permittivies representing
@@ -138,6 +226,117 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
         """
         return self.n ** 2
 
+    @property
+    @_cached
+    def eps_c(self):
+        """
+        np.array: The permittivity at the centre points `xc`, `yc`,
+        the bilinear interpolation of `eps` sampled directly on the grid.
+        """
+        if self.subpixel:
+            return self._eps_c_subpixel()
+        eps = self.eps
+        return 0.25 * (eps[1:, 1:] + eps[1:, :-1] + eps[:-1, 1:] + eps[:-1, :-1])
+
+    def _eps_c_subpixel(self, rows=None):
+        """
+        Returns the permittivity tensor (epsxx, epsxy, epsyx, epsyy, epszz)
+        at the centre points `xc`, `yc`, averaged over the painted geometry
+        (`rows`, by default `_row_materials`).
+
+        Every row of grid points keeps the materials painted on it with
+        their exact x extents, so the fraction of a cell filled by each
+        material does not depend on where the edges fall on the grid.
+        Across the x interfaces of a row `epsxx` is the harmonic mean of the
+        permittivity and `epsyy`, `epszz` the arithmetic mean.  The y
+        interfaces lie between two rows, halfway through the cells, and
+        average the other way round.
+        """
+        x = self.x
+        dx = np.diff(x)
+        averages = {}
+        arithmetic = []
+        harmonic = []
+        for row in self._row_materials if rows is None else rows:
+            row = tuple(row)
+            if row not in averages:
+                x_edges = [
+                    x_edge for x_min, x_max, _ in row for x_edge in (x_min, x_max)
+                ]
+                edges = np.union1d(x, np.clip(x_edges, x[0], x[-1]))
+                centres = 0.5 * (edges[1:] + edges[:-1])
+                eps = np.empty(centres.size, complex)
+                for x_min, x_max, n in row:
+                    eps[(x_min <= centres) & (centres <= x_max)] = n ** 2
+
+                nodes = np.searchsorted(edges, x)
+                width = np.diff(edges)
+                eps_int = np.r_[0, np.cumsum(eps * width)][nodes]
+                inv_eps_int = np.r_[0, np.cumsum(width / eps)][nodes]
+                averages[row] = (np.diff(eps_int) / dx, dx / np.diff(inv_eps_int))
+            arithmetic.append(averages[row][0])
+            harmonic.append(averages[row][1])
+        arithmetic = np.array(arithmetic)
+        harmonic = np.array(harmonic)
+
+        epsxx = 0.5 * (harmonic[1:] + harmonic[:-1])
+        epsyy = 2.0 / (1.0 / arithmetic[1:] + 1.0 / arithmetic[:-1])
+        epszz = 0.5 * (arithmetic[1:] + arithmetic[:-1])
+        zeros = np.zeros_like(epszz)
+        return epsxx, zeros, zeros, epsyy, epszz
+
+    @property
+    def dn_dwl(self):
+        """
+        np.array: The dispersion dn/dwl (1/um) of the refractive index
+        profile.  Structures drawn with refractive indices rather than
+        materials are not dispersive.
+        """
+        return np.zeros_like(self.n)
+
+    @property
+    def _row_dn(self):
+        """The dispersion of the materials of `_row_materials`."""
+        return [
+            [(x_min, x_max, 0.0) for x_min, x_max, _ in row]
+            for row in self._row_materials
+        ]
+
+    @property
+    @_cached
+    def deps_c_dwl(self):
+        """
+        np.array: The derivative of `eps_c` with respect to the wavelength
+        (1/um), from the dispersion `dn_dwl` of the materials.  A tuple
+        like `eps_c` with subpixel averaging.
+        """
+        if self.subpixel:
+            return self._deps_c_dwl_subpixel()
+        deps = 2 * self.n * self.dn_dwl
+        return 0.25 * (deps[1:, 1:] + deps[1:, :-1] + deps[:-1, 1:] + deps[:-1, :-1])
+
+    def _deps_c_dwl_subpixel(self, step=1e-3):
+        """
+        The subpixel averages are rational functions of the indices, they
+        are differentiated by central differences along the dispersion of
+        the materials, `step` (um) times dn/dwl.
+        """
+        rows = []
+        for sign in (1, -1):
+            rows.append(
+                [
+                    [
+                        (x_min, x_max, n + sign * step * dn)
+                        for (x_min, x_max, n), (_, _, dn) in zip(row, row_dn)
+                    ]
+                    for row, row_dn in zip(self._row_materials, self._row_dn)
+                ]
+            )
+        return tuple(
+            (eps_p - eps_m) / (2 * step)
+            for eps_p, eps_m in zip(*[self._eps_c_subpixel(r) for r in rows])
+        )
+
     @property
     def eps_func(self):
         """
@@ -145,10 +344,7 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
             returns the permittivity profile of the structure,
             interpolating if necessary.
         """
-        interp_real = interpolate.interp2d(self.x, self.y, self.eps.real)
-        interp_imag = interpolate.interp2d(self.x, self.y, self.eps.imag)
-        interp = lambda x, y: interp_real(x, y) + 1.0j * interp_imag(x, y)
-        return interp
+        return self._grid_func(self.eps)
 
     @property
     def n_func(self):
@@ -157,39 +353,112 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
             returns the refractive index profile of the structure,
             interpolating if necessary.
         """
-        return interpolate.interp2d(self.x, self.y, self.n)
+        return self._grid_func(self.n)
+
+    def _grid_func(self, values):
+        """
+        Returns a function that bilinearly interpolates `values`, given on
+        the `x`, `y` grid, on the grid of the `x` and `y` values passed to it.
+        Points outside of the structure take the values at its edges.
+        """
+        x = self.x
+        y = self.y
+        interp = interpolate.RegularGridInterpolator((y, x), values)
+
+        def func(x_new, y_new):
+            x_new = np.clip(np.sort(np.atleast_1d(x_new)), x[0], x[-1])
+            y_new = np.clip(np.sort(np.atleast_1d(y_new)), y[0], y[-1])
+            yy, xx = np.meshgrid(y_new, x_new, indexing="ij")
+            return interp((yy, xx))
+
+        return func
 
     def _add_triangular_sides(
-        self,
-        xy_mask,
-        angle,
-        y_top_right,
-        y_bot_left,
-        x_top_right,
-        x_bot_left,
-        n_material,
+        self, angle, y_top_right, y_bot_left, x_top_right, x_bot_left, n_material
     ):
-        angle = np.radians(angle)
-        trap_len = (y_top_right - y_bot_left) / np.tan(angle)
-        num_x_iterations = trap_len / self.x_step
-        y_per_iteration = num_x_iterations / self.y_pts
-
-        lhs_x_start_index = int(x_bot_left / self.x_step + 0.5)
-        rhs_x_stop_index = int(x_top_right / self.x_step + 1 + 0.5)
-
-        running_removal_float = y_per_iteration
-        for i, _ in enumerate(xy_mask):
-            if running_removal_float >= 1:
-                removal_int = int(round(running_removal_float))
-                lhs_x_start_index -= removal_int
-                rhs_x_stop_index += removal_int
-                running_removal_float -= removal_int
-            running_removal_float += y_per_iteration
-
-            xy_mask[i][:lhs_x_start_index] = False
-            xy_mask[i][lhs_x_start_index:rhs_x_stop_index] = True
-
-        self.n[xy_mask] = n_material
+        """
+        Widens the rectangle written by `_add_material` into a trapezoid
+        whose sidewalls are at `angle` degrees: the i-th of its N rows is
+        widened by (i + 1) / N of the sidewall length on each side.
+
+        The edges of all the rows are computed at once; the grid points
+        nearest to them bound the points that are written.
+        """
+        rows = slice(
+            np.searchsorted(self.y, y_bot_left, "left"),
+            np.searchsorted(self.y, y_top_right, "right"),
+        )
+        n_rows = rows.stop - rows.start
+        if not n_rows:
+            return self.n
+
+        trap_len = (y_top_right - y_bot_left) / np.tan(np.radians(angle))
+        widening = np.arange(1, n_rows + 1) * trap_len / n_rows
+        x_left = x_bot_left - widening
+        x_right = x_top_right + widening
+
+        col_left = np.floor((x_left - self.x_min) / self.x_step + 0.5).astype(int)
+        col_right = np.floor((x_right - self.x_min) / self.x_step + 0.5).astype(int)
+        cols = slice(max(col_left.min(), 0), col_right.max() + 1)
+        col = np.arange(cols.start, cols.stop)
+        inside = (col_left[:, None] <= col) & (col <= col_right[:, None])
+        self._n[rows, cols][inside] = n_material
+        self._version += 1
+
+        for i, x_edges in enumerate(zip(x_left, x_right), rows.start):
+            self._row_materials[i].append(x_edges + (n_material,))
+        return self.n
+
+    def _add_polygon(self, vertices, n_material):
+        """
+        A low-level function that allows writing a polygon refractive
+        index profile to a `Structure`.
+
+        The crossings of every row of grid points with the edges of the
+        polygon are computed at once.  The points between pairs of
+        crossings (even-odd rule) are written, and the exact extents of
+        the pairs are kept for the subpixel averaging of `eps_c`.
+
+        Args:
+            vertices (list): The (x, y) coordinates of the vertices of
+                the polygon.
+            n_material (float): The refractive index of the points
+                encompassed by the polygon.
+        """
+        x0, y0 = np.asarray(vertices, dtype=float).T
+        x1 = np.roll(x0, -1)
+        y1 = np.roll(y0, -1)
+
+        # only the rows and columns within the bounding box are visited
+        rows = slice(
+            np.searchsorted(self.y, y0.min(), "left"),
+            np.searchsorted(self.y, y0.max(), "left"),
+        )
+        cols = slice(
+            np.searchsorted(self.x, x0.min(), "left"),
+            np.searchsorted(self.x, x0.max(), "right"),
+        )
+        y = self.y[rows, None]
+        x = self.x[cols]
+
+        crossing = (y0 <= y) != (y1 <= y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        x_crossing = np.sort(np.where(crossing, x_crossing, np.inf), axis=1)
+        pairs = x_crossing.shape[1] // 2
+        x_left = x_crossing[:, 0 : 2 * pairs : 2]
+        x_right = x_crossing[:, 1 : 2 * pairs : 2]
+
+        inside = np.zeros((y.size, x.size), bool)
+        for j in range(pairs):
+            inside |= (x_left[:, j, None] <= x) & (x <= x_right[:, j, None])
+        self._n[rows, cols][inside] = n_material
+        self._version += 1
+
+        for i, j in zip(*np.nonzero(np.isfinite(x_right))):
+            self._row_materials[rows.start + i].append(
+                (x_left[i, j], x_right[i, j], n_material)
+            )
         return self.n
 
     def _add_material(
@@ -215,21 +484,22 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
                 is useful for creating a ridge with angled
                 sidewalls.
         """
-        x_mask = np.logical_and(x_bot_left <= self.x, self.x <= x_top_right)
-        y_mask = np.logical_and(y_bot_left <= self.y, self.y <= y_top_right)
-
-        xy_mask = np.kron(y_mask, x_mask).reshape((y_mask.size, x_mask.size))
-        self.n[xy_mask] = n_material
+        rows = slice(
+            np.searchsorted(self.y, y_bot_left, "left"),
+            np.searchsorted(self.y, y_top_right, "right"),
+        )
+        cols = slice(
+            np.searchsorted(self.x, x_bot_left, "left"),
+            np.searchsorted(self.x, x_top_right, "right"),
+        )
+        self._n[rows, cols] = n_material
+        self._version += 1
+        for i in range(rows.start, rows.stop):
+            self._row_materials[i].append((x_bot_left, x_top_right, n_material))
 
         if angle:
             self._add_triangular_sides(
-                xy_mask,
-                angle,
-                y_top_right,
-                y_bot_left,
-                x_top_right,
-                x_bot_left,
-                n_material,
+                angle, y_top_right, y_bot_left, x_top_right, x_bot_left, n_material
             )
 
         return self.n
@@ -270,11 +540,7 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
             plt.title(args["title"])
             plt.xlabel("$x$")
             plt.ylabel("$y$")
-            plt.imshow(
-                np.flipud(heatmap),
-                extent=(args["x_min"], args["x_max"], args["y_min"], args["y_max"]),
-                aspect="auto",
-            )
+            plt.pcolormesh(self.x, self.y, np.flipud(heatmap), shading="nearest")
             plt.colorbar()
             plt.savefig(filename_image)
 
@@ -283,6 +549,24 @@ class _AbstractStructure(with_metaclass(abc.ABCMeta)):
         # return self.n.__str__()
 
 
+class _ConstantIndex:
+    """
+    Wavelength independent refractive index.
+
+    Unlike a closure, it can be pickled along with the structure,
+    e.g. to send it to a worker process.
+    """
+
+    def __init__(self, n):
+        self.n = n
+
+    def __call__(self, wl):
+        return self.n
+
+    def derivative(self, wl):
+        return 0.0
+
+
 class Structure(_AbstractStructure):
     def __init__(
         self, x_step, y_step, x_max, y_max, x_min=0.0, y_min=0.0, n_background=1.0
@@ -295,12 +579,56 @@ class Structure(_AbstractStructure):
         self.y_step = y_step
         self.n_background = n_background
         self._n = np.ones((self.y.size, self.x.size), "complex_") * n_background
+        self._row_materials = [[(-np.inf, np.inf, n_background)] for _ in self.y]
+        self.subpixel = False
         self.name = None
         self.settings = {}
 
     @property
     def n(self):
-        return self._n
+        # read-only: indices written in place would leave the cached
+        # permittivities stale, `_add_material` bumps their version
+        n = self._n.view()
+        n.setflags(write=False)
+        return n
+
+    @classmethod
+    def from_index(
+        cls,
+        n,
+        wavelength,
+        x_step,
+        y_step,
+        x_max,
+        y_max,
+        x_min=0.0,
+        y_min=0.0,
+        mesh=(None, None),
+        row_materials=None,
+    ):
+        """
+        Returns a structure with the refractive index profile `n`.
+
+        Args:
+            n (np.array): The refractive index of each grid point.
+            wavelength (float): The wavelength (um) `n` is evaluated at.
+            x_step, y_step, x_max, y_max, x_min, y_min (float): The
+                uniform grid, as for `Structure`.
+            mesh (tuple): The indices of the x and y points of the uniform
+                grid kept by a graded mesh.  Default is `(None, None)`, the
+                uniform grid.
+            row_materials (list): The `(x_min, x_max, n)` materials painted
+                on each row, in order, for subpixel averaging.  Default is
+                `None`, no subpixel averaging.
+        """
+        structure = cls(x_step, y_step, x_max, y_max, x_min, y_min)
+        structure._x_mesh, structure._y_mesh = mesh
+        structure._n = np.array(n, dtype=complex)
+        structure._wl = wavelength
+        if row_materials is not None:
+            structure._row_materials = row_materials
+            structure.subpixel = True
+        return structure
 
 
 class Slabs(_AbstractStructure):
@@ -333,6 +661,10 @@ class Slabs(_AbstractStructure):
             and the value is the :class:`Slab` object.
         slab_count (int): The number of :class:`Slab` objects
             added so far.
+        subpixel (bool): `True` if `eps_c` averages the permittivity
+            anisotropically over the exact extents of the materials in
+            each cell, which keeps the effective indices accurate on
+            coarser grids.  Default is `False`.
     """
 
     def __init__(self, wavelength, y_step, x_step, x_max, x_min=0.0):
@@ -348,6 +680,7 @@ class Slabs(_AbstractStructure):
         self.slabs = {}
         self.slab_count = 0
         self._next_start = 0.0
+        self.subpixel = False
         self.name = None
         self.settings = {}
 
@@ -368,10 +701,7 @@ class Slabs(_AbstractStructure):
         name = str(self.slab_count)
 
         if not callable(n_background):
-
-            def n_back(wl):
-                return n_background
-
+            n_back = _ConstantIndex(n_background)
         else:
             n_back = n_background
 
@@ -415,34 +745,101 @@ class Slabs(_AbstractStructure):
         Args:
             wavelength (float): The new wavelength.
         """
-        for name, slab in self.slabs.items():
-            const_args = slab._const_args
-            mat_args = slab._mat_params
-
-            const_args[8] = wavelength
-
-            s = Slab(*const_args)
-            for mat_arg in mat_args:
-                s.add_material(*mat_arg)
-
-            self.slabs[name] = s
+        for slab in self.slabs.values():
+            slab.change_wavelength(wavelength)
 
         self._wl = wavelength
 
     @property
+    @_cached
     def n(self):
         """
         np.array: The refractive index profile matrix
         of the current slab.
         """
-        try:
-            n_mat = self.slabs["0"].n
-            for s in range(1, self.slab_count):
-                n_mat = np.vstack((self.slabs[str(s)].n, n_mat))
-        except KeyError:
-            n_mat = None
+        if not self.slab_count:
+            return None
+        n_mat = np.vstack(
+            [self.slabs[str(s)].n for s in reversed(range(self.slab_count))]
+        )
+        if self._x_mesh is not None:
+            n_mat = n_mat[np.ix_(self._y_mesh, self._x_mesh)]
         return n_mat
 
+    @property
+    @_cached
+    def dn_dwl(self):
+        """
+        np.array: The dispersion dn/dwl (1/um) of the refractive index
+        profile, from the materials of the slabs.
+        """
+        dn_mat = np.vstack(
+            [self.slabs[str(s)].dn_dwl for s in reversed(range(self.slab_count))]
+        )
+        if self._x_mesh is not None:
+            dn_mat = dn_mat[np.ix_(self._y_mesh, self._x_mesh)]
+        return dn_mat
+
+    def _cache_version(self):
+        slab_versions = tuple(
+            (name, slab._cache_version()) for name, slab in self.slabs.items()
+        )
+        return _AbstractStructure._cache_version(self) + slab_versions
+
+    @property
+    @_cached
+    def _row_materials(self):
+        return self._rows("_n_materials")
+
+    @property
+    @_cached
+    def _row_dn(self):
+        return self._rows("_dn_materials")
+
+    def _rows(self, values):
+        """The material rows of the slabs, with the `values` of the materials."""
+        rows = []
+        for s in reversed(range(self.slab_count)):
+            slab = self.slabs[str(s)]
+            n = getattr(slab, values)
+            rows += [
+                [(x_min, x_max, n[m]) for x_min, x_max, m in row]
+                for row in slab._row_materials
+            ]
+        if self._y_mesh is not None:
+            rows = [rows[i] for i in self._y_mesh]
+        return rows
+
+    def grade_mesh(self, x_step_max=None, y_step_max=None, grading=1.2):
+        """
+        Coarsens the grid away from the waveguides.
+
+        The structure keeps its grid steps over the span of its index
+        changes (the core, sidewalls and slab interfaces), and only a
+        subset of the grid points is kept outside of it, with steps growing
+        geometrically up to `x_step_max` and `y_step_max`.  The mode
+        solvers handle the non-uniform grid.  Call it once all the slabs
+        and materials have been added.
+
+        Args:
+            x_step_max (float): The maximum step in x.  Default is `None`,
+                keeping the uniform steps in x.
+            y_step_max (float): The maximum step in y.  Default is `None`,
+                keeping the uniform steps in y.
+            grading (float): The growth factor of neighbouring steps.
+                Default is 1.2.
+        """
+        self._x_mesh = self._y_mesh = None
+        n = self.n
+        x = self.x
+        y = self.y
+        self._x_mesh = _graded_indices(
+            x, np.any(n[:, 1:] != n[:, :-1], axis=0), x_step_max or 0, grading
+        )
+        self._y_mesh = _graded_indices(
+            y, np.any(n[1:] != n[:-1], axis=1), y_step_max or 0, grading
+        )
+
     def __getitem__(self, slab_name):
         return self.slabs[str(slab_name)]
 
@@ -488,23 +885,44 @@ class Slab(Structure):
         self.position = Slab.position
         Slab.position += 1
 
-        Structure.__init__(
-            self, x_step, y_step, x_max, y_max, x_min, y_min, n_background(self._wl)
-        )
-
-        self._const_args = [
-            name,
-            x_step,
-            y_step,
-            x_max,
-            y_max,
-            x_min,
-            y_min,
-            n_background,
-            wavelength,
-        ]
+        # the slab is drawn with material IDs, `n` looks up their indices
+        Structure.__init__(self, x_step, y_step, x_max, y_max, x_min, y_min, 0)
+        self._n = self._n.real.astype(np.uint16)
+        self.n_background = n_background(self._wl)
+        self._materials = [n_background]
+        self._n_materials = np.array([self.n_background], complex)
         self._mat_params = []
 
+    @property
+    @_cached
+    def n(self):
+        return self._n_materials[self._n]
+
+    @property
+    @_cached
+    def _dn_materials(self):
+        return np.array([dn_dwl(m, self._wl) for m in self._materials], complex)
+
+    @property
+    @_cached
+    def dn_dwl(self):
+        return self._dn_materials[self._n]
+
+    def change_wavelength(self, wavelength):
+        """
+        Changes the wavelength of the slab.
+
+        Only the refractive indices of its materials are evaluated again,
+        the material map is kept.
+
+        Args:
+            wavelength (float): The new wavelength.
+        """
+        self._wl = wavelength
+        self._n_materials = np.array([m(wavelength) for m in self._materials], complex)
+        self._version += 1
+        self.n_background = self._n_materials[0]
+
     def add_material(self, x_min, x_max, n, angle=0):
         """
         Add a refractive index between two x-points.
@@ -526,12 +944,16 @@ class Slab(Structure):
         self._mat_params.append([x_min, x_max, n, angle])
 
         if not callable(n):
-            n_mat = lambda wl: n
+            n_mat = _ConstantIndex(n)
         else:
             n_mat = n
 
+        material_id = len(self._materials)
+        self._materials.append(n_mat)
+        self._n_materials = np.append(self._n_materials, n_mat(self._wl))
+
         Structure._add_material(
-            self, x_min, self.y_min, x_max, self.y_max, n_mat(self._wl), angle
+            self, x_min, self.y_min, x_max, self.y_max, material_id, angle
         )
         return self.n
 
@@ -708,6 +1130,14 @@ class StructureAni:
         eps_ani = [a.n ** 2 for a in self.axes]
         return eps_ani
 
+    @property
+    def eps_c(self):
+        return tuple(axis.eps_c for axis in self.axes)
+
+    @property
+    def deps_c_dwl(self):
+        return tuple(axis.deps_c_dwl for axis in self.axes)
+
     @property
     def eps_func(self):
         return lambda x, y: tuple(axis.eps_func(x, y) for axis in self.axes)
@@ -757,15 +1187,8 @@ class StructureAni:
                 plt.title(args["title"])
                 plt.xlabel("$x$")
                 plt.ylabel("$y$")
-                plt.imshow(
-                    np.flipud(heatmap),
-                    extent=(
-                        args["x_min"],
-                        args["x_max"],
-                        args["y_min"],
-                        args["y_max"],
-                    ),
-                    aspect="auto",
+                plt.pcolormesh(
+                    self.xx.x, self.xx.y, np.flipud(heatmap), shading="nearest"
                 )
                 plt.colorbar()
                 plt.savefig(filename_image)
@@ -786,3 +1209,61 @@ class StructureAni:
                 axis.change_wavelength(wavelength)
         self.xx, self.xy, self.yx, self.yy, self.zz = self.axes
         self._wl = wavelength
+
+
+def test_add_polygon():
+    s = Structure(0.01, 0.01, 2.0, 1.0, n_background=1.0)
+    s.subpixel = True
+    triangle = [(0.503, 0.205), (1.497, 0.205), (1.0, 0.795)]
+    s._add_polygon(triangle, 2.0)
+
+    xx, yy = np.meshgrid(s.x, s.y)
+    half_width = 0.497 * (0.795 - yy) / 0.59
+    inside = (yy >= 0.205) & (yy < 0.795) & (np.abs(xx - 1.0) <= half_width)
+    assert np.array_equal(s.n.real == 2.0, inside)
+
+    # the subpixel fill of the rows sums up to the area of the triangle
+    epszz = s.eps_c[-1].real
+    area = np.sum(epszz - 1.0) * s.x_step * s.y_step / (2.0 ** 2 - 1.0)
+    assert np.isclose(area, 0.5 * 0.994 * 0.59, rtol=1e-2)
+
+
+def test_structure_n_read_only():
+    s = Structure(0.1, 0.1, 1.0, 1.0)
+    eps = s.eps
+    with pytest.raises(ValueError):
+        s.n[3:5, 3:5] = 3.0
+    s._add_material(0.3, 0.3, 0.5, 0.5, 3.0)
+    assert not np.array_equal(s.eps, eps)
+
+
+def test_slabs_change_wavelength():
+    def slabs(wavelength):
+        s = Slabs(wavelength, 0.02, 0.02, 2.0)
+        s.add_slab(0.5, lambda wl: 1.45 - 0.01 * wl)
+        k = s.add_slab(0.22, 1.0)
+        s.slabs[k].add_material(0.7, 1.25, lambda wl: 3.5 - 0.1 * wl, angle=80)
+        s.add_slab(0.5, 1.0)
+        s.subpixel = True
+        return s
+
+    s = slabs(1.3)
+    s.change_wavelength(1.55)
+    assert np.array_equal(s.n, slabs(1.55).n)
+    assert all(np.array_equal(a, b) for a, b in zip(s.eps_c, slabs(1.55).eps_c))
+
+
+def test_slabs_cache():
+    s = Slabs(1.55, 0.02, 0.02, 2.0)
+    s.add_slab(0.5, 1.44)
+    n = s.n
+    assert s.n is n and not n.flags.writeable
+
+    k = s.add_slab(0.22, 1.0)
+    assert s.n.shape[0] > n.shape[0]
+    n = s.n
+    s.slabs[k].add_material(0.7, 1.25, 3.47)
+    assert not np.array_equal(s.n, n)
+    assert not isinstance(s.eps_c, tuple)
+    s.subpixel = True
+    assert isinstance(s.eps_c, tuple)
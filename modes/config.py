@@ -3,7 +3,10 @@
 
 __all__ = ["CONFIG"]
 
+import os
 import pathlib
+import stat
+import time
 
 import matplotlib.pylab as plt
 
@@ -16,17 +19,144 @@ cwd_config = cwd / "config.yml"
 home_config = home / ".config" / "modes.yml"
 module_path = pathlib.Path(__file__).parent.absolute()
 repo_path = module_path.parent
-cache = home / ".local" / "cache" / "modes"
-cache.mkdir(exist_ok=True, parents=True)
 
 
 class Config:
     module = module_path
     repo = repo_path
     cache = home / ".local" / "cache" / "modes"
+    cache_compress = False
+    # cache limits, enforced after every cache write (None: no limit)
+    cache_max_bytes = None
+    cache_max_age = None  # seconds
+
+    def __init__(self):
+        self._cache_counters = dict(hits=0, misses=0, bytes_read=0, bytes_written=0)
+
+    def cache_dir(self):
+        """returns the cache directory, creating it on first use"""
+        self.cache.mkdir(exist_ok=True, parents=True)
+        return self.cache
+
+    def cache_hit(self, path):
+        """
+        records a cache hit, marking `path` as recently used.
+        A file pruned by another process meanwhile counts as a miss.
+        """
+        try:
+            size = path.stat().st_size
+            os.utime(path)
+        except FileNotFoundError:
+            self.cache_miss()
+            return
+        self._cache_counters["hits"] += 1
+        self._cache_counters["bytes_read"] += size
+
+    def cache_miss(self):
+        self._cache_counters["misses"] += 1
+
+    def cache_write(self, path):
+        """records a cache write and evicts files beyond the cache limits"""
+        try:
+            self._cache_counters["bytes_written"] += path.stat().st_size
+        except FileNotFoundError:  # pruned by another process
+            pass
+        if self.cache_max_bytes is not None or self.cache_max_age is not None:
+            self.cache_prune()
+
+    def _cache_files(self):
+        """returns the cache files and their `stat`, least recently used first"""
+        if not self.cache.exists():
+            return []
+        files = []
+        for f in self.cache.iterdir():
+            # skip the temporary files of writes in progress
+            if f.name.startswith("."):
+                continue
+            try:
+                st = f.stat()
+            except FileNotFoundError:  # pruned by another process
+                continue
+            if stat.S_ISREG(st.st_mode):
+                files.append((f, st))
+        return sorted(files, key=lambda f: f[1].st_mtime)
+
+    def cache_stats(self):
+        """
+        returns the cache hit/miss/byte counters of this process
+        and the number of files and bytes in the cache directory
+        """
+        files = self._cache_files()
+        return dict(
+            self._cache_counters,
+            files=len(files),
+            bytes=sum(st.st_size for _, st in files),
+        )
+
+    def cache_prune(self, max_bytes=None, max_age=None):
+        """
+        Deletes cache files, least recently used first.
+
+        Args:
+            max_bytes: cache size to keep (defaults to `cache_max_bytes`)
+            max_age: seconds since last use to keep files
+                (defaults to `cache_max_age`)
+
+        Returns:
+            list of deleted files
+        """
+        max_bytes = self.cache_max_bytes if max_bytes is None else max_bytes
+        max_age = self.cache_max_age if max_age is None else max_age
+
+        files = self._cache_files()
+        total = sum(st.st_size for _, st in files)
+        now = time.time()
+
+        deleted = []
+        for f, st in files:
+            too_big = max_bytes is not None and total > max_bytes
+            too_old = max_age is not None and now - st.st_mtime > max_age
+            if not (too_big or too_old):
+                break
+            try:
+                f.unlink()
+            except FileNotFoundError:  # pruned by another process
+                pass
+            total -= st.st_size
+            deleted.append(f)
+        return deleted
 
 
 CONFIG = Config()
 
-if __name__ == "__main__":
+
+def test_cache_prune(tmp_path):
+    config = Config()
+    config.cache = tmp_path
+    for i, name in enumerate(["a.npz", "b.npz", "c.dat"]):
+        path = tmp_path / name
+        path.write_bytes(b"0" * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    config.cache_hit(tmp_path / "a.npz")
+    assert config.cache_prune(max_bytes=200) == [tmp_path / "b.npz"]
+    assert config.cache_prune(max_age=3600) == [tmp_path / "c.dat"]
+    stats = config.cache_stats()
+    assert (stats["hits"], stats["files"], stats["bytes"]) == (1, 1, 100)
+
+
+def test_cache_files_vanishing(tmp_path, monkeypatch):
+    config = Config()
+    config.cache = tmp_path
+    (tmp_path / "a.npz").write_bytes(b"0" * 100)
+    # a file listed, then pruned by another process before it's sized
+    iterdir = pathlib.Path.iterdir
+    monkeypatch.setattr(
+        pathlib.Path, "iterdir", lambda self: [*iterdir(self), self / "gone.npz"]
+    )
+    assert config.cache_prune(max_bytes=0) == [tmp_path / "a.npz"]
+
+    config.cache_hit(tmp_path / "a.npz")
+    stats = config.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["files"]) == (0, 1, 0)
     print(CONFIG.repo)
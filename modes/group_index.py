@@ -1,25 +1,34 @@
+import warnings
+
 import matplotlib.pylab as plt
 import numpy as np
 import pytest
 
+from modes.materials import si
 from modes.mode_solver_full import mode_solver_full
 
 
 def group_index(
-    wavelength=1.55, wavelength_step=0.01, overwrite=False, n_modes=1, **wg_kwargs
+    wavelength=1.55, wavelength_step=None, overwrite=False, n_modes=1, **wg_kwargs
 ):
     r"""
     Solve for the group index, :math:`n_g`, of a structure at a particular
     wavelength.
 
+    The group index :math:`n_g = d\beta/dk` is found from a single solve,
+    from the derivative of the eigenvalues :math:`\beta^2` of the mode
+    solver's operator with respect to :math:`k` (Hellmann-Feynman theorem),
+    weighted by the right and left eigenvectors of each mode.  The material
+    dispersion :math:`dn/d\lambda` enters the derivative of the operator
+    analytically, see `modes.materials.dn_dwl`.
+
     Args:
-        structure (Structure): The target structure to solve
-            for modes.
-        wavelength_step (float): The step to take below and
-            above the nominal wavelength.  This is used for
-            approximating the gradient of :math:`n_\mathrm{eff}`
-            at the nominal wavelength.  Default is 0.01.
+        wavelength: 1.55 (um)
+        wavelength_step: deprecated and ignored, the group indices are no
+            longer found by finite differences
+        overwrite: whether to run again even if it finds the modes in CONFIG.cache
         n_modes: number of modes
+        tol: 0.001 relative accuracy of the eigen-solver
         x_step: 0.02
         y_step: 0.02
         wg_height: 0.22
@@ -31,46 +40,32 @@ def group_index(
         n_sub: sio2
         n_wg: si
         n_clads: [sio2]
-        wavelength: 1.55
         angle: 90.0
 
     Returns:
         List of the group indices found for each mode.
     """
-    n_gs = []
-
-    msc = mode_solver_full(
-        wavelength=wavelength, overwrite=overwrite, n_modes=n_modes, **wg_kwargs
-    )
-    msf = mode_solver_full(
-        wavelength=wavelength + wavelength_step,
+    if wavelength_step is not None:
+        warnings.warn(
+            "group_index: wavelength_step is deprecated and ignored",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+    ms = mode_solver_full(
+        wavelength=wavelength,
         overwrite=overwrite,
         n_modes=n_modes,
+        mode_profiles=False,
+        group_index=True,
         **wg_kwargs,
     )
-    msb = mode_solver_full(
-        wavelength=wavelength - wavelength_step,
-        overwrite=overwrite,
-        n_modes=n_modes,
-        **wg_kwargs,
-    )
-
-    n_ctrs = np.real(msc.n_effs)
-    n_bcks = np.real(msb.n_effs)
-    n_frws = np.real(msf.n_effs)
-
-    filename = (
-        msc._modes_directory / f"_ng_{msc.name}_{wavelength}_{wavelength_step}.dat"
-    )
-
-    n_gs = []
-    for n_ctr, n_bck, n_frw in zip(n_ctrs, n_bcks, n_frws):
-        n_gs.append(n_ctr - wavelength * (n_frw - n_bck) / (2 * wavelength_step))
+    n_gs = list(np.real(ms.n_gs))
 
+    filename = ms._modes_directory / f"_ng_{ms.name}.dat"
     with open(filename, "w") as fs:
         fs.write("# Mode idx, Group index\n")
         for idx, n_g in enumerate(n_gs):
-            fs.write("%i,%.3f\n" % (idx, np.round(n_g.real, 3)))
+            fs.write("%i,%.3f\n" % (idx, np.round(n_g, 3)))
 
     return n_gs
 
@@ -84,6 +79,31 @@ def test_sweep(overwrite):
     ).all()
 
 
+def test_group_index_wavelength_step():
+    with pytest.warns(DeprecationWarning):
+        ng = group_index(wavelength_step=0.01, n_modes=2)
+    assert np.allclose(ng, group_index(n_modes=2))
+
+
+def test_group_index_dispersion():
+    # same index at 1.55 um, without the dispersion of silicon
+    dispersive = group_index(angle=80, overwrite=True)
+    flat = group_index(angle=80, n_wg=float(np.real(si(1.55))))
+    assert np.allclose(flat, group_index(angle=80, n_wg=si(1.55), overwrite=True))
+    assert flat[0] < dispersive[0] - 0.1
+
+
+def test_group_index_finite_differences():
+    kwargs = dict(n_modes=2, angle=80, tol=1e-10)
+    ng = group_index(overwrite=True, **kwargs)
+    n_effs = [
+        mode_solver_full(wavelength=wavelength, mode_profiles=False, **kwargs).n_effs
+        for wavelength in [1.549, 1.55, 1.551]
+    ]
+    ng_fd = np.real(n_effs[1] - 1.55 * (n_effs[2] - n_effs[0]) / 0.002)
+    assert np.allclose(ng, ng_fd, rtol=1e-5)
+
+
 if __name__ == "__main__":
     print(group_index(g=2))
     # test_sweep(overwrite=False)
@@ -1,5 +1,16 @@
 """
-We have different materials available thanks to the [materialspy](https://opticalmaterialspy.readthedocs.io/en/latest/index.html) module
+Refractive indices of the common materials, from data shipped with the
+package, so structures can be built without network access:
+
+- si: Li 1980 (293 K) tabulated data, from refractiveindex.info
+- sio2: Malitson 1965 Sellmeier equation
+- nitride: Luke 2015 Sellmeier equation (Si3N4)
+- air: 1
+
+All the materials take the wavelength in um, either a float or a numpy
+array, and their `derivative` method returns the dispersion dn/dwl (1/um).
+Other materials can be registered with `register_material` and looked up by
+name with `get_material`.
 
 .. plot::
    :include-source:
@@ -8,7 +19,7 @@ We have different materials available thanks to the [materialspy](https://optica
    import modes as ms
 
    wavelengths = np.linspace(1.3, 1.6, 10)
-   nsi = [ms.materials.si(w) for w in wavelengths]
+   nsi = ms.materials.si(wavelengths)
 
    plt.plot(wavelengths, nsi)
    plt.xlabel('wavelength (nm)')
@@ -16,27 +27,163 @@ We have different materials available thanks to the [materialspy](https://optica
    plt.title('Silicon refractive index')
 
 """
-import opticalmaterialspy as mat
+import numpy as np
+
+
+class Sellmeier:
+    r"""
+    Refractive index from the Sellmeier equation
+
+    .. math::
+
+        n^2 = 1 + \sum_i \frac{B_i \lambda^2}{\lambda^2 - C_i^2}
+
+    Args:
+        name (str): name of the material
+        B (list): the coefficients :math:`B_i`
+        C (list): the resonance wavelengths :math:`C_i` (um)
+    """
+
+    def __init__(self, name, B, C):
+        self.__name__ = name
+        self.B = np.asarray(B, dtype=float)
+        self.C = np.asarray(C, dtype=float)
+
+    def __call__(self, wl):
+        wl2 = np.asarray(wl, dtype=float)[..., None] ** 2
+        return np.sqrt(1 + np.sum(self.B * wl2 / (wl2 - self.C ** 2), axis=-1))
+
+    def derivative(self, wl):
+        """returns the dispersion dn/dwl (1/um)"""
+        wl = np.asarray(wl, dtype=float)
+        wl2 = wl[..., None] ** 2
+        dn2 = np.sum(self.B * self.C ** 2 / (wl2 - self.C ** 2) ** 2, axis=-1)
+        return -wl * dn2 / self(wl)
+
+
+class Tabulated:
+    """
+    Refractive index linearly interpolated from tabulated data
+
+    Args:
+        name (str): name of the material
+        wavelengths (list): increasing wavelengths (um)
+        n (list): refractive indices at `wavelengths`
+    """
+
+    def __init__(self, name, wavelengths, n):
+        self.__name__ = name
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.n = np.asarray(n)
+
+    def __call__(self, wl):
+        wl = np.asarray(wl, dtype=float)
+        if np.any((wl < self.wavelengths[0]) | (wl > self.wavelengths[-1])):
+            raise ValueError(
+                f"{self.__name__} is tabulated between {self.wavelengths[0]} and "
+                f"{self.wavelengths[-1]} um, not at {wl} um"
+            )
+        n = np.interp(wl, self.wavelengths, self.n)
+        return n if n.ndim else n[()]
+
+    def derivative(self, wl):
+        """returns the dispersion dn/dwl (1/um)
+
+        The derivative of the table (second order differences) is
+        interpolated linearly, so that it is continuous across the tabulated
+        wavelengths.
+        """
+        self(wl)
+        dn = np.interp(wl, self.wavelengths, np.gradient(self.n, self.wavelengths))
+        return dn if dn.ndim else dn[()]
+
+
+si = Tabulated(
+    "si",
+    [1.2, 1.22, 1.24, 1.26, 1.28, 1.3, 1.32, 1.34, 1.36, 1.38, 1.4, 1.45]
+    + [1.5, 1.55, 1.6, 1.65, 1.7, 1.8, 1.9, 2.0, 2.25, 2.5, 2.75, 3.0]
+    + [4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0, 14.0],
+    [3.5167, 3.5133, 3.5102, 3.5072, 3.5043, 3.5016, 3.499, 3.4965, 3.4941]
+    + [3.4918, 3.4896, 3.4845, 3.4799, 3.4757, 3.4719, 3.4684, 3.4653, 3.4597]
+    + [3.455, 3.451, 3.4431, 3.4375, 3.4334, 3.4302, 3.4229, 3.4195, 3.4177]
+    + [3.4165, 3.4158, 3.4153, 3.415, 3.4147, 3.4145, 3.4144, 3.4142],
+)
+sio2 = Sellmeier(
+    "sio2", [0.6961663, 0.4079426, 0.8974794], [0.0684043, 0.1162414, 9.896161]
+)
+nitride = Sellmeier("nitride", [3.0249, 40314.0], [0.1353406, 1239.842])
+air = Sellmeier("air", [], [])
+
+MATERIALS = {m.__name__: m for m in (si, sio2, nitride, air)}
+
+
+def register_material(name, n):
+    """registers a material, so that it can be looked up by name
+
+    Args:
+        name: name of the material
+        n: refractive index, either a float or a function of the wavelength
+            (um), such as a `Sellmeier` or `Tabulated` material
+
+    Returns:
+        the material, a function of the wavelength
+    """
+    if not callable(n):
+        # a constant index is a Sellmeier term without resonance
+        n = Sellmeier(name, [n ** 2 - 1], [0.0])
+    MATERIALS[name] = n
+    return n
+
+
+def get_material(name):
+    """returns the registered material `name`"""
+    try:
+        return MATERIALS[name]
+    except KeyError:
+        raise KeyError(
+            f"unknown material {name!r}, registered materials: {sorted(MATERIALS)}"
+        )
+
 
+def dn_dwl(material, wl, step=1e-4):
+    """returns the dispersion dn/dwl (1/um) of a material at `wl` (um)
 
-def si(wl):
-    return mat.RefractiveIndexWeb(
-        "https://refractiveindex.info/?shelf=main&book=Si&page=Li-293K"
-    ).n(wl)
+    Args:
+        material: refractive index, either a float (no dispersion) or a
+            function of the wavelength.  Materials with a `derivative`
+            method are differentiated analytically, other functions by
+            central differences
+        wl: wavelength (um)
+        step: wavelength step (um) of the central differences
+    """
+    if not callable(material):
+        return 0.0
+    if hasattr(material, "derivative"):
+        return material.derivative(wl)
+    return (material(wl + step) - material(wl - step)) / (2 * step)
 
 
-def sio2(wl):
-    return mat.SiO2().n(wl)
+def test_materials_vectorized():
+    wavelengths = np.linspace(1.3, 1.6, 4)
+    for material in [si, sio2, air, nitride]:
+        n = material(wavelengths)
+        assert np.allclose(n, [material(wl) for wl in wavelengths])
 
 
-def air(wl):
-    return mat.Air().n(wl)
+def test_dn_dwl():
+    wavelengths = np.linspace(1.3, 1.6, 4)
+    for material, atol in [(si, 2e-3), (sio2, 1e-6), (air, 0), (nitride, 1e-6)]:
+        dn = dn_dwl(material, wavelengths)
+        assert np.allclose(dn, dn_dwl(material.__call__, wavelengths), atol=atol)
+    assert np.isclose(dn_dwl(sio2, 1.55), -0.0119825, rtol=1e-4)
+    assert dn_dwl(1.5, 1.55) == 0
 
 
-def nitride(wl):
-    return mat.RefractiveIndexWeb(
-        "https://refractiveindex.info/?shelf=main&book=Si3N4&page=Luke"
-    ).n(wl)
+def test_register_material():
+    register_material("test_polymer", 1.5)
+    assert np.isclose(get_material("test_polymer")(1.55), 1.5)
+    assert np.isclose(sio2(1.55), 1.444023621703261)
+    assert np.isclose(si(1.55), 3.4757)
 
 
 if __name__ == "__main__":
@@ -3,11 +3,21 @@ import json
 import numpy as np
 import pytest
 
+from modes import _mode_solver_lib
+from modes._mode_solver import get_modes_cachepath
 from modes._mode_solver import get_modes_jsonpath
+from modes._mode_solver import read_cached_modes
+from modes._mode_solver import read_modes_cache
+from modes._mode_solver import tol_reached
+from modes._mode_solver import write_modes_cache
 from modes._mode_solver_full_vectorial import ModeSolverFullyVectorial
+from modes._mode_solver_full_vectorial import _MirrorHalf
+from modes._mode_solver_lib import eigs_arpack
 from modes.autoname import autoname
 from modes.autoname import clean_value
+from modes.config import CONFIG
 from modes.materials import nitride
+from modes.materials import si
 from modes.materials import sio2
 from modes.waveguide import waveguide
 from modes.waveguide import write_material_index
@@ -41,6 +51,172 @@ def test_mode_solver_full_vectorial_multi_clad(overwrite):
     assert np.isclose(neff0, 2.483481412238637)
 
 
+def test_mode_solver_full_vectorial_shift_invert():
+    mode_solver = mode_solver_full(overwrite=True, shift_invert=True)
+    neff0 = mode_solver.results["n_effs"][0].real
+    assert np.isclose(neff0, 2.4717079424099673)
+    assert mode_solver.factorization_time > 0
+
+
+def test_mode_solver_full_mirror_symmetry():
+    wg = waveguide(angle=80)
+    full = mode_solver_full(wg=wg, n_modes=3, overwrite=True)
+    half = mode_solver_full(wg=wg, n_modes=3, overwrite=True, mirror_symmetry=True)
+    # the full domain ARPACK solve (tol=0.001) is the less converged one
+    assert np.isclose(half.n_effs[0], full.n_effs[0], rtol=1e-9)
+    assert np.allclose(half.n_effs, full.n_effs, rtol=1e-4)
+    assert [t for t, _ in half.mode_types] == [t for t, _ in full.mode_types]
+    assert half.modes[0].fields["Ex"].shape == full.modes[0].fields["Ex"].shape
+
+
+def test_mode_solver_full_warm_start(monkeypatch):
+    guesses = []
+
+    def eigs(A, k, lu, v0=None, tol=0.001):
+        guesses.append(v0)
+        return eigs_arpack(A, k, lu, v0=v0, tol=tol)
+
+    monkeypatch.setattr(_mode_solver_lib, "eigs_arpack", eigs)
+    kwargs = dict(angle=80, overwrite=True, shift_invert=True)
+    cold = mode_solver_full(**kwargs)
+    assert np.ndim(guesses[-1]) == 1
+    for mirror_symmetry in [False, True]:
+        warm = mode_solver_full(
+            warm_start_from=cold, mirror_symmetry=mirror_symmetry, **kwargs
+        )
+        # the modes of the previous solve, not a random start vector
+        assert np.ndim(guesses[-1]) == 2
+        assert np.allclose(warm.n_effs, cold.n_effs)
+
+    # each mirror half only starts from the modes of its own parity
+    assert [t for t, _ in cold.mode_types] == ["qTE", "qTM"]
+    assert [np.shape(guess)[1] for guess in guesses[-2:]] == [1, 1]
+    half = _MirrorHalf(cold.wg, cold.wg.x.size // 2)
+    for i, (guess, field) in enumerate(zip(guesses[-2:], ["Hy", "Hx"])):
+        start = guess[:, 0].reshape((2,) + half.n.shape)[i]
+        mode = cold.modes[i].fields[field][:, : half.x.size]
+        assert abs(np.vdot(start, mode)) > 0.99 * np.linalg.norm(start) ** 2
+
+
+def test_mode_solver_full_pml():
+    wg_kwargs = dict(angle=80, sub_height=1, clad_height=[1])
+    big = mode_solver_full(
+        overwrite=True,
+        shift_invert=True,
+        sub_width=4,
+        sub_height=2,
+        clad_height=[2],
+        angle=80,
+    )
+    pml = mode_solver_full(
+        overwrite=True, boundary="PPPP", pml_thickness=0.3, **wg_kwargs
+    )
+    assert np.isclose(pml.n_effs[0], big.n_effs[0], atol=1e-5)
+
+    # leakage to a silicon layer 0.5 um above the waveguide
+    n_effs = []
+    for clad_height in [1.0, 1.3]:
+        wg = waveguide(
+            angle=80, sub_height=1, clad_height=[0.5, clad_height], n_clads=[sio2, si],
+        )
+        mode_solver = ModeSolverFullyVectorial(1, boundary="PPPP", n_eff_guess=2.55)
+        mode_solver.wg = wg
+        n_effs.append(mode_solver.solve()["n_effs"][0])
+    assert n_effs[0].imag > 0
+    assert np.isclose(n_effs[0], n_effs[1], rtol=1e-6)
+    assert np.isclose(n_effs[0].imag, n_effs[1].imag, rtol=0.01)
+
+
+def test_mode_solver_full_n_effs_only():
+    full = mode_solver_full(overwrite=True, n_modes=2)
+    for overwrite in [True, False]:
+        fast = mode_solver_full(overwrite=overwrite, n_modes=2, mode_profiles=False)
+        assert np.allclose(fast.n_effs, full.n_effs)
+        assert not fast.modes
+        assert fast.mode_types is None
+    n_effs_only = _full()
+    n_effs_only._mode_profiles = False
+    assert n_effs_only.cache_key != _full().cache_key
+
+
+def test_mode_solver_full_positional_args():
+    # the positional arguments of the baseline keep their order
+    mode_solver = ModeSolverFullyVectorial(2, 0.01, "000A", None, 2.5)
+    assert (mode_solver._boundary, mode_solver._n_eff_guess) == ("000A", 2.5)
+    assert mode_solver._mode_profiles
+
+
+def test_mode_solver_full_graded_mesh():
+    kwargs = dict(overwrite=True, n_modes=4, tol=1e-8)
+    uniform = mode_solver_full(wg=waveguide(angle=80, sub_width=4), **kwargs)
+    wg = waveguide(angle=80, sub_width=4, x_step_max=0.05, y_step_max=0.05)
+    graded = mode_solver_full(wg=wg, plot=True, **kwargs)
+    # the coarse cells away from the core count for their whole area
+    assert np.allclose(graded.fraction_te, uniform.fraction_te, atol=0.01)
+    assert np.allclose(graded.fraction_tm, uniform.fraction_tm, atol=0.01)
+
+
+def test_mode_solver_full_tol():
+    loose = mode_solver_full(overwrite=True, angle=80, tol=0.01)
+    tight = mode_solver_full(angle=80, tol=1e-10)
+    cachepath = get_modes_cachepath(tight)
+    assert loose.cache_key == tight.cache_key
+    assert read_modes_cache(cachepath)[2]["tol"] == 1e-10
+
+    hits = CONFIG.cache_stats()["hits"]
+    cached = mode_solver_full(angle=80, tol=1e-3)
+    assert CONFIG.cache_stats()["hits"] == hits + 1
+    assert np.array_equal(cached.n_effs, tight.n_effs)
+    assert np.isclose(loose.n_effs[0], tight.n_effs[0], rtol=1e-4)
+
+
+def test_mode_solver_full_cache_key():
+    wg_kwargs = dict(wg_width=0.6, angle=80)
+    key = _full(**wg_kwargs).cache_key
+    assert _full(wg=waveguide(**wg_kwargs)).cache_key == key
+    assert _full(wavelength=1.3, **wg_kwargs).cache_key != key
+    assert _full(n_modes=3, **wg_kwargs).cache_key != key
+
+
+def test_mode_solver_full_legacy_json():
+    wg_kwargs = dict(angle=80, wg_width=0.45)
+    mode_solver = mode_solver_full(overwrite=True, **wg_kwargs)
+    get_modes_cachepath(mode_solver).unlink()
+    jsonpath = get_modes_jsonpath(mode_solver)
+    n_effs = mode_solver.n_effs + 0.1
+    modes = [mode.fields for mode in mode_solver.modes]
+    d = dict(
+        n_effs_real=n_effs.real.tolist(),
+        n_effs_imag=n_effs.imag.tolist(),
+        modes_real=[{k: v.real.tolist() for k, v in m.items()} for m in modes],
+        modes_imag=[{k: v.imag.tolist() for k, v in m.items()} for m in modes],
+        mode_types=mode_solver.mode_types,
+        fraction_te=np.real(mode_solver.fraction_te).tolist(),
+        fraction_tm=np.real(mode_solver.fraction_tm).tolist(),
+    )
+    jsonpath.write_text(json.dumps(d))
+    try:
+        legacy = mode_solver_full(**wg_kwargs)
+        assert np.allclose(legacy.n_effs, n_effs)
+        # the JSON cache doesn't hold n_effs only or PML solves
+        fast = mode_solver_full(mode_profiles=False, **wg_kwargs)
+        assert np.allclose(fast.n_effs, mode_solver.n_effs)
+        pml = mode_solver_full(boundary="PPPP", **wg_kwargs)
+        assert not np.allclose(pml.n_effs, n_effs)
+        ng = mode_solver_full(group_index=True, **wg_kwargs)
+        assert np.allclose(ng.n_effs, mode_solver.n_effs)
+        assert np.all(ng.n_gs.real > 3)
+
+        # a group index cache entry without the group indices is solved again
+        cachepath = get_modes_cachepath(ng)
+        write_modes_cache(cachepath, ng.n_effs, [], n_gs=None)
+        again = mode_solver_full(group_index=True, **wg_kwargs)
+        assert np.allclose(again.n_gs, ng.n_gs)
+        assert read_modes_cache(cachepath)[2]["n_gs"] is not None
+    finally:
+        jsonpath.unlink()
+
+
 @autoname
 def _full(n_modes=2, wg=None, plot=True, plot_profile=False, **wg_kwargs):
     """
@@ -71,6 +247,15 @@ def mode_solver_full(
     logscale=False,
     wg=None,
     fields_to_write=("Ex", "Ey", "Ez", "Hx", "Hy", "Hz"),
+    shift_invert=False,
+    warm_start_from=None,
+    mirror_symmetry=False,
+    boundary="0000",
+    pml_thickness=0.5,
+    pml_strength=5.0,
+    mode_profiles=True,
+    tol=0.001,
+    group_index=False,
     **wg_kwargs
 ):
     """
@@ -79,6 +264,24 @@ def mode_solver_full(
     Args:
         n_modes: 2
         overwrite: whether to run again even if it finds the modes in CONFIG.cache
+        shift_invert: solve in shift-invert mode around the maximum core index
+        warm_start_from: solved mode solver of a neighbouring structure whose
+            modes and n_effs seed the eigen-solver
+        mirror_symmetry: False, True solves left/right symmetric structures
+            on half of the grid, see `ModeSolverFullyVectorial`
+        boundary: '0000' boundary conditions (right, left, top, bottom),
+            'PPPP' surrounds the window with perfectly matched layers
+        pml_thickness: 0.5 thickness of the 'P' boundaries (um)
+        pml_strength: 5.0 strength of the 'P' boundaries
+        mode_profiles: False only solves for the n_effs (no fields, mode
+            types or TE/TM fractions), which is faster and cached separately
+        tol: 0.001 relative accuracy of the n_effs, 0 is machine precision.
+            Cached modes solved to a looser tolerance are refined (warm
+            started from the cached modes) and the cache updated, so a sweep
+            can explore at a loose `tol` and only the points requested again
+            with a tighter `tol` are solved again
+        group_index: also find the group indices of the modes (`n_gs`) from
+            the same solve, see `modes.group_index`
         x_step: 0.02 grid step (um)
         y_step: 0.02 grid step (um)
         wg_heigth: 0.22 (um)
@@ -105,70 +308,74 @@ def mode_solver_full(
     mode_solver = _full(
         n_modes=n_modes, wg=wg, plot=plot, plot_profile=plot_profile, **wg_kwargs
     )
+    mode_solver._shift_invert = shift_invert
+    mode_solver._mirror_symmetry = mirror_symmetry
+    mode_solver._boundary = mode_solver.settings["boundary"] = boundary
+    mode_solver._pml_thickness = pml_thickness
+    mode_solver._pml_strength = pml_strength
+    mode_solver._mode_profiles = mode_profiles
+    mode_solver._tol = tol
+    mode_solver._group_index = group_index
+    if warm_start_from is not None:
+        mode_solver.warm_start(warm_start_from)
     settings = {k: clean_value(v) for k, v in mode_solver.settings.items()}
+    cachepath = get_modes_cachepath(mode_solver)
     jsonpath = get_modes_jsonpath(mode_solver)
     filepath = jsonpath.with_suffix(".dat")
 
-    if overwrite or not jsonpath.exists():
+    cache = None if overwrite else read_cached_modes(mode_solver)
+    cached = cache is not None
+    if cached:
+        readpath, n_effs, modes, d = cache
+        if group_index and d.get("n_gs") is None:
+            # cached without the group indices
+            cached = False
+        elif not tol_reached(d.get("tol"), tol):
+            # refine the cached modes rather than solving from scratch
+            mode_solver.modes = modes
+            mode_solver.n_effs = n_effs
+            mode_solver.warm_start(mode_solver)
+            cached = False
+
+    if not cached:
+        CONFIG.cache_miss()
         r = mode_solver.solve()
-        n_effs_real = r["n_effs"].real.tolist()
-        n_effs_imag = r["n_effs"].imag.tolist()
-        modes = r["modes"]
-
-        modes_real = [
-            {k: v.real.tolist() for k, v in mode.fields.items()} for mode in modes
-        ]
-        modes_imag = [
-            {k: v.imag.tolist() for k, v in mode.fields.items()} for mode in modes
-        ]
-
-        d = dict(
-            n_effs_real=n_effs_real,
-            n_effs_imag=n_effs_imag,
-            modes_real=modes_real,
-            modes_imag=modes_imag,
-            n_modes=len(n_effs_real),
+        write_modes_cache(
+            cachepath,
+            r["n_effs"],
+            [mode.fields for mode in mode_solver.modes],
+            n_modes=len(r["n_effs"]),
             settings=settings,
-            mode_types=mode_solver._get_mode_types(),
+            mode_types=mode_solver.mode_types,
             fraction_te=mode_solver.fraction_te,
             fraction_tm=mode_solver.fraction_tm,
+            tol=tol,
+            n_gs=np.real(r["n_gs"]).tolist() if group_index else None,
         )
+        CONFIG.cache_write(cachepath)
 
-        with open(jsonpath, "w") as f:
-            f.write(json.dumps(d))
-
-        mode_solver.write_modes_to_file(
-            filepath, plot=plot, fields_to_write=fields_to_write, logscale=logscale
-        )
+        if mode_profiles:
+            mode_solver.write_modes_to_file(
+                filepath, plot=plot, fields_to_write=fields_to_write, logscale=logscale
+            )
 
         r["settings"] = settings
 
     else:
-        d = json.loads(open(jsonpath).read())
-        modes_real = d["modes_real"]
-        modes_imag = d["modes_imag"]
-        modes_cache = [
-            {k: np.array(np.array(mr[k]) + 1j * np.array(mi[k])) for k in mr.keys()}
-            for mr, mi in zip(modes_real, modes_imag)
-        ]
-        n_effs_real = d["n_effs_real"]
-        n_effs_imag = d["n_effs_imag"]
-        n_effs_cache = [
-            np.array(np.array(mr) + 1j * np.array(mi))
-            for mr, mi in zip(n_effs_real, n_effs_imag)
-        ]
-
+        CONFIG.cache_hit(readpath)
         mode_solver.mode_types = mode_types = d["mode_types"]
         mode_solver.fraction_tm = fraction_tm = d["fraction_tm"]
         mode_solver.fraction_te = fraction_te = d["fraction_te"]
 
         r = dict(
-            modes=modes_cache,
-            n_effs=n_effs_cache,
+            modes=modes,
+            n_effs=n_effs,
             mode_types=mode_types,
             fraction_te=fraction_te,
             fraction_tm=fraction_tm,
         )
+        if group_index:
+            mode_solver.n_gs = r["n_gs"] = np.array(d["n_gs"])
         mode_solver.modes = r["modes"]
         mode_solver.n_effs = r["n_effs"]
         if plot:
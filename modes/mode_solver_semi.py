@@ -1,12 +1,16 @@
-import json
-
 import numpy as np
 import pytest
 
+from modes._mode_solver import get_modes_cachepath
 from modes._mode_solver import get_modes_jsonpath
+from modes._mode_solver import read_cached_modes
+from modes._mode_solver import read_modes_cache
+from modes._mode_solver import tol_reached
+from modes._mode_solver import write_modes_cache
 from modes._mode_solver_semi_vectorial import ModeSolverSemiVectorial
 from modes.autoname import autoname
 from modes.autoname import clean_value
+from modes.config import CONFIG
 from modes.waveguide import waveguide
 from modes.waveguide import write_material_index
 
@@ -33,6 +37,21 @@ def test_mode_solver_semi_vectorial_tm(overwrite):
     assert np.isclose(neff0, 1.859555511265503)
 
 
+def test_mode_solver_semi_vectorial_pml():
+    big = mode_solver_semi(
+        overwrite=True, plot=False, sub_width=4, sub_height=2, clad_height=[2]
+    )
+    pml = mode_solver_semi(
+        overwrite=True,
+        plot=False,
+        boundary="PPPP",
+        pml_thickness=0.3,
+        sub_height=1,
+        clad_height=[1],
+    )
+    assert np.isclose(pml.n_effs[0], big.n_effs[0], atol=1e-5)
+
+
 @autoname
 def _semi(
     n_modes=2, semi_vectorial_method="Ex", plot=False, plot_profile=False, **wg_kwargs
@@ -68,6 +87,10 @@ def mode_solver_semi(
     plot=True,
     plot_profile=False,
     logscale=False,
+    boundary="0000",
+    pml_thickness=0.5,
+    pml_strength=5.0,
+    tol=0.001,
     **wg_kwargs
 ):
     """
@@ -77,6 +100,13 @@ def mode_solver_semi(
         n_modes: 2
         overwrite: whether to run again even if it finds the modes in CONFIG.cache
         semi_vectorial_method: 'Ey' for TM, 'Ex' for TE
+        boundary: '0000' boundary conditions (right, left, top, bottom),
+            'PPPP' surrounds the window with perfectly matched layers
+        pml_thickness: 0.5 thickness of the 'P' boundaries (um)
+        pml_strength: 5.0 strength of the 'P' boundaries
+        tol: 0.001 relative accuracy of the n_effs, 0 is machine precision.
+            Cached modes solved to a looser tolerance are solved again,
+            starting from the cached fundamental mode, and the cache updated
         x_step: 0.02
         y_step: 0.02
         wg_height: 0.22
@@ -107,47 +137,41 @@ def mode_solver_semi(
         plot_profile=plot_profile,
         **wg_kwargs
     )
+    mode_solver._boundary = mode_solver.settings["boundary"] = boundary
+    mode_solver._pml_thickness = pml_thickness
+    mode_solver._pml_strength = pml_strength
+    mode_solver._tol = tol
     settings = {k: clean_value(v) for k, v in mode_solver.settings.items()}
+    cachepath = get_modes_cachepath(mode_solver)
     jsonpath = get_modes_jsonpath(mode_solver)
     filepath = jsonpath.with_suffix(".dat")
 
-    if overwrite or not jsonpath.exists():
+    cache = None if overwrite else read_cached_modes(mode_solver)
+    cached = cache is not None
+    if cached:
+        readpath, n_effs, modes, d = cache
+        if not tol_reached(d.get("tol"), tol):
+            mode_solver._initial_mode_guess = np.ravel(modes[0])
+            cached = False
+
+    if not cached:
+        CONFIG.cache_miss()
         r = mode_solver.solve()
-        n_effs_real = r["n_effs"].real.tolist()
-        n_effs_imag = r["n_effs"].imag.tolist()
-        modes = r["modes"]
-        modes_real = [mode.real.tolist() for mode in modes]
-        modes_imag = [mode.imag.tolist() for mode in modes]
-
-        d = dict(
-            n_effs_real=n_effs_real,
-            n_effs_imag=n_effs_imag,
-            modes_real=modes_real,
-            modes_imag=modes_imag,
-            n_modes=len(n_effs_real),
+        write_modes_cache(
+            cachepath,
+            r["n_effs"],
+            r["modes"],
+            n_modes=len(r["n_effs"]),
             settings=settings,
+            tol=tol,
         )
-
-        with open(jsonpath, "w") as f:
-            f.write(json.dumps(d))
+        CONFIG.cache_write(cachepath)
         mode_solver.write_modes_to_file(filepath, plot=plot, logscale=logscale)
 
         r["settings"] = settings
 
     else:
-        d = json.loads(open(jsonpath).read())
-        modes_real = d["modes_real"]
-        modes_imag = d["modes_imag"]
-        modes = [
-            np.array(np.array(mr) + 1j * np.array(mi))
-            for mr, mi in zip(modes_real, modes_imag)
-        ]
-        n_effs_real = d["n_effs_real"]
-        n_effs_imag = d["n_effs_imag"]
-        n_effs = [
-            np.array(np.array(mr) + 1j * np.array(mi))
-            for mr, mi in zip(n_effs_real, n_effs_imag)
-        ]
+        CONFIG.cache_hit(readpath)
         r = dict(modes=modes, n_effs=n_effs)
         mode_solver.modes = r["modes"]
         mode_solver.n_effs = r["n_effs"]
@@ -24,7 +24,9 @@ def neff(mode=0, overwrite=False, **wg_kwargs):
         wavelength: 1.55 (um)
         angle: 90.0
     """
-    ms = mode_solver_full(overwrite=overwrite, n_modes=mode + 1, **wg_kwargs)
+    ms = mode_solver_full(
+        overwrite=overwrite, n_modes=mode + 1, mode_profiles=False, **wg_kwargs
+    )
     return np.real(ms.n_effs[mode])
 
 
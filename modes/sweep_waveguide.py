@@ -1,12 +1,42 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pylab as plt
 import numpy as np
 import pytest
 import tqdm
 
+from modes.mode_solver_full import _full
 from modes.mode_solver_full import mode_solver_full
 from modes.waveguide import waveguide
 
 
+def _solve_waveguides(waveguides, overwrite, n_modes, warm_start, tol, progress=False):
+    """
+    Solves a contiguous chunk of the sweep, in order.
+
+    Runs in the worker processes of a parallel sweep, so it only returns
+    the n_effs, mode types and TE/TM fractions of each waveguide rather than
+    the mode solvers and their fields.
+    """
+    results = []
+    ms = None
+    for wg in tqdm.tqdm(waveguides, ncols=70, disable=not progress):
+        ms = mode_solver_full(
+            wg=wg,
+            overwrite=overwrite,
+            n_modes=n_modes,
+            plot=False,
+            shift_invert=warm_start,
+            warm_start_from=ms if warm_start else None,
+            tol=tol,
+        )
+        results.append(
+            (np.real(ms.n_effs), ms.mode_types, ms.fraction_te, ms.fraction_tm)
+        )
+    return results
+
+
 def sweep_waveguide(
     waveguides,
     sweep_param_list,
@@ -16,6 +46,10 @@ def sweep_waveguide(
     overwrite=False,
     n_modes=6,
     legend=None,
+    warm_start=False,
+    tol=0.001,
+    n_jobs=1,
+    executor=None,
 ):
     """
     Find the modes of many waveguides.
@@ -32,6 +66,17 @@ def sweep_waveguide(
         overwrite: when True forces to resimulate the structure
         n_modes: number of modes to compute
         legend:
+        warm_start: seed each solve with the modes and n_effs of the previous
+            waveguide (shift-invert solves). Useful for finely spaced sweeps.
+        tol: relative accuracy of the n_effs, 0 is machine precision.
+            Explore with a loose `tol` (e.g. 0.01), then sweep again with a
+            tighter one: only the waveguides cached with a looser tolerance
+            are refined
+        n_jobs: number of worker processes solving the waveguides in
+            parallel, -1 uses all the cores. With `warm_start` each worker
+            warm starts through a contiguous chunk of the sweep.
+        executor: `concurrent.futures.Executor` to submit the solves to,
+            instead of creating a process pool with `n_jobs` workers.
 
     Returns:
         list: A list of the effective indices found for each structure.
@@ -49,17 +94,35 @@ def sweep_waveguide(
         )
         print(r["n_effs"][0])
     """
-    n_effs = []
-    mode_types = []
-    fractions_te = []
-    fractions_tm = []
-
-    for wg in tqdm.tqdm(waveguides, ncols=70):
-        ms = mode_solver_full(wg=wg, overwrite=overwrite, n_modes=n_modes, plot=False)
-        n_effs.append(np.real(ms.n_effs))
-        mode_types.append(ms.mode_types)
-        fractions_te.append(ms.fraction_te)
-        fractions_tm.append(ms.fraction_tm)
+    solver_args = (overwrite, n_modes, warm_start, tol)
+
+    if executor is None and n_jobs == 1:
+        results = _solve_waveguides(waveguides, *solver_args, progress=True)
+    else:
+        n_workers = n_jobs if n_jobs > 0 else os.cpu_count()
+        if warm_start:
+            chunks = np.array_split(np.arange(len(waveguides)), n_workers)
+        else:
+            chunks = np.array_split(np.arange(len(waveguides)), len(waveguides))
+        chunks = [[waveguides[i] for i in chunk] for chunk in chunks if len(chunk)]
+
+        pool = executor or ProcessPoolExecutor(max_workers=n_workers)
+        try:
+            futures = [
+                pool.submit(_solve_waveguides, chunk, *solver_args) for chunk in chunks
+            ]
+            # the results are collected in submission order, not completion order
+            results = [
+                r for future in tqdm.tqdm(futures, ncols=70) for r in future.result()
+            ]
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    n_effs, mode_types, fractions_te, fractions_tm = [list(r) for r in zip(*results)]
+
+    # only used for its file names and writing and plotting methods
+    ms = _full(n_modes=n_modes, wg=waveguides[-1])
 
     results = dict(
         n_effs=n_effs,
@@ -168,6 +231,28 @@ def test_sweep2(overwrite):
     assert r
 
 
+def test_sweep_warm_start():
+    wg_widths = np.arange(0.5, 0.56, 0.02)
+    wgs = [waveguide(wg_width=wg_width) for wg_width in wg_widths]
+    kwargs = dict(n_modes=2, overwrite=True, plot=False, tol=1e-10)
+    cold = sweep_waveguide(wgs, wg_widths, **kwargs)
+    warm = sweep_waveguide(wgs, wg_widths, warm_start=True, **kwargs)
+    # every point of the sweep, not only the first one which is a cold start
+    assert np.shape(warm["n_effs"]) == (wg_widths.size, 2)
+    assert np.allclose(warm["n_effs"], cold["n_effs"], rtol=1e-6, atol=0)
+
+
+def test_sweep_parallel():
+    wg_widths = np.array([0.5, 1.0])
+    wgs = [waveguide(wg_width=wg_width) for wg_width in wg_widths]
+    r = sweep_waveguide(wgs, wg_widths, n_modes=2, overwrite=True, plot=False, n_jobs=2)
+    assert np.isclose(
+        r["n_effs"][0], np.array([2.47170794, 1.81238363]), atol=0.01
+    ).all()
+    assert r["n_effs"][1][0] > r["n_effs"][0][0]
+    assert len(r["mode_types"]) == len(r["fractions_te"]) == 2
+
+
 if __name__ == "__main__":
     test_sweep2(overwrite=False)
     plt.show()
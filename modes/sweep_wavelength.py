@@ -1,12 +1,92 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from inspect import signature
+
 import matplotlib.pylab as plt
 import numpy as np
 import pytest
 import tqdm
 
+from modes._structure_base import Structure
+from modes.autoname import get_component_name
+from modes.mode_solver_full import _full
 from modes.mode_solver_full import mode_solver_full
+from modes.waveguide import material_index
+from modes.waveguide import waveguide
+from modes.waveguide import waveguide_material_ids
+
+
+def _solve_wavelengths(
+    ids,
+    grid,
+    mesh,
+    rows,
+    materials,
+    wavelengths,
+    names,
+    overwrite,
+    n_modes,
+    warm_start,
+    tol,
+    solver_kwargs,
+    progress=False,
+):
+    """
+    Solves a contiguous chunk of the sweep, in order.
+
+    The structure at each wavelength is the material map `ids` on `grid`
+    (graded by the `mesh` indices, if any) with the indices of `materials`
+    at that wavelength.  `rows`, the material IDs painted on each row of
+    `grid` with their exact extents, are only given for subpixel averaging.
+    `solver_kwargs` are the other `mode_solver_full` arguments.  Only the
+    n_effs and TE fractions are returned, to keep the results of worker
+    processes small.
+    """
+    results = []
+    ms = None
+    for w, name in tqdm.tqdm(
+        list(zip(wavelengths, names)), ncols=70, disable=not progress
+    ):
+        row_materials = None
+        if rows is not None:
+            n = material_index(np.arange(len(materials)), materials, w)
+            row_materials = [
+                [(x_min, x_max, n[int(m.real)]) for x_min, x_max, m in row]
+                for row in rows
+            ]
+        structure = Structure.from_index(
+            material_index(ids, materials, w),
+            w,
+            mesh=mesh,
+            row_materials=row_materials,
+            **grid,
+        )
+        structure.name = name
+
+        ms = mode_solver_full(
+            wg=structure,
+            name=name,
+            n_modes=n_modes,
+            overwrite=overwrite,
+            plot=False,
+            warm_start_from=ms if warm_start else None,
+            tol=tol,
+            **solver_kwargs,
+        )
+        results.append((np.real(ms.n_effs), ms.fraction_te))
+    return results
 
 
-def sweep_wavelength(wavelengths, plot=True, overwrite=False, **wg_kwargs):
+def sweep_wavelength(
+    wavelengths,
+    plot=True,
+    overwrite=False,
+    warm_start=False,
+    tol=0.001,
+    n_jobs=1,
+    executor=None,
+    **wg_kwargs,
+):
     """
 
     Solve for the effective indices of a fixed structure at
@@ -16,6 +96,20 @@ def sweep_wavelength(wavelengths, plot=True, overwrite=False, **wg_kwargs):
         wavelengths (list): list of wavelengths to sweep
         plot (bool): `True` generates plots
         overwrite: when True forces to resimulate the structure
+        warm_start: seed each solve with the modes and n_effs of the previous
+            wavelength (shift-invert solves). Useful for finely spaced sweeps.
+        tol: relative accuracy of the n_effs, 0 is machine precision.
+            Explore with a loose `tol` (e.g. 0.01), then sweep again with a
+            tighter one: only the wavelengths cached with a looser tolerance
+            are refined
+        n_jobs: number of worker processes solving the wavelengths in
+            parallel, -1 uses all the cores. The waveguide geometry is drawn
+            once and sent to the workers as a map of material IDs, only the
+            material dispersion is evaluated at each wavelength.
+        executor: `concurrent.futures.Executor` to submit the solves to,
+            instead of creating a process pool with `n_jobs` workers.
+        wg_kwargs: `waveguide` arguments, `n_modes` and other
+            `mode_solver_full` arguments
 
     Returns:
         wg_kwargs: arguments for the waveguide
@@ -23,13 +117,79 @@ def sweep_wavelength(wavelengths, plot=True, overwrite=False, **wg_kwargs):
         resuls['n_effs']: A list of the effective indices found for each wavelength.
         resuls['fractions_te']:
     """
-    n_effs = []
-    fractions_te = []
-
-    for w in tqdm.tqdm(wavelengths, ncols=70):
-        ms = mode_solver_full(wavelength=w, overwrite=overwrite, **wg_kwargs)
-        n_effs.append(np.real(ms.n_effs))
-        fractions_te.append(ms.fraction_te)
+    n_modes = wg_kwargs.pop("n_modes", 2)
+    geometry = signature(waveguide).parameters
+    solver_kwargs = {k: v for k, v in wg_kwargs.items() if k not in geometry}
+    wg_kwargs = {k: v for k, v in wg_kwargs.items() if k in geometry}
+    solver_kwargs["shift_invert"] = warm_start or solver_kwargs.get(
+        "shift_invert", False
+    )
+    wg, ids, materials = waveguide_material_ids(**wg_kwargs)
+    grid = dict(
+        x_step=wg.x_step,
+        y_step=wg.y_step,
+        x_max=wg.x_max,
+        y_max=wg.y_max,
+        x_min=wg.x_min,
+        y_min=wg.y_min,
+    )
+    mesh = (wg._x_mesh, wg._y_mesh)
+    rows = wg._row_materials if wg.subpixel else None
+    # same names (and output files) as `mode_solver_full(wavelength=w, **wg_kwargs)`
+    names = [
+        get_component_name("_full", n_modes=n_modes, wg=None, wavelength=w, **wg_kwargs)
+        for w in wavelengths
+    ]
+    solver_args = (overwrite, n_modes, warm_start, tol, solver_kwargs)
+
+    if executor is None and n_jobs == 1:
+        results = _solve_wavelengths(
+            ids,
+            grid,
+            mesh,
+            rows,
+            materials,
+            wavelengths,
+            names,
+            *solver_args,
+            progress=True,
+        )
+    else:
+        n_workers = n_jobs if n_jobs > 0 else os.cpu_count()
+        if warm_start:
+            chunks = np.array_split(np.arange(len(wavelengths)), n_workers)
+        else:
+            chunks = np.array_split(np.arange(len(wavelengths)), len(wavelengths))
+        chunks = [chunk for chunk in chunks if len(chunk)]
+
+        pool = executor or ProcessPoolExecutor(max_workers=n_workers)
+        try:
+            futures = [
+                pool.submit(
+                    _solve_wavelengths,
+                    ids,
+                    grid,
+                    mesh,
+                    rows,
+                    materials,
+                    [wavelengths[i] for i in chunk],
+                    [names[i] for i in chunk],
+                    *solver_args,
+                )
+                for chunk in chunks
+            ]
+            # the results are collected in submission order, not completion order
+            results = [
+                r for future in tqdm.tqdm(futures, ncols=70) for r in future.result()
+            ]
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    n_effs, fractions_te = [list(r) for r in zip(*results)]
+
+    # only used for its file names and writing and plotting methods
+    ms = _full(n_modes=n_modes, wg=wg, name=names[-1])
 
     suffix = "_".join([f"{int(wavelengths[i]*1e3)}" for i in [0, -1]])
     suffix += f"_{len(wavelengths)}"
@@ -68,6 +228,24 @@ def test_sweep(overwrite):
     assert r
 
 
+def test_sweep_solver_kwargs():
+    r = sweep_wavelength(
+        [1.55], plot=False, logscale=True, mirror_symmetry=True, angle=80
+    )
+    ms = mode_solver_full(angle=80)
+    assert np.allclose(r["n_effs"][0], np.real(ms.n_effs), rtol=1e-4)
+
+
+def test_sweep_parallel():
+    wavelengths = np.arange(1.30, 1.60, 0.1)
+    r = sweep_wavelength(wavelengths=wavelengths, overwrite=True, plot=False, n_jobs=2)
+    assert np.isclose(
+        r["n_effs"][0], np.array([2.7357584, 2.22395364]), atol=1e-3
+    ).all()
+    assert len(r["n_effs"]) == len(r["fractions_te"]) == len(wavelengths)
+    assert (np.diff([n[0] for n in r["n_effs"]]) < 0).all()
+
+
 if __name__ == "__main__":
     test_sweep(overwrite=False)
     plt.show()
@@ -1,5 +1,6 @@
 from typing import Callable
 from typing import List
+from typing import Optional
 from typing import Union
 
 import matplotlib.pylab as plt
@@ -29,6 +30,9 @@ def waveguide(
     n_clads: List[Union[Callable, float]] = [sio2],
     wavelength: float = 1.55,
     angle: float = 90.0,
+    subpixel: bool = False,
+    x_step_max: Optional[float] = None,
+    y_step_max: Optional[float] = None,
 ):
     """returns a waveguide structure
 
@@ -46,6 +50,13 @@ def waveguide(
         n_clads: list of cladding materials [sio2]
         wavelength: 1.55 wavelength (um)
         angle: 90 sidewall angle (degrees)
+        subpixel: average the permittivity anisotropically over the exact
+            material extents in each grid cell, for accurate n_effs on
+            coarser grids
+        x_step_max: None maximum x step of a graded mesh, fine (x_step) across
+            the waveguide and coarsening towards the edges of the simulation
+        y_step_max: None maximum y step of a graded mesh, fine (y_step) across
+            the film and coarsening into the substrate and cladding
 
     ::
 
@@ -86,14 +97,10 @@ def waveguide(
         ms.write_material_index(wg)
 
     """
-    n_wg = n_wg(wavelength) if callable(n_wg) else n_wg
-    n_sub = n_sub(wavelength) if callable(n_sub) else n_sub
-    n_clad = [n_clad(wavelength) if callable(n_clad) else n_clad for n_clad in n_clads]
-
     film_thickness = wg_height
     wg_height = film_thickness - slab_height
 
-    return RidgeWaveguide(
+    wg = RidgeWaveguide(
         wavelength=wavelength,
         x_step=x_step,
         y_step=y_step,
@@ -105,9 +112,13 @@ def waveguide(
         n_sub=n_sub,
         n_wg=n_wg,
         angle=angle,
-        n_clad=n_clad,
+        n_clad=n_clads,
         film_thickness=film_thickness,
     )
+    wg.subpixel = subpixel
+    if x_step_max or y_step_max:
+        wg.grade_mesh(x_step_max, y_step_max)
+    return wg
 
 
 @autoname
@@ -127,6 +138,9 @@ def waveguide_array(
     n_clads=[sio2],
     wavelength=1.55,
     angle=90.0,
+    subpixel=False,
+    x_step_max=None,
+    y_step_max=None,
 ):
     """returns a waveguide_array (also known as couple waveguides) ::
 
@@ -158,6 +172,9 @@ def waveguide_array(
         x_step  y_step: for discretizing the structure
         angle: (deg) sidewall angle in degrees
         wavelength: in case the refractive index is a function of the wavelength
+        subpixel: anisotropic subpixel averaging of the permittivity
+        x_step_max  y_step_max: maximum steps of a graded mesh, coarsening away
+            from the waveguides
 
     Where all units are in um
 
@@ -170,14 +187,10 @@ def waveguide_array(
         ms.write_material_index(wg_array)
 
     """
-    n_wg = n_wg(wavelength) if callable(n_wg) else n_wg
-    n_sub = n_sub(wavelength) if callable(n_sub) else n_sub
-    n_clad = [n_clad(wavelength) if callable(n_clad) else n_clad for n_clad in n_clads]
-
     film_thickness = wg_height
     wg_height = film_thickness - slab_height
 
-    return WgArray(
+    wg_array = WgArray(
         wg_widths=wg_widths,
         wg_gaps=wg_gaps,
         wavelength=wavelength,
@@ -190,13 +203,52 @@ def waveguide_array(
         n_sub=n_sub,
         n_wg=n_wg,
         angle=angle,
-        n_clad=n_clad,
+        n_clad=n_clads,
         film_thickness=film_thickness,
     )
+    wg_array.subpixel = subpixel
+    if x_step_max or y_step_max:
+        wg_array.grade_mesh(x_step_max, y_step_max)
+    return wg_array
+
+
+def waveguide_material_ids(
+    n_sub: Union[Callable, float] = sio2,
+    n_wg: Union[Callable, float] = si,
+    n_clads: List[Union[Callable, float]] = [sio2],
+    **geometry,
+):
+    """returns the material map of a waveguide and its materials
+
+    The waveguide is drawn once with material IDs in place of the refractive
+    indices, so its index profile at any wavelength is
+    `material_index(ids, materials, wavelength)` without redrawing it.
+
+    Args:
+        n_sub: sio2 substrate index material
+        n_wg: si waveguide index material
+        n_clads: list of cladding materials [sio2]
+        geometry: other `waveguide` arguments
+
+    Returns:
+        wg: waveguide holding the material IDs as its index profile
+        ids: material ID of each grid point
+        materials: list of materials (callables or indices) indexed by ID
+    """
+    materials = [n_sub, n_wg] + list(n_clads)
+    wg = waveguide(n_sub=0, n_wg=1, n_clads=list(range(2, len(materials))), **geometry)
+    ids = np.rint(wg.n.real).astype(np.uint8)
+    return wg, ids, materials
+
+
+def material_index(ids, materials, wavelength):
+    """returns the refractive index profile of a material map at a wavelength"""
+    n = [m(wavelength) if callable(m) else m for m in materials]
+    return np.array(n, dtype=complex)[ids]
 
 
 def get_waveguide_filepath(wg):
-    return CONFIG.cache / f"{wg.name}.dat"
+    return CONFIG.cache_dir() / f"{wg.name}.dat"
 
 
 def write_material_index(wg, filepath=None):
@@ -222,6 +274,45 @@ def test_waveguide_material_index():
     assert n_wg == si(wg._wl)
 
 
+def test_waveguide_material_ids():
+    kwargs = dict(wg_width=0.6, angle=80, slab_height=0.09)
+    wg, ids, materials = waveguide_material_ids(**kwargs)
+    n = material_index(ids, materials, 1.3)
+    assert np.array_equal(n, waveguide(wavelength=1.3, **kwargs).n)
+
+
+def test_waveguide_eps_c():
+    wg = waveguide(angle=80)
+    assert np.allclose(wg.eps_c, wg.eps_func(wg.xc, wg.yc))
+
+
+def test_waveguide_eps_c_subpixel():
+    wg = waveguide(wg_width=0.45, subpixel=True)
+    epsxx, epsxy, epsyx, epsyy, epszz = wg.eps_c
+    eps_wg = si(wg._wl) ** 2
+    eps_clad = sio2(wg._wl) ** 2
+
+    # the core rows hold exactly `wg_width` of silicon, not a whole number of cells
+    core = np.isclose(epszz.max(axis=1), eps_wg)
+    width = np.sum(epszz[core] - eps_clad, axis=1) * wg.x_step / (eps_wg - eps_clad)
+    assert np.allclose(width, 0.45)
+    assert np.all(epsxx.real <= epszz.real + 1e-12)
+    assert np.all(epsyy.real <= epszz.real + 1e-12)
+    assert not np.any(epsxy) and not np.any(epsyx)
+
+
+def test_waveguide_graded_mesh():
+    wg = waveguide(sub_width=4.0)
+    wg_graded = waveguide(sub_width=4.0, x_step_max=0.1, y_step_max=0.1)
+    x, y = wg_graded.x, wg_graded.y
+    assert np.all(np.diff(x) < 0.1 + 1e-9) and np.all(np.diff(y) < 0.1 + 1e-9)
+    assert np.isclose(np.diff(x).min(), 0.02) and x.size < wg.x.size / 2
+
+    ix = np.searchsorted(wg.x, x - 1e-9)
+    iy = np.searchsorted(wg.y, y - 1e-9)
+    assert np.array_equal(wg_graded.n, wg.n[np.ix_(iy, ix)])
+
+
 def test_waveguide_array_material_index():
     wg = waveguide_array(wg_gaps=[0.2], wg_widths=[0.5] * 2)
     n = wg.n
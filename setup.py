@@ -11,7 +11,6 @@ setup(
     install_requires=[
         "matplotlib",
         "numpy",
-        "opticalmaterialspy",
         "pytest",
         "scipy",
         "tqdm",